@@ -0,0 +1,491 @@
+"""Sequence alignment engines used by the differ.
+
+Every engine takes two sequences of comparable items and returns the list of
+matched index pairs (i, j), in increasing order, that make up a common
+subsequence of the two inputs. All engines but histogram_matches return a
+longest one.
+"""
+
+from bisect import bisect_left
+from itertools import accumulate
+from operator import add
+
+# Items occurring more often than this in a region are never used as split
+# points by the histogram diff, as in git.
+_MAX_HISTOGRAM_CHAIN = 64
+
+# Regions with fewer items than this (on both sides together) are handed to
+# the engine directly. Anchors only pay off for large regions, and skipping
+# them keeps small edits strictly minimal.
+_MIN_ANCHORED_REGION = 256
+
+def intern_sequences(seq1, seq2, key=None):
+    """Maps every distinct item of both sequences to a small integer ID.
+
+    Equal items get the same ID, so the engines only need to compare integers
+    instead of (potentially long) strings or rows. The optional key turns an
+    item into something hashable, e.g. tuple for rows given as lists.
+    """
+    ids = {}
+    interned = []
+    for seq in (seq1, seq2):
+        seq_ids = []
+        for item in seq:
+            if key is not None:
+                item = key(item)
+            seq_ids.append(ids.setdefault(item, len(ids)))
+        interned.append(seq_ids)
+    return interned[0], interned[1]
+
+def _common_prefix_length(seq1, lo1, hi1, seq2, lo2, hi2):
+    """Returns the number of equal items at the start of both ranges."""
+    count = 0
+    while lo1 + count < hi1 and lo2 + count < hi2 and seq1[lo1 + count] == seq2[lo2 + count]:
+        count += 1
+    return count
+
+def _common_suffix_length(seq1, lo1, hi1, seq2, lo2, hi2):
+    """Returns the number of equal items at the end of both ranges."""
+    count = 0
+    while hi1 - count > lo1 and hi2 - count > lo2 and seq1[hi1 - count - 1] == seq2[hi2 - count - 1]:
+        count += 1
+    return count
+
+def _find_middle_snake(seq1, lo1, hi1, seq2, lo2, hi2, d_limit=None):
+    """Finds a split point on an optimal edit path through the given ranges.
+
+    This runs the forward and the backward Myers search at the same time until
+    they overlap. The point where they meet lies on a shortest edit script, so
+    the two halves can be solved independently. Only O(n + m) memory is used.
+
+    Returns the split point as absolute indices (i, j), or None if the ranges
+    have nothing in common. If d_limit is given, both searches stop after that
+    many steps, returning None as well.
+    """
+    n = hi1 - lo1
+    m = hi2 - lo2
+    max_d = (n + m + 1) // 2
+    if d_limit is not None:
+        max_d = min(max_d, d_limit)
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    # v_forward[k] is the furthest x reached on diagonal k = x - y going
+    # forward, v_backward[k] the same for the reversed inputs.
+    v_forward = [-1] * v_length
+    v_forward[v_offset + 1] = 0
+    v_backward = [-1] * v_length
+    v_backward[v_offset + 1] = 0
+    delta = n - m
+    # If the total number of characters is odd, then the front path will
+    # collide with the reverse path.
+    front = delta % 2 != 0
+    # Offsets for start and end of k loop, to skip diagonals that already
+    # left the edit graph.
+    k1_start = k1_end = k2_start = k2_end = 0
+
+    for d in range(max_d):
+        # Walk the front path one step.
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v_forward[k1_offset - 1] < v_forward[k1_offset + 1]):
+                x1 = v_forward[k1_offset + 1]
+            else:
+                x1 = v_forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and seq1[lo1 + x1] == seq2[lo2 + y1]:
+                x1 += 1
+                y1 += 1
+            v_forward[k1_offset] = x1
+            if x1 > n:
+                # Ran off the right of the graph.
+                k1_end += 2
+            elif y1 > m:
+                # Ran off the bottom of the graph.
+                k1_start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v_backward[k2_offset] != -1:
+                    # Mirror x2 onto top-left coordinate system.
+                    if x1 >= n - v_backward[k2_offset]:
+                        return lo1 + x1, lo2 + y1
+
+        # Walk the reverse path one step.
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v_backward[k2_offset - 1] < v_backward[k2_offset + 1]):
+                x2 = v_backward[k2_offset + 1]
+            else:
+                x2 = v_backward[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and seq1[hi1 - x2 - 1] == seq2[hi2 - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v_backward[k2_offset] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v_forward[k1_offset] != -1:
+                    x1 = v_forward[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return lo1 + x1, lo2 + y1
+
+    # The number of diffs equals the number of items, no commonality at all.
+    return None
+
+def myers_matches(seq1, seq2, max_edits=None):
+    """Computes a longest common subsequence with Myers' O((N+M)D) algorithm.
+
+    This uses the linear space refinement: instead of storing the whole edit
+    graph, the middle snake of each range is found and both halves are solved
+    on their own. The ranges are kept on an explicit stack so that very long
+    inputs don't run into Python's recursion limit.
+
+    If max_edits is given, returns None as soon as it is clear that more than
+    that many items have to be removed or added. The search of every range
+    then gives up after max_edits / 2 steps in each direction, so this takes
+    O((N+M) * max_edits) time at most.
+    """
+    d_limit = None if max_edits is None else (max_edits + 1) // 2 + 1
+    matches = []
+    stack = [(0, len(seq1), 0, len(seq2))]
+
+    while stack:
+        lo1, hi1, lo2, hi2 = stack.pop()
+
+        # Identical items at both ends are always part of an optimal alignment.
+        prefix = _common_prefix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(prefix):
+            matches.append((lo1 + offset, lo2 + offset))
+        lo1 += prefix
+        lo2 += prefix
+
+        suffix = _common_suffix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(1, suffix + 1):
+            matches.append((hi1 - offset, hi2 - offset))
+        hi1 -= suffix
+        hi2 -= suffix
+
+        # Nothing left to align if either side is exhausted.
+        if lo1 == hi1 or lo2 == hi2:
+            continue
+
+        split = _find_middle_snake(seq1, lo1, hi1, seq2, lo2, hi2, d_limit)
+        if split is None:
+            if d_limit is not None and d_limit < (hi1 - lo1 + hi2 - lo2 + 1) // 2:
+                # The search gave up, the range alone needs more edits
+                return None
+            continue
+
+        split1, split2 = split
+        stack.append((split1, hi1, split2, hi2))
+        stack.append((lo1, split1, lo2, split2))
+
+    if max_edits is not None and len(seq1) + len(seq2) - 2 * len(matches) > max_edits:
+        return None
+    matches.sort()
+    return matches
+
+def _lcs_lengths(items, masks, width):
+    """Returns the LCS lengths of the items with every prefix of the other range.
+
+    masks maps every item of the other range to a bit mask of its positions in
+    it, width is the length of that range. This is the bit-parallel algorithm
+    of Allison-Dix and Hyyrö: a row of the LCS table is kept as the bits of a
+    single integer, so that each item updates the whole row with a handful of
+    big integer operations instead of one max per cell. Entry j of the result
+    is the LCS length with the first j items of the other range.
+    """
+    full = (1 << width) - 1
+    row = full
+    for item in items:
+        match = masks.get(item)
+        if match:
+            matched = row & match
+            row = ((row + matched) | (row - matched)) & full
+    # Every zero bit of the row marks a position where the LCS length grows
+    grows = format(~row & full, f"0{width}b")[::-1]
+    return [0, *accumulate(map(int, grows))]
+
+def bit_parallel_matches(seq1, seq2):
+    """Computes a longest common subsequence with the bit-parallel LCS algorithm.
+
+    Runs in O(N * M / w) big integer word operations regardless of how much
+    the inputs differ, so it beats the quadratic table by far and beats Myers
+    on very different inputs. The alignment is recovered in linear space as
+    in Hirschberg's algorithm: the LCS lengths of the first half of a range
+    are computed forwards and those of the second half backwards, the best
+    split of the other range is where their sum is largest, and both halves
+    are solved on their own.
+    """
+    matches = []
+    stack = [(0, len(seq1), 0, len(seq2))]
+
+    while stack:
+        lo1, hi1, lo2, hi2 = stack.pop()
+
+        prefix = _common_prefix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(prefix):
+            matches.append((lo1 + offset, lo2 + offset))
+        lo1 += prefix
+        lo2 += prefix
+
+        suffix = _common_suffix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(1, suffix + 1):
+            matches.append((hi1 - offset, hi2 - offset))
+        hi1 -= suffix
+        hi2 -= suffix
+
+        if lo1 == hi1 or lo2 == hi2:
+            continue
+
+        if hi1 - lo1 == 1:
+            item = seq1[lo1]
+            for j in range(lo2, hi2):
+                if seq2[j] == item:
+                    matches.append((lo1, j))
+                    break
+            continue
+
+        # Position masks of the items of the second range that occur in the
+        # first one, counted from its start and from its end
+        items1 = set(seq1[lo1:hi1])
+        width = hi2 - lo2
+        forward_masks = {}
+        backward_masks = {}
+        for j in range(lo2, hi2):
+            item = seq2[j]
+            if item in items1:
+                forward_masks[item] = forward_masks.get(item, 0) | (1 << (j - lo2))
+                backward_masks[item] = backward_masks.get(item, 0) | (1 << (hi2 - 1 - j))
+        if not forward_masks:
+            # Nothing in common
+            continue
+
+        mid = (lo1 + hi1) // 2
+        forward = _lcs_lengths(seq1[lo1:mid], forward_masks, width)
+        backward = _lcs_lengths(reversed(seq1[mid:hi1]), backward_masks, width)
+        totals = list(map(add, forward, reversed(backward)))
+        split2 = lo2 + totals.index(max(totals))
+        stack.append((mid, hi1, split2, hi2))
+        stack.append((lo1, mid, lo2, split2))
+
+    matches.sort()
+    return matches
+
+def _lowest_occurrence_region(seq1, lo1, hi1, seq2, lo2, hi2, positions):
+    """Finds the common region of the ranges whose rarest item occurs least often.
+
+    positions maps every item of the first range to its indices there. Every
+    item of the second range that also occurs in the first one, at most
+    _MAX_HISTOGRAM_CHAIN times, is extended to the longest run of equal items
+    around each of its occurrences. Of those regions, the one with the
+    smallest occurrence count of its rarest item wins, the longer one on ties.
+
+    Returns (start1, end1, start2, end2), or None if there is no such region.
+    """
+    best = None
+    # Items occurring more often than the best count so far (at first, the
+    # cap) are skipped
+    best_count = _MAX_HISTOGRAM_CHAIN
+    best_length = 0
+    j = lo2
+    while j < hi2:
+        occurrences = positions.get(seq2[j])
+        if occurrences is None or len(occurrences) > best_count:
+            j += 1
+            continue
+        next_j = j + 1
+        for i in occurrences:
+            count = len(occurrences)
+            start1, start2 = i, j
+            while start1 > lo1 and start2 > lo2 and seq1[start1 - 1] == seq2[start2 - 1]:
+                start1 -= 1
+                start2 -= 1
+                count = min(count, len(positions[seq1[start1]]))
+            end1, end2 = i + 1, j + 1
+            while end1 < hi1 and end2 < hi2 and seq1[end1] == seq2[end2]:
+                count = min(count, len(positions[seq1[end1]]))
+                end1 += 1
+                end2 += 1
+            if best is None or count < best_count or (count == best_count and end1 - start1 > best_length):
+                best = (start1, end1, start2, end2)
+                best_count = count
+                best_length = end1 - start1
+            # Items inside the region would only find the same region again
+            next_j = max(next_j, end2)
+        j = next_j
+    return best
+
+def histogram_matches(seq1, seq2):
+    """Computes a common subsequence with the histogram diff of git.
+
+    Each range is split at the common region whose rarest item occurs least
+    often in the first range, and both sides of it are solved on their own.
+    Blank lines, repeated totals and other frequent items are thus only
+    matched within the regions left between rare ones, which gives stable
+    alignments on repetitive inputs. Regions whose common items all occur
+    more than _MAX_HISTOGRAM_CHAIN times are aligned with Myers' algorithm.
+    The result is not necessarily a longest common subsequence.
+    """
+    matches = []
+    stack = [(0, len(seq1), 0, len(seq2))]
+
+    while stack:
+        lo1, hi1, lo2, hi2 = stack.pop()
+
+        prefix = _common_prefix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(prefix):
+            matches.append((lo1 + offset, lo2 + offset))
+        lo1 += prefix
+        lo2 += prefix
+
+        suffix = _common_suffix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(1, suffix + 1):
+            matches.append((hi1 - offset, hi2 - offset))
+        hi1 -= suffix
+        hi2 -= suffix
+
+        if lo1 == hi1 or lo2 == hi2:
+            continue
+
+        positions = {}
+        for i in range(lo1, hi1):
+            positions.setdefault(seq1[i], []).append(i)
+        if positions.keys().isdisjoint(seq2[lo2:hi2]):
+            continue
+
+        region = _lowest_occurrence_region(seq1, lo1, hi1, seq2, lo2, hi2, positions)
+        if region is None:
+            for i, j in myers_matches(seq1[lo1:hi1], seq2[lo2:hi2]):
+                matches.append((lo1 + i, lo2 + j))
+            continue
+
+        start1, end1, start2, end2 = region
+        for offset in range(end1 - start1):
+            matches.append((start1 + offset, start2 + offset))
+        stack.append((end1, hi1, end2, hi2))
+        stack.append((lo1, start1, lo2, start2))
+
+    matches.sort()
+    return matches
+
+def _unique_anchors(seq1, lo1, hi1, seq2, lo2, hi2):
+    """Finds the anchors of patience diff within the given ranges.
+
+    Candidates are the items that occur exactly once in both ranges. Of those,
+    the longest run that appears in the same order on both sides (a longest
+    increasing subsequence of their positions) is used as anchors.
+    """
+    # Maps each item to [count in seq1, count in seq2, index in seq1, index in seq2]
+    occurrences = {}
+    for i in range(lo1, hi1):
+        entry = occurrences.setdefault(seq1[i], [0, 0, i, -1])
+        entry[0] += 1
+    for j in range(lo2, hi2):
+        entry = occurrences.get(seq2[j])
+        if entry is not None:
+            entry[1] += 1
+            entry[3] = j
+
+    candidates = sorted((i, j) for count1, count2, i, j in occurrences.values()
+                        if count1 == 1 and count2 == 1)
+    if not candidates:
+        return []
+
+    # Patience sorting: piles[k] holds the candidate ending the best increasing
+    # run of length k + 1, predecessors link each candidate to the one before.
+    pile_tops = []
+    piles = []
+    predecessors = [None] * len(candidates)
+    for index, (_, j) in enumerate(candidates):
+        pile = bisect_left(pile_tops, j)
+        if pile > 0:
+            predecessors[index] = piles[pile - 1]
+        if pile == len(pile_tops):
+            pile_tops.append(j)
+            piles.append(index)
+        else:
+            pile_tops[pile] = j
+            piles[pile] = index
+
+    anchors = []
+    index = piles[-1]
+    while index is not None:
+        anchors.append(candidates[index])
+        index = predecessors[index]
+    anchors.reverse()
+    return anchors
+
+def anchored_matches(seq1, seq2, engine):
+    """Aligns the two sequences, only running the engine on divergent regions.
+
+    First the common prefix and suffix are stripped. The remainder is then split
+    at lines that appear exactly once in both inputs (patience diff anchors),
+    and the same is repeated on the regions in between. Only small regions and
+    regions without any anchors are handed to the given engine.
+    """
+    matches = []
+    stack = [(0, len(seq1), 0, len(seq2))]
+
+    while stack:
+        lo1, hi1, lo2, hi2 = stack.pop()
+
+        prefix = _common_prefix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(prefix):
+            matches.append((lo1 + offset, lo2 + offset))
+        lo1 += prefix
+        lo2 += prefix
+
+        suffix = _common_suffix_length(seq1, lo1, hi1, seq2, lo2, hi2)
+        for offset in range(1, suffix + 1):
+            matches.append((hi1 - offset, hi2 - offset))
+        hi1 -= suffix
+        hi2 -= suffix
+
+        if lo1 == hi1 or lo2 == hi2:
+            continue
+
+        anchors = []
+        if (hi1 - lo1) + (hi2 - lo2) >= _MIN_ANCHORED_REGION:
+            anchors = _unique_anchors(seq1, lo1, hi1, seq2, lo2, hi2)
+        if not anchors:
+            for i, j in engine(seq1[lo1:hi1], seq2[lo2:hi2]):
+                matches.append((lo1 + i, lo2 + j))
+            continue
+
+        # Solve the regions between consecutive anchors on their own
+        matches.extend(anchors)
+        start1, start2 = lo1, lo2
+        for anchor1, anchor2 in anchors + [(hi1, hi2)]:
+            if start1 < anchor1 or start2 < anchor2:
+                stack.append((start1, anchor1, start2, anchor2))
+            start1, start2 = anchor1 + 1, anchor2 + 1
+
+    matches.sort()
+    return matches
+
+def split_points(seq1, seq2, count):
+    """Picks up to count unique lines at which both sequences can be cut.
+
+    The returned (i, j) pairs are patience anchors, so the regions between
+    them can be aligned independently of each other. They are chosen to split
+    the first sequence into roughly equally sized parts.
+    """
+    anchors = _unique_anchors(seq1, 0, len(seq1), seq2, 0, len(seq2))
+    if count <= 0 or not anchors:
+        return []
+
+    points = []
+    part_size = len(seq1) / (count + 1)
+    next_cut = part_size
+    for i, j in anchors:
+        if i >= next_cut:
+            points.append((i, j))
+            if len(points) == count:
+                break
+            next_cut = i + part_size
+    return points
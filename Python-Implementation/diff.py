@@ -6,9 +6,27 @@ Example usage:
 There are also some optional flags below.
 """
 
+import csv
+import json
+import os
+import sys
 from argparse import ArgumentParser
-from differ import diff
-from visualization import visualize_unified, visualize_unified_html, visualize_unified_spreadsheet_html
+from diff_cache import DiffCache, default_cache_dir
+from differ import _resolve_key_columns, diff
+from external_diff import diff_csv_external
+from fingerprint import count_lines, files_identical
+from incremental import diff_incremental
+from parallel_diff import diff_parallel
+from serialization import write_binary, write_jsonl
+from stats import DiffStats, compute_stats
+from visualization import (visualize_identical_html, visualize_unified, visualize_unified_html,
+                           visualize_unified_spreadsheet_html, visualize_unified_stream, visualize_virtual_html,
+                           visualize_paginated_html)
+
+_DEFAULT_OUTPUT_FILE = "diff_output.html"
+
+_IDENTICAL_FILES_MESSAGE = "The files are identical."
+_APPROXIMATE_DIFF_MESSAGE = "The files differ in more than {} lines, showing an approximate diff."
 
 def _setup_arg_parser():
     """Sets up the command line argument parser."""
@@ -34,12 +52,114 @@ def _setup_arg_parser():
                         action='store_true',
                         help="If set, outputs diff results to console instead of HTML.")
     parser.add_argument("--output_file",
-                        default="diff_output.html",
-                        help="The name of the output HTML file (if using HTML output).")
+                        default=None,
+                        help="The name of the output file. Defaults to diff_output.html for HTML output "
+                             "and to stdout for --format.")
+    parser.add_argument("--format",
+                        default=None,
+                        choices=["jsonl", "binary"],
+                        help="If set, writes the diff elements in a machine-readable format instead of "
+                             "rendering them: JSON Lines or a compact binary record stream.")
     parser.add_argument("--simple_html",
                         default=False,
                         action='store_true',
                         help="If set, generates a simpler HTML view without spreadsheet formatting.")
+    parser.add_argument("--virtual_html",
+                        default=False,
+                        action='store_true',
+                        help="If set, generates a spreadsheet view that only renders the rows in view, "
+                             "for diffs too large for the regular HTML views.")
+    parser.add_argument("--data_sidecar",
+                        default=False,
+                        action='store_true',
+                        help="If set with --virtual_html, writes the diff data to a script next to "
+                             "the HTML file instead of embedding it.")
+    parser.add_argument("--page_size",
+                        default=None,
+                        type=int,
+                        help="If set, splits the spreadsheet HTML view into pages of this many rows, "
+                             "plus an index page with the totals of every page.")
+    parser.add_argument("--stats",
+                        nargs="?",
+                        const="text",
+                        default=None,
+                        choices=["text", "json"],
+                        help="If set, only prints the number of added, removed, modified and moved rows "
+                             "and the most changed columns, as text or JSON, without rendering the diff.")
+    parser.add_argument("--fail_if_changed_rows",
+                        default=None,
+                        type=int,
+                        help="If set, implies --stats. Stops as soon as more than this many rows were "
+                             "added, removed or modified, and exits with status 1 in that case.")
+    parser.add_argument("--algorithm",
+                        default="myers",
+                        choices=["myers", "lcs", "histogram"],
+                        help="The alignment algorithm. 'myers' runs in linear space, 'lcs' computes "
+                             "the rows of the full LCS table bit-parallel, which is faster on very "
+                             "different inputs. 'histogram' splits at the rarest common lines like "
+                             "git, which isn't always minimal but aligns repetitive files better.")
+    parser.add_argument("--no_anchors",
+                        default=False,
+                        action='store_true',
+                        help="If set, don't split the inputs at unique lines before aligning. "
+                             "Slower, but always gives a minimal diff.")
+    parser.add_argument("--max_edits",
+                        default=None,
+                        type=int,
+                        help="If set, only computes a minimal diff if at most this many lines were added "
+                             "or removed, in time linear in the file size times this. Otherwise shows a "
+                             "quick approximate diff and exits with status 1.")
+    parser.add_argument("--key",
+                        nargs="+",
+                        default=None,
+                        help="One or more CSV key columns, by header name or zero-based index. "
+                             "If set, rows are matched on this key instead of their order.")
+    parser.add_argument("--jobs",
+                        default=1,
+                        type=int,
+                        help="Number of processes to diff large inputs with, in independent partitions.")
+    parser.add_argument("--render_jobs",
+                        default=1,
+                        type=int,
+                        help="Number of processes to render --page_size pages with.")
+    parser.add_argument("--external",
+                        default=False,
+                        action='store_true',
+                        help="If set, diffs CSV files larger than memory with an external sort-merge "
+                             "join on --key. Results are streamed out in key order.")
+    parser.add_argument("--memory_limit",
+                        default=64,
+                        type=int,
+                        help="Megabytes of memory taken by the rows sorted at once in --external mode.")
+    parser.add_argument("--context",
+                        default=None,
+                        type=int,
+                        help="If set, the HTML output only shows changed rows and this many unchanged "
+                             "rows around them. Longer runs of unchanged rows are collapsed.")
+    parser.add_argument("--expandable",
+                        default=False,
+                        action='store_true',
+                        help="If set with --context, the collapsed rows are written to a sidecar "
+                             "directory so they can be expanded in the browser.")
+    parser.add_argument("--incremental",
+                        default=None,
+                        metavar="STATE_FILE",
+                        help="If set, reuses the diff of the previous run stored in this file and only "
+                             "diffs the regions of the inputs edited since, then stores the new diff there.")
+    parser.add_argument("--no_cache",
+                        default=False,
+                        action='store_true',
+                        help="If set, always recomputes the diff instead of reusing a cached result "
+                             "for the same file contents and options.")
+    parser.add_argument("--cache_dir",
+                        default=None,
+                        help="The directory of the diff result cache. Defaults to diff-tool under "
+                             "$XDG_CACHE_HOME or ~/.cache.")
+    parser.add_argument("--cache_size",
+                        default=256,
+                        type=int,
+                        help="Megabytes the diff result cache may use before the least recently used "
+                             "results are evicted.")
 
     return parser
 
@@ -48,28 +168,222 @@ def _read_lines_from_file(path):
     with open(path, 'r') as f:
         return [line for line in f.read().splitlines()]
 
-def main():
-    args = _setup_arg_parser().parse_args()
+def _discard_stdout():
+    """Points stdout to devnull after its reader went away, e.g. head or a pager that was quit.
+
+    Flushing stdout later, e.g. at exit, then doesn't fail again.
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+
+def _read_header(path):
+    """Returns the fields of the first line of the given CSV file."""
+    with open(path, 'r', newline='') as f:
+        return next(csv.reader(f), [])
+
+def _print_stats(stats, args):
+    """Prints the stats as selected by --stats, exits with status 1 if they exceed --fail_if_changed_rows.
+
+    The exit status only depends on the threshold, also if the reader of
+    stdout went away, e.g. with --stats ... | head -1.
+    """
+    try:
+        if args.stats == "json":
+            print(json.dumps(stats.to_dict(), indent=2))
+        else:
+            print(stats.format())
+        sys.stdout.flush()
+    except BrokenPipeError:
+        _discard_stdout()
+    if args.fail_if_changed_rows is not None and stats.changed_rows > args.fail_if_changed_rows:
+        sys.exit(1)
+
+def _max_edits(args):
+    """Returns the max_edits to diff with, given by --max_edits or the --fail_if_changed_rows threshold.
+
+    Every added or removed row is one edited line, every modified row two.
+    So if the files differ in more than twice the threshold lines, the
+    alignment can stop early, the stats then come from the quick
+    approximate diff.
+    """
+    if args.max_edits is not None:
+        return args.max_edits
+    if (args.fail_if_changed_rows is None or args.key or args.jobs > 1 or args.incremental is not None
+            or args.algorithm != "myers" or args.no_anchors):
+        return None
+    return 2 * max(args.fail_if_changed_rows, 0)
+
+def _compute_diff(args, max_edits=None):
+    """Diffs the files in memory, reusing the cached result unless --no_cache is set.
+
+    --incremental diffs bypass the cache, since a cached result would skip
+    updating the state file for the next run.
+    """
+    cache = None
+    if not args.no_cache and args.incremental is None:
+        cache = DiffCache(args.cache_dir or default_cache_dir(), args.cache_size * 1024 * 1024)
+        cache_key = cache.key(args.file1, args.file2, {
+            "algorithm": args.algorithm,
+            "anchored": not args.no_anchors,
+            "key": args.key,
+            "jobs": args.jobs,
+            "max_edits": max_edits,
+        })
+        diff_result = cache.get(cache_key)
+        if diff_result is not None:
+            return diff_result
 
     lines1 = _read_lines_from_file(args.file1)
     lines2 = _read_lines_from_file(args.file2)
 
-    diff_result = diff(lines1, lines2)
+    if args.incremental is not None:
+        diff_result = diff_incremental(lines1, lines2, args.incremental, args.algorithm, not args.no_anchors)
+    elif args.jobs > 1:
+        diff_result = diff_parallel(lines1, lines2, args.jobs, args.algorithm, not args.no_anchors, args.key)
+    else:
+        diff_result = diff(lines1, lines2, args.algorithm, not args.no_anchors, args.key, max_edits)
+
+    if cache is not None:
+        cache.put(cache_key, diff_result)
+    return diff_result
+
+def _write_serialized(diff_result, output_format, output_file):
+    """Writes the diff in a machine-readable format to output_file, or to stdout if it is None."""
+    if output_format == "jsonl":
+        if output_file is None:
+            write_jsonl(diff_result, sys.stdout)
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                write_jsonl(diff_result, f)
+    else:
+        if output_file is None:
+            write_binary(diff_result, sys.stdout.buffer)
+        else:
+            with open(output_file, 'wb') as f:
+                write_binary(diff_result, f)
+
+def _write_output(diff_result, args, show_line_numbers):
+    """Renders or serializes the diff as selected by the arguments."""
+    if args.format is not None:
+        _write_serialized(diff_result, args.format, args.output_file)
+        return
+
+    output_file = args.output_file or _DEFAULT_OUTPUT_FILE
+    if args.console_output:
+        # Console unified view, streamed if the diff is computed on the fly
+        if args.external:
+            visualize_unified_stream(diff_result, show_line_numbers)
+        else:
+            visualize_unified(diff_result, show_line_numbers)
+    # Default to HTML output
+    elif args.virtual_html:
+        # Virtual-scroll view for very large diffs
+        visualize_virtual_html(diff_result, show_line_numbers, output_file, args.data_sidecar)
+    elif args.page_size is not None:
+        # Spreadsheet view split into pages
+        visualize_paginated_html(diff_result, show_line_numbers, output_file, args.page_size,
+                                 args.render_jobs, args.context, args.expandable)
+    elif args.simple_html:
+        # Unified HTML view (non-spreadsheet)
+        visualize_unified_html(diff_result, show_line_numbers, output_file,
+                               args.context, args.expandable)
+    else:
+        # Default to spreadsheet-like HTML view
+        visualize_unified_spreadsheet_html(diff_result, show_line_numbers, output_file,
+                                           args.context, args.expandable)
+
+def main():
+    parser = _setup_arg_parser()
+    args = parser.parse_args()
 
     # Override show_line_numbers if hide_line_numbers is specified
     show_line_numbers = args.show_line_numbers and not args.hide_line_numbers
 
-    if args.console_output:
-        # Console unified view
-        visualize_unified(diff_result, show_line_numbers)
+    if args.context is not None and args.context < 0:
+        parser.error("--context must not be negative")
+    if args.expandable and args.context is None:
+        parser.error("--expandable requires --context")
+    if args.data_sidecar and not args.virtual_html:
+        parser.error("--data_sidecar requires --virtual_html")
+    if args.page_size is not None:
+        if args.page_size <= 0:
+            parser.error("--page_size must be positive")
+        if args.console_output or args.simple_html or args.virtual_html:
+            parser.error("--page_size only applies to the spreadsheet HTML view")
+    if args.render_jobs != 1:
+        if args.render_jobs <= 0:
+            parser.error("--render_jobs must be positive")
+        if args.page_size is None:
+            parser.error("--render_jobs requires --page_size")
+
+    if args.incremental is not None and (args.key or args.external):
+        parser.error("--incremental doesn't support --key or --external")
+    if args.max_edits is not None:
+        if args.max_edits < 0:
+            parser.error("--max_edits must not be negative")
+        if args.key or args.jobs > 1 or args.incremental is not None:
+            parser.error("--max_edits doesn't support --key, --jobs or --incremental")
+        if args.algorithm != "myers" or args.no_anchors:
+            parser.error("--max_edits always aligns with the anchored Myers algorithm, it doesn't "
+                         "support --algorithm or --no_anchors")
+    if args.external:
+        if not args.key:
+            parser.error("--external requires --key")
+        if args.virtual_html and not args.console_output and args.format is None:
+            # The virtual view builds its columnar payload in memory
+            parser.error("--external doesn't support --virtual_html")
+    if args.key:
+        # Report unknown key columns up front, the diff would only fail halfway
+        for path in (args.file1, args.file2):
+            try:
+                _resolve_key_columns(_read_header(path), args.key)
+            except ValueError as e:
+                parser.error(f"{e} ({path})")
+
+    # Byte-identical files need no diffing at all
+    identical = files_identical(args.file1, args.file2)
+    if identical and args.incremental is not None:
+        # Keep the stored state in step with the inputs for the next run
+        lines = _read_lines_from_file(args.file1)
+        diff_incremental(lines, lines, args.incremental, args.algorithm, not args.no_anchors)
+    if identical:
+        if args.stats is not None or args.fail_if_changed_rows is not None:
+            _print_stats(DiffStats(unchanged_rows=count_lines(args.file1)), args)
+            return
+        if args.format is None:
+            print(_IDENTICAL_FILES_MESSAGE)
+            if not args.console_output:
+                # A small report replaces the one of an earlier run
+                visualize_identical_html(count_lines(args.file1), args.output_file or _DEFAULT_OUTPUT_FILE)
+            return
+
+    if identical and not args.external:
+        # Serialized output still lists every line as unchanged
+        lines = _read_lines_from_file(args.file1)
+        diff_result = diff(lines, lines)
+    elif args.external:
+        # Stream the results, without ever holding the files in memory
+        diff_result = diff_csv_external(args.file1, args.file2, args.key,
+                                        memory_limit=args.memory_limit * 1024 * 1024)
     else:
-        # Default to HTML output
-        if args.simple_html:
-            # Unified HTML view (non-spreadsheet)
-            visualize_unified_html(diff_result, show_line_numbers, args.output_file)
-        else:
-            # Default to spreadsheet-like HTML view
-            visualize_unified_spreadsheet_html(diff_result, show_line_numbers, args.output_file)
+        diff_result = _compute_diff(args, _max_edits(args))
+
+    # Only an explicit --max_edits warns about and fails on approximate diffs
+    approximate = args.max_edits is not None and getattr(diff_result, 'approximate', False)
+    if approximate:
+        print(_APPROXIMATE_DIFF_MESSAGE.format(args.max_edits), file=sys.stderr)
+
+    if args.stats is not None or args.fail_if_changed_rows is not None:
+        _print_stats(compute_stats(diff_result, args.fail_if_changed_rows), args)
+    else:
+        try:
+            _write_output(diff_result, args, show_line_numbers)
+        except BrokenPipeError:
+            _discard_stdout()
+            sys.exit(1)
+
+    if approximate:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,130 @@
+"""An on-disk cache of diff results, keyed by the content of the inputs.
+
+Every entry is the diff of one pair of files with one set of options, stored
+in the binary format of serialization.py after a flags byte, under a hash of
+the content digests of both files and the options. Entries are evicted least recently used first
+once the cache grows beyond its size limit. The modification time of an entry
+is bumped whenever it is read, so it doubles as its last access time.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from fingerprint import file_digest
+from serialization import read_binary, write_binary
+
+# Bumped whenever the diff results for the same inputs and options change,
+# so that stale entries are never read.
+_CACHE_VERSION = 9
+
+_ENTRY_SUFFIX = ".diff"
+
+# Flags of an entry, stored in its first byte.
+_FLAG_APPROXIMATE = 0x01
+
+class CachedDiff(list):
+    """The diff elements of a cache entry."""
+
+    def __init__(self, elements, approximate=False):
+        super().__init__(elements)
+        # Set like DiffResult.approximate, if the cached diff was only approximate
+        self.approximate = approximate
+
+def default_cache_dir():
+    """Returns the cache directory used if none is given, under $XDG_CACHE_HOME or ~/.cache."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "diff-tool")
+
+class DiffCache:
+    """A size-bounded cache of diff results in a directory."""
+
+    def __init__(self, cache_dir, max_size):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+
+    def key(self, path1, path2, options):
+        """Returns the cache key for diffing the two files with the given options.
+
+        The options must be JSON serializable, e.g. a dict of the arguments
+        the diff is computed with.
+        """
+        key = hashlib.blake2b(digest_size=20)
+        key.update(json.dumps([_CACHE_VERSION, file_digest(path1), file_digest(path2), options],
+                              sort_keys=True).encode('utf-8'))
+        return key.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self._cache_dir, key + _ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Returns the cached diff elements for the key as a CachedDiff, or None if there is no entry."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                flags = f.read(1)
+                if not flags:
+                    raise ValueError("Empty cache entry")
+                result = CachedDiff(read_binary(f), approximate=bool(flags[0] & _FLAG_APPROXIMATE))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # A damaged entry, e.g. of a process that was killed while writing
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, diff):
+        """Stores the diff elements under the key, then evicts entries beyond the size limit.
+
+        Entries larger than the whole size limit aren't stored at all, they
+        would only evict every other entry before being evicted themselves.
+        """
+        os.makedirs(self._cache_dir, exist_ok=True)
+        # Write to a temporary file first, so that readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(bytes([_FLAG_APPROXIMATE if getattr(diff, 'approximate', False) else 0]))
+                write_binary(diff, f)
+                too_large = f.tell() > self._max_size
+            if too_large:
+                self._remove(temp_path)
+                return
+            os.replace(temp_path, self._entry_path(key))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits into its size limit."""
+        entries = []
+        total_size = 0
+        with os.scandir(self._cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(_ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self._max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
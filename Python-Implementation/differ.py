@@ -1,37 +1,253 @@
 """Computes diffs of lines."""
 
-from dataclasses import dataclass
-from typing import Optional, List
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import FrozenSet, Optional, List
 import csv
+from array import array
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Sequence
 from io import StringIO
+from itertools import compress, count
+from operator import ne
+from alignment import anchored_matches, bit_parallel_matches, histogram_matches, intern_sequences, myers_matches
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Addition:
     """Represents an addition in a diff."""
     content: str
-    _diff_indices: Optional[List[int]] = None
+    _diff_indices: Optional[FrozenSet[int]] = None  # Indices of the changed fields
     _matched_idx: Optional[int] = None  # Index of the matching removal if this is a modified row
     _is_moved: bool = False  # True if this is a row that exists in both files but moved position
-    _original_index: Optional[int] = None  # Original index in the first file (for moved rows)
-    _new_index: Optional[int] = None  # New index in the second file (for moved rows)
+    _original_index: Optional[int] = None  # Line number in the first file (for moved rows)
+    _new_index: Optional[int] = None  # Line number in the second file, if not given by the order
+    _fields: Optional[List[str]] = field(default=None, compare=False, repr=False)  # Parsed CSV fields, if known
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Removal:
     """Represents a removal in a diff."""
     content: str
-    _diff_indices: Optional[List[int]] = None
+    _diff_indices: Optional[FrozenSet[int]] = None  # Indices of the changed fields
     _matched_idx: Optional[int] = None  # Index of the matching addition if this is a modified row
     _is_moved: bool = False  # True if this is a row that exists in both files but moved position
-    _is_combined_mod: bool = False  # True if this is combined with its addition in the unified view
-    _combined_new_index: Optional[int] = None  # Index of the addition in the original diff
+    _original_index: Optional[int] = None  # Line number in the first file, if not given by the order
+    _fields: Optional[List[str]] = field(default=None, compare=False, repr=False)  # Parsed CSV fields, if known
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Unchanged:
     """Represents something unchanged in a diff."""
     content: str
     _is_moved: bool = False  # True if this is a row that exists in both files but moved position
-    _original_index: Optional[int] = None  # Original index in the first file (for moved rows)
-    _new_index: Optional[int] = None  # New index in the second file (for moved rows)
+    _original_index: Optional[int] = None  # Line number in the first file, if not given by the order
+    _new_index: Optional[int] = None  # Line number in the second file, if not given by the order
+    _fields: Optional[List[str]] = field(default=None, compare=False, repr=False)  # Parsed CSV fields, if known
+
+# Tags of the runs of a DiffResult, as in difflib's opcodes.
+_TAG_EQUAL = 0
+_TAG_DELETE = 1
+_TAG_INSERT = 2
+
+_TAGS = {"equal": _TAG_EQUAL, "delete": _TAG_DELETE, "insert": _TAG_INSERT}
+_TAG_NAMES = {tag: name for name, tag in _TAGS.items()}
+
+class DiffResult(Sequence):
+    """The elements of a diff, stored as runs of lines instead of one object per line.
+
+    A run is an opcode like ('equal', i1, i2, j1, j2) of difflib: a range of
+    unchanged, removed ('delete') or added ('insert') lines, given by their
+    indices in the inputs. Elements are created on access, so a large
+    unchanged stretch takes the same memory as a single line. Elements
+    carrying more than their line, e.g. the links of modified or moved rows,
+    are stored as they are.
+
+    The result is a sequence of Removals, Additions and Unchanged elements
+    like a list, so it can be indexed and iterated as before.
+    """
+
+    def __init__(self, text1, text2, csv_fields=False, line_numbers=False):
+        self._text1 = text1
+        self._text2 = text2
+        # If set, the elements carry the CSV fields of their lines, e.g. for
+        # the move detection. Only stored elements keep their fields, the
+        # others are parsed on access (see _cached_csv_line), so the result
+        # doesn't hold a parsed copy of both inputs.
+        self._csv_fields = csv_fields
+        # If set, the elements carry their line numbers in _original_index and
+        # _new_index, since they aren't listed in the order of both inputs
+        # (e.g. keyed diffs). Otherwise they are given by the order.
+        self._line_numbers = line_numbers
+        # One entry per run: its tag, first lines and length, and the index
+        # of its first element
+        self._tags = array('b')
+        self._starts1 = array('q')
+        self._starts2 = array('q')
+        self._lengths = array('q')
+        self._offsets = array('q')
+        self._stored = {}  # Elements stored as objects, by index
+        self._length = 0
+        # Set if the inputs differ in more lines than the max_edits the diff
+        # was computed with, so it is only a heuristic, non-minimal diff
+        self.approximate = False
+
+    def append(self, tag, line1, line2, length=1, element=None):
+        """Appends a run of length elements for the lines from line1 and line2 on.
+
+        The tag is 'equal', 'delete' or 'insert'. A removal only covers line1
+        and an addition only line2, the other one is the position in the
+        other input. If an element is given, it is stored for the single line
+        instead of being created on access. Runs continuing the last one are
+        merged into it.
+        """
+        if length <= 0:
+            return
+        tag = _TAGS[tag]
+        if element is not None:
+            self._stored[self._length] = element
+        if self._tags and self._tags[-1] == tag:
+            end1, end2 = self._run_end(len(self._tags) - 1)
+            if end1 == line1 and end2 == line2:
+                self._lengths[-1] += length
+                self._length += length
+                return
+        self._tags.append(tag)
+        self._starts1.append(line1)
+        self._starts2.append(line2)
+        self._lengths.append(length)
+        self._offsets.append(self._length)
+        self._length += length
+
+    def extend(self, other, line1, line2):
+        """Appends the elements of another DiffResult of the inputs from line1 and line2 on.
+
+        Links between modified rows stored in other are shifted to their new
+        positions, and the line numbers of moved rows to the lines of the
+        inputs.
+        """
+        offset = self._length
+        for run in range(len(other._tags)):
+            tag = _TAG_NAMES[other._tags[run]]
+            self.append(tag, other._starts1[run] + line1, other._starts2[run] + line2, other._lengths[run])
+        for index, element in other._stored.items():
+            changes = {}
+            if getattr(element, '_matched_idx', None) is not None:
+                changes['_matched_idx'] = element._matched_idx + offset
+            if getattr(element, '_original_index', None) is not None:
+                changes['_original_index'] = element._original_index + line1
+            if getattr(element, '_new_index', None) is not None:
+                changes['_new_index'] = element._new_index + line2
+            self._stored[index + offset] = replace(element, **changes) if changes else element
+
+    def _run_end(self, run):
+        """Returns the line positions in both inputs after the given run."""
+        tag = self._tags[run]
+        length = self._lengths[run]
+        return (self._starts1[run] + (length if tag != _TAG_INSERT else 0),
+                self._starts2[run] + (length if tag != _TAG_DELETE else 0))
+
+    def runs(self):
+        """Yields (tag, index, line1, line2, length) for every run.
+
+        index is the position of the first element of the run in the result,
+        line1 and line2 are the positions of its first lines in the inputs.
+        """
+        for run in range(len(self._tags)):
+            yield (_TAG_NAMES[self._tags[run]], self._offsets[run], self._starts1[run],
+                   self._starts2[run], self._lengths[run])
+
+    def opcodes(self):
+        """Yields the runs as difflib-style (tag, i1, i2, j1, j2) tuples."""
+        for run in range(len(self._tags)):
+            end1, end2 = self._run_end(run)
+            yield _TAG_NAMES[self._tags[run]], self._starts1[run], end1, self._starts2[run], end2
+
+    def stored(self):
+        """Returns (index, element) of the elements stored as objects, in order."""
+        return sorted(self._stored.items())
+
+    def _element(self, tag, line1, line2):
+        """Creates the element for the given line(s)."""
+        if tag == _TAG_INSERT:
+            line = self._text2[line2]
+            fields = _cached_csv_line(line) if self._csv_fields else None
+            if self._line_numbers:
+                return Addition(line, _fields=fields, _new_index=line2 + 1)
+            return Addition(line, _fields=fields)
+        line = self._text1[line1]
+        fields = _cached_csv_line(line) if self._csv_fields else None
+        if tag == _TAG_EQUAL:
+            if self._line_numbers:
+                return Unchanged(line, _fields=fields, _original_index=line1 + 1, _new_index=line2 + 1)
+            return Unchanged(line, _fields=fields)
+        if self._line_numbers:
+            return Removal(line, _fields=fields, _original_index=line1 + 1)
+        return Removal(line, _fields=fields)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("diff index out of range")
+        element = self._stored.get(index)
+        if element is not None:
+            return element
+        run = bisect_right(self._offsets, index) - 1
+        tag = self._tags[run]
+        k = index - self._offsets[run]
+        return self._element(tag, self._starts1[run] + (k if tag != _TAG_INSERT else 0),
+                             self._starts2[run] + (k if tag != _TAG_DELETE else 0))
+
+    def __setitem__(self, index, element):
+        """Replaces an element by one for the same line(s), e.g. to link it to another."""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("diff index out of range")
+        self._stored[index] = element
+
+    def __iter__(self):
+        stored = self._stored
+        index = 0
+        for run in range(len(self._tags)):
+            tag = self._tags[run]
+            line1 = self._starts1[run]
+            line2 = self._starts2[run]
+            for _ in range(self._lengths[run]):
+                element = stored.get(index) if stored else None
+                yield element if element is not None else self._element(tag, line1, line2)
+                index += 1
+                if tag != _TAG_INSERT:
+                    line1 += 1
+                if tag != _TAG_DELETE:
+                    line2 += 1
+
+    def __eq__(self, other):
+        if isinstance(other, (DiffResult, list)):
+            return len(self) == len(other) and all(map(lambda x, y: x == y, self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"DiffResult({list(self.opcodes())!r})"
+
+# Number of distinct field index sets that are shared. Rows often differ in
+# the same few columns, rarer sets are simply stored once per element.
+_MAX_SHARED_FIELD_INDEX_SETS = 1024
+
+@lru_cache(maxsize=_MAX_SHARED_FIELD_INDEX_SETS)
+def _shared_field_index_set(indices):
+    """Returns the frozenset of the given tuple of field indices, shared between equal tuples."""
+    return frozenset(indices)
+
+def _field_index_set(indices):
+    """Returns the shared frozenset of the given field indices, or None if they are None."""
+    if indices is None:
+        return None
+    return _shared_field_index_set(tuple(indices))
 
 def _compute_longest_common_subsequence(text1, text2):
     """Computes the longest common subsequence of the two given strings.
@@ -56,60 +272,198 @@ def _compute_longest_common_subsequence(text1, text2):
 
     return lcs
 
-def diff(text1, text2):
-    """Computes the optimal diff of the two given inputs.
+def _lcs_table_matches(text1, text2):
+    """Computes the matched index pairs by walking back the full LCS table.
 
-    The result is a list where all elements are Removals, Additions or
-    Unchanged elements.
+    This is the original quadratic time and space implementation. It is kept
+    as a reference backend for the faster engines, available as "lcs_table".
     """
-    # Try to detect if this is a CSV file by checking if most lines have commas
-    comma_lines_1 = sum(1 for line in text1 if "," in line)
-    comma_lines_2 = sum(1 for line in text2 if "," in line)
-    
-    # If both files have a high percentage of comma-separated lines, treat as CSV
-    if (comma_lines_1 > len(text1) * 0.8 and comma_lines_2 > len(text2) * 0.8):
-        return diff_csv(text1, text2)
-    
-    # Otherwise use the traditional line-based diff
-    return diff_traditional(text1, text2)
-
-def diff_traditional(text1, text2):
-    """Traditional line-based diff algorithm using LCS."""
     lcs = _compute_longest_common_subsequence(text1, text2)
-    results = []
+    matches = []
 
     i = len(text1)
     j = len(text2)
 
-    while i != 0 or j != 0:
-        # If we reached the end of text1 (i == 0) or text2 (j == 0), then we
-        # just need to print the remaining additions and removals.
-        if i == 0:
-            results.append(Addition(text2[j - 1]))
-            j -= 1
-        elif j == 0:
-            results.append(Removal(text1[i - 1]))
-            i -= 1
-        # Otherwise there's still parts of text1 and text2 left. If the
-        # currently considered part is equal, then we found an unchanged part,
-        # which belongs to the longest common subsequence.
-        elif text1[i - 1] == text2[j - 1]:
-            results.append(Unchanged(text1[i - 1]))
+    while i != 0 and j != 0:
+        # If the currently considered part is equal, then we found an
+        # unchanged part, which belongs to the longest common subsequence.
+        if text1[i - 1] == text2[j - 1]:
+            matches.append((i - 1, j - 1))
             i -= 1
             j -= 1
         # In any other case, we go in the direction of the longest common
         # subsequence.
         elif lcs[i - 1][j] <= lcs[i][j - 1]:
-            results.append(Addition(text2[j - 1]))
             j -= 1
         else:
-            results.append(Removal(text1[i - 1]))
             i -= 1
 
-    return list(reversed(results))
+    return list(reversed(matches))
+
+# Maps the names of the supported alignment backends to their implementation.
+_ALIGNMENT_ALGORITHMS = {
+    "myers": myers_matches,
+    "lcs": bit_parallel_matches,
+    "histogram": histogram_matches,
+    "lcs_table": _lcs_table_matches,
+}
+
+def _align(seq1, seq2, algorithm="myers", anchored=True):
+    """Returns the matched index pairs of the two sequences.
+
+    If anchored is set, identical prefixes and suffixes are stripped and the
+    rest is split at unique lines first, so the algorithm only has to align
+    the small regions that actually differ.
+    """
+    if algorithm not in _ALIGNMENT_ALGORITHMS:
+        raise ValueError(f"Unknown diff algorithm: {algorithm}")
+    engine = _ALIGNMENT_ALGORITHMS[algorithm]
+    if anchored:
+        return anchored_matches(seq1, seq2, engine)
+    return engine(seq1, seq2)
+
+def _bounded_align(seq1, seq2, max_edits):
+    """Returns (matches, approximate) for sequences expected to differ in at most max_edits items.
+
+    The matches are minimal if the sequences differ in at most max_edits
+    items, found in O((N+M) * max_edits) time. Otherwise approximate is set,
+    and the matches only come from splitting the sequences at unique lines,
+    with every region in between aligned within the same budget or not at all.
+    """
+    matches = myers_matches(seq1, seq2, max_edits)
+    if matches is not None:
+        return matches, False
+
+    def bounded_engine(region1, region2):
+        return myers_matches(region1, region2, max_edits) or []
+
+    return anchored_matches(seq1, seq2, bounded_engine), True
+
+def _elements_from_matches(text1, text2, matches):
+    """Turns matched index pairs into a DiffResult of Removals, Additions and Unchanged elements.
+
+    Between two matches, all removals are listed before the additions so that
+    modified rows show up as adjacent Removal -> Addition pairs.
+    """
+    results = DiffResult(text1, text2)
+    for tag, line1, line2, length in _match_runs(text1, text2, matches):
+        results.append(tag, line1, line2, length)
+    return results
+
+def _match_runs(text1, text2, matches):
+    """Yields the runs of removed, added and unchanged lines between the matched index pairs.
+
+    Yields (tag, line1, line2, length) tuples, consecutive matches are
+    combined into a single 'equal' run.
+    """
+    i = 0
+    j = 0
+    equal_start = None
+    for match_i, match_j in matches:
+        if match_i == i and match_j == j and equal_start is not None:
+            # Continues the current run of unchanged lines
+            i += 1
+            j += 1
+            continue
+        if equal_start is not None:
+            yield "equal", equal_start[0], equal_start[1], i - equal_start[0]
+        yield "delete", i, j, match_i - i
+        yield "insert", match_i, j, match_j - j
+        equal_start = (match_i, match_j)
+        i = match_i + 1
+        j = match_j + 1
+    if equal_start is not None:
+        yield "equal", equal_start[0], equal_start[1], i - equal_start[0]
+    yield "delete", i, j, len(text1) - i
+    yield "insert", len(text1), j, len(text2) - j
+
+def looks_like_csv(text1, text2):
+    """Returns whether the two inputs should be diffed as CSV files."""
+    # Try to detect if this is a CSV file by checking if most lines have commas
+    comma_lines_1 = sum(1 for line in text1 if "," in line)
+    comma_lines_2 = sum(1 for line in text2 if "," in line)
+    
+    # If both files have a high percentage of comma-separated lines, treat as CSV
+    return comma_lines_1 > len(text1) * 0.8 and comma_lines_2 > len(text2) * 0.8
+
+def diff(text1, text2, algorithm="myers", anchored=True, key_columns=None, max_edits=None):
+    """Computes the diff of the two given inputs.
+
+    The result is a DiffResult, a sequence where all elements are Removals,
+    Additions or Unchanged elements. The algorithm selects the alignment
+    backend: "myers" (the default), "lcs" for the rows of the dynamic
+    programming table computed bit-parallel, or "histogram" for git's
+    histogram diff. Unless anchored is unset, the backend only runs between
+    unique lines. Only myers and lcs without anchors always give a minimal
+    diff.
+    If key_columns are given, the inputs are diffed as CSV joined on that key.
+
+    If max_edits is given, the inputs are aligned with a Myers search bounded
+    to that many removed and added lines instead, in O((N+M) * max_edits)
+    time. If they differ in more lines, a cheap approximate diff is returned
+    and its approximate attribute is set. The bound only works with the
+    default, anchored "myers" backend. Keyed diffs ignore max_edits.
+    """
+    if key_columns:
+        return diff_csv_keyed(text1, text2, key_columns)
+
+    if max_edits is not None and (algorithm != "myers" or not anchored):
+        raise ValueError("max_edits only works with the anchored myers algorithm")
+
+    if text1 == text2:
+        # Nothing to align or parse, every line is unchanged
+        results = DiffResult(text1, text2)
+        results.append("equal", 0, 0, len(text1))
+        return results
+
+    if looks_like_csv(text1, text2):
+        return diff_csv(text1, text2, algorithm, anchored, max_edits)
+    
+    # Otherwise use the traditional line-based diff
+    return diff_traditional(text1, text2, algorithm, anchored, max_edits)
+
+def diff_traditional(text1, text2, algorithm="myers", anchored=True, max_edits=None):
+    """Traditional line-based diff algorithm using LCS."""
+    # Align integer IDs instead of the lines themselves for cheap comparisons
+    ids1, ids2 = intern_sequences(text1, text2)
+    if max_edits is None:
+        matches = _align(ids1, ids2, algorithm, anchored)
+        approximate = False
+    else:
+        matches, approximate = _bounded_align(ids1, ids2, max_edits)
+    results = _elements_from_matches(text1, text2, matches)
+    results.approximate = approximate
+    return results
+
+def _parse_csv_line(line):
+    """Parses the fields of a single CSV line."""
+    return next(csv.reader([line]), [])
+
+# Number of recently parsed lines kept for the elements of a DiffResult that
+# are created on access. Enough for the lines a view or the move detection
+# looks at repeatedly, without keeping a parsed copy of whole inputs.
+_MAX_CACHED_CSV_LINES = 4096
+
+@lru_cache(maxsize=_MAX_CACHED_CSV_LINES)
+def _cached_csv_line(line):
+    """Returns the fields of a CSV line, parsed on first access. The list is shared, don't modify it."""
+    return _parse_csv_line(line)
 
 def parse_csv_rows(lines):
-    """Parse CSV lines into rows of fields."""
+    """Parse CSV lines into rows of fields.
+
+    All lines are parsed by a single csv reader. Only if a quoted field spans
+    several lines (so rows and lines don't correspond one to one anymore) is
+    every line parsed on its own.
+    """
+    reader = csv.reader(lines)
+    try:
+        rows = list(reader)
+        if len(rows) == len(lines) and reader.line_num == len(lines):
+            return rows
+    except csv.Error:
+        pass
+
     rows = []
     for line in lines:
         # Use StringIO to simulate a file for the csv reader
@@ -123,8 +477,12 @@ def parse_csv_rows(lines):
                 rows.append([])
     return rows
 
-def calculate_row_similarity(row1, row2):
-    """Calculate similarity score between two rows (higher is more similar)."""
+def calculate_row_similarity(row1, row2, diff_indices=None):
+    """Calculate similarity score between two rows (higher is more similar).
+
+    If the differing field indices of the two rows are already known, they
+    can be passed in to skip comparing the fields again.
+    """
     if not row1 or not row2:
         return 0  # Empty rows have no similarity
 
@@ -138,16 +496,13 @@ def calculate_row_similarity(row1, row2):
         return 0.95 
 
     # 3. Near Match (Few Differences)
-    matching_fields = 0
-    different_fields_indices = []
     max_len = max(len(row1), len(row2))
     min_len = min(len(row1), len(row2))
     
-    for i in range(min_len):
-        if row1[i] == row2[i]:
-            matching_fields += 1
-        else:
-            different_fields_indices.append(i)
+    if diff_indices is None:
+        diff_indices = identify_row_field_differences(row1, row2)
+    different_fields_indices = diff_indices
+    matching_fields = min_len - len(different_fields_indices)
             
     # Count fields present only in the longer row as differences
     num_different_fields = len(different_fields_indices) + (max_len - min_len)
@@ -168,124 +523,474 @@ def calculate_row_similarity(row1, row2):
 
 def identify_row_field_differences(row1, row2):
     """Identify which fields differ between two rows."""
-    diff_indices = []
-    for idx, (field1, field2) in enumerate(zip(row1, row2)):
-        if field1 != field2:
-            diff_indices.append(idx)
-    
-    return diff_indices
+    # map() builds a mask of differing fields over the common length of both
+    # rows, and compress() picks the indices where it is set. Both run in C,
+    # so there is no Python level work per field.
+    return list(compress(count(), map(ne, row1, row2)))
 
-def diff_csv(text1, text2):
+def diff_csv(text1, text2, algorithm="myers", anchored=True, max_edits=None):
     """CSV-aware diff using LCS for row alignment and post-processing for modifications."""
+    # --- Step 4: Link rows that moved to another place ---
+    return _detect_moved_rows(_paired_csv_elements(text1, text2, algorithm, anchored, max_edits))
+
+def _paired_csv_elements(text1, text2, algorithm="myers", anchored=True, max_edits=None):
+    """Aligns the CSV rows and pairs up the modified rows of every hunk, without move detection."""
     rows1 = parse_csv_rows(text1)
     rows2 = parse_csv_rows(text2)
     
     # --- Step 1: Compute LCS on rows ---
-    # We treat entire rows (as lists of strings) as the items for LCS
-    lcs_table = _compute_longest_common_subsequence(rows1, rows2)
+    # We treat entire rows as the items for LCS. Every distinct row is mapped
+    # to an integer ID first, so the alignment doesn't deep-compare field lists
+    ids1, ids2 = intern_sequences(rows1, rows2, key=tuple)
+    if max_edits is None:
+        matches = _align(ids1, ids2, algorithm, anchored)
+        approximate = False
+    else:
+        matches, approximate = _bounded_align(ids1, ids2, max_edits)
     
-    # --- Step 2: Build initial Add/Remove/Unchanged list from LCS table ---
-    initial_results = []
-    i = len(rows1)
-    j = len(rows2)
-    
-    while i > 0 or j > 0:
-        # Check if we should skip the header comparison if they are identical
-        # This avoids marking the header as added/removed if only content changed
-        is_header_row1 = (i == 1 and rows1[0] == rows2[0]) if (rows1 and rows2) else False
-        is_header_row2 = (j == 1 and rows1[0] == rows2[0]) if (rows1 and rows2) else False
-
-        if is_header_row1 and is_header_row2:
-             # Both point to identical headers, skip comparison for this iteration
-             i -= 1
-             j -= 1
-             continue
-             
-        if i > 0 and j > 0 and rows1[i - 1] == rows2[j - 1]:
-            # Rows are identical - Unchanged
-            # Use original text content for the Unchanged object
-            initial_results.append(Unchanged(text1[i - 1]))
-            i -= 1
-            j -= 1
-        elif j > 0 and (i == 0 or lcs_table[i][j - 1] >= lcs_table[i - 1][j]):
-            # Row from text2 is not in LCS - Addition
-            initial_results.append(Addition(text2[j - 1]))
-            j -= 1
-        elif i > 0 and (j == 0 or lcs_table[i][j - 1] < lcs_table[i - 1][j]):
-            # Row from text1 is not in LCS - Removal
-            initial_results.append(Removal(text1[i - 1]))
-            i -= 1
+    # --- Step 2: Build the runs of removed, added and unchanged rows ---
+    # --- Step 3: Post-processing to identify Modifications ---
+    # Every contiguous block of changes (a hunk) is paired up on its own
+    results = DiffResult(text1, text2, csv_fields=True)
+    results.approximate = approximate
+    hunk_start = None
+    for tag, line1, line2, length in _match_runs(text1, text2, matches):
+        if tag == "equal":
+            if hunk_start is not None:
+                _append_hunk(results, rows1, rows2, hunk_start[0], line1, hunk_start[1], line2)
+                hunk_start = None
+            results.append(tag, line1, line2, length)
+        elif hunk_start is None and length:
+            hunk_start = (line1, line2)
+    if hunk_start is not None:
+        _append_hunk(results, rows1, rows2, hunk_start[0], len(text1), hunk_start[1], len(text2))
+
+    return results
+
+def _append_hunk(results, rows1, rows2, start1, end1, start2, end2):
+    """Pairs up the removed and added rows of a hunk and appends it to the results."""
+    pairs = _pair_modified_rows(rows1[start1:end1], rows2[start2:end2])
+    _append_paired_hunk(results, rows1, rows2, start1, end1, start2, end2, pairs)
+
+# Hunks with at most this many removals and additions are paired optimally,
+# larger ones greedily.
+_MAX_OPTIMAL_PAIRING_HUNK = 64
+
+# Buckets of the similarity index with more rows than this are ignored, they
+# only hold low-information values (e.g. a block of empty fields).
+_MAX_INDEX_BUCKET_SIZE = 32
+
+# Rows differing in at most this many fields count as modifications.
+_MAX_MODIFIED_FIELDS = 3
+
+def _modification_score(row1, row2):
+    """Returns the similarity and field differences of two rows, or None if unrelated.
+
+    Rows are considered a modification of each other if their IDs (first
+    column) match or if their similarity is high. Equal rows are left to the
+    move detection.
+    """
+    if not row1 or not row2 or row1 == row2:
+        return None
+    diff_indices = identify_row_field_differences(row1, row2)
+    similarity_score = calculate_row_similarity(row1, row2, diff_indices)
+    is_id_match = row1[0] == row2[0]
+    if is_id_match or similarity_score >= 0.8:
+        return similarity_score, diff_indices
+    return None
+
+def _optimal_pairs(removal_rows, addition_rows):
+    """Scores all removal/addition combinations and picks the best pairs that don't cross.
+
+    This is a weighted longest common subsequence: best[r][a] is the highest
+    total similarity of pairs among the first r removals and a additions. The
+    pairs keep the order of both files by construction, so the result is
+    optimal among all pairings that can be shown next to each other.
+    """
+    scores = [[_modification_score(row1, row2) for row2 in addition_rows] for row1 in removal_rows]
+    best = [[0.0] * (len(addition_rows) + 1) for _ in range(len(removal_rows) + 1)]
+    for r, row_scores in enumerate(scores):
+        previous = best[r]
+        current = best[r + 1]
+        for a, score in enumerate(row_scores):
+            value = max(previous[a + 1], current[a])
+            if score and previous[a] + score[0] > value:
+                value = previous[a] + score[0]
+            current[a + 1] = value
+
+    # Walk back the table, preferring to pair the rows where that is optimal
+    pairs = []
+    r = len(removal_rows)
+    a = len(addition_rows)
+    while r and a:
+        score = scores[r - 1][a - 1]
+        if score and best[r][a] == best[r - 1][a - 1] + score[0]:
+            pairs.append((r - 1, a - 1, score[0], score[1]))
+            r -= 1
+            a -= 1
+        elif best[r][a] == best[r - 1][a]:
+            r -= 1
         else:
-             # Should not happen, but break loop if it does
-             print("Error: Unexpected state in LCS traceback")
-             break
+            a -= 1
+    pairs.reverse()
+    return pairs
 
-    # Add header as unchanged if it was identical and skipped
-    if rows1 and rows2 and rows1[0] == rows2[0]:
-         initial_results.append(Unchanged(text1[0]))
+def _band_keys(row, band_count):
+    """Yields keys for the similarity index, one for each band of columns.
 
-    # Results are built in reverse order, so reverse them
-    initial_results.reverse()
-    
-    # --- Step 3: Post-processing to identify Modifications ---
-    final_results = []
-    idx = 0
-    processed_indices = set() # Keep track of indices used in modification pairs
+    Two rows differing in fewer fields than there are bands have at least one
+    band in which all their fields are the same.
+    """
+    for band in range(band_count):
+        yield band, tuple(row[band::band_count])
+
+def _greedy_pairs(removal_rows, addition_rows):
+    """Pairs large hunks using a similarity index instead of scoring every combination.
+
+    Additions are indexed by their ID and by bands of their columns. Every
+    removal is only scored against the additions sharing a bucket with it,
+    then the best scoring pairs are picked greedily. The pairs may cross, so
+    this is only a heuristic, see _non_crossing_pairs.
+    """
+    width = max(map(len, removal_rows + addition_rows), default=0)
+    band_count = min(_MAX_MODIFIED_FIELDS + 1, max(width, 1))
+
+    index = {}
+    for a, row in enumerate(addition_rows):
+        if row:
+            index.setdefault(('id', row[0]), []).append(a)
+            for key in _band_keys(row, band_count):
+                index.setdefault(key, []).append(a)
+
+    candidates = []
+    for r, row in enumerate(removal_rows):
+        if not row:
+            continue
+        seen = set()
+        for key in [('id', row[0])] + list(_band_keys(row, band_count)):
+            bucket = index.get(key, ())
+            if len(bucket) > _MAX_INDEX_BUCKET_SIZE:
+                continue
+            for a in bucket:
+                if a not in seen:
+                    seen.add(a)
+                    score = _modification_score(row, addition_rows[a])
+                    if score:
+                        candidates.append((-score[0], abs(r - a), r, a, score[1]))
+
+    candidates.sort(key=lambda candidate: candidate[:4])
+    pairs = []
+    used_removals = set()
+    used_additions = set()
+    for negative_score, _, r, a, diff_indices in candidates:
+        if r not in used_removals and a not in used_additions:
+            used_removals.add(r)
+            used_additions.add(a)
+            pairs.append((r, a, -negative_score, diff_indices))
+    return pairs
+
+def _non_crossing_pairs(pairs, addition_count):
+    """Keeps the subset of pairs with the highest total score that don't cross.
+
+    Modified rows are shown next to each other, which is only possible if the
+    pairs keep the order of both files. This is a weighted longest increasing
+    subsequence, solved with a Fenwick tree over the addition indices. It is
+    only used for the greedy pairs of large hunks: picking pairs first and
+    dropping crossing ones afterwards isn't optimal, but stays subquadratic.
+    """
+    pairs = sorted(pairs)
+    # tree[k] holds the (best total score, pair index) of a prefix of additions
+    tree = [(0.0, None)] * (addition_count + 1)
+    predecessors = [None] * len(pairs)
+    totals = [0.0] * len(pairs)
+
+    for pair_index, (_, a, score, _) in enumerate(pairs):
+        best = (0.0, None)
+        k = a
+        while k > 0:
+            best = max(best, tree[k], key=lambda entry: entry[0])
+            k -= k & -k
+        totals[pair_index] = best[0] + score
+        predecessors[pair_index] = best[1]
+        k = a + 1
+        while k <= addition_count:
+            if totals[pair_index] > tree[k][0]:
+                tree[k] = (totals[pair_index], pair_index)
+            k += k & -k
+
+    if not pairs:
+        return []
+    pair_index = max(range(len(pairs)), key=totals.__getitem__)
+    kept = []
+    while pair_index is not None:
+        kept.append(pairs[pair_index])
+        pair_index = predecessors[pair_index]
+    kept.reverse()
+    return kept
+
+def _pair_modified_rows(removal_rows, addition_rows):
+    """Finds the removed and added rows of a hunk that are modifications of each other.
+
+    Returns (removal index, addition index, score, diff indices) tuples in
+    the order of both files. Small hunks are paired optimally, larger ones
+    with a greedy heuristic so that huge hunks don't take quadratic time.
+    """
+    if not removal_rows or not addition_rows:
+        return []
+    if max(len(removal_rows), len(addition_rows)) <= _MAX_OPTIMAL_PAIRING_HUNK:
+        return _optimal_pairs(removal_rows, addition_rows)
+    return _non_crossing_pairs(_greedy_pairs(removal_rows, addition_rows), len(addition_rows))
+
+def _append_paired_hunk(results, rows1, rows2, start1, end1, start2, end2, pairs):
+    """Appends a hunk to the results, with modification pairs linked and adjacent.
+
+    The hunk removes the lines from start1 to end1 and adds those from start2
+    to end2, pairs are given relative to these starts. Unpaired removals and
+    additions keep their relative order, removals first.
+    """
+    next_removal = 0
+    next_addition = 0
+    for r, a, _, diff_indices in pairs:
+        diff_indices = _field_index_set(diff_indices)
+        results.append("delete", start1 + next_removal, start2 + next_addition, r - next_removal)
+        results.append("insert", start1 + r, start2 + next_addition, a - next_addition)
+
+        removal_idx = len(results)
+        line1 = start1 + r
+        line2 = start2 + a
+        results.append("delete", line1, line2,
+                       element=Removal(results._text1[line1], diff_indices, _matched_idx=removal_idx + 1,
+                                       _fields=rows1[line1]))
+        results.append("insert", line1 + 1, line2,
+                       element=Addition(results._text2[line2], diff_indices, _matched_idx=removal_idx,
+                                        _fields=rows2[line2]))
+        next_removal = r + 1
+        next_addition = a + 1
+
+    results.append("delete", start1 + next_removal, start2 + next_addition, end1 - start1 - next_removal)
+    results.append("insert", end1, start2 + next_addition, end2 - start2 - next_addition)
+
+def _detect_moved_rows(results):
+    """Marks removed and added rows that are (nearly) the same row in another place.
+
+    The given DiffResult is updated in place and returned.
+
+    Rows that moved unchanged are found with an exact hash lookup. The other
+    unpaired removals are indexed by bands of their columns like in
+    _greedy_pairs, and every other unpaired addition is compared only with
+    the removals sharing a bucket with it. Since a row differing in at most
+    _MAX_MODIFIED_FIELDS fields has a band in common with its original, all
+    of these are found, unless that band's bucket was too common to search.
+    Rows that are equal or differ in at most a few fields are marked as
+    moved, near-duplicates are also linked like modified rows. This finds
+    moved rows in sub-quadratic time, even if huge numbers of rows changed.
+    """
+    removal_positions = []
+    addition_positions = []
+    # Line numbers in the first and second file and the fields of every
+    # changed element
+    line_numbers = {}
+    fields = {}
+    for tag, index, line1, line2, length in results.runs():
+        if tag == "equal":
+            continue
+        for k in range(length):
+            position = index + k
+            element = results[position]
+            fields[position] = element._fields
+            if tag == "delete":
+                line_numbers[position] = (line1 + k + 1, line2 + 1)
+                if element._matched_idx is None and element._fields:
+                    removal_positions.append(position)
+            else:
+                line_numbers[position] = (line1 + 1, line2 + k + 1)
+                if element._matched_idx is None and element._fields:
+                    addition_positions.append(position)
+
+    if not removal_positions or not addition_positions:
+        return results
+
+    # Rows that moved without changes are found by an exact hash lookup
+    candidates = []
+    exact_removals = {}
+    for position in removal_positions:
+        exact_removals.setdefault(tuple(fields[position]), deque()).append(position)
+    remaining_additions = []
+    for position in addition_positions:
+        same_rows = exact_removals.get(tuple(fields[position]))
+        if same_rows:
+            removal_position = same_rows.popleft()
+            candidates.append((0, abs(position - removal_position), removal_position, position, []))
+        else:
+            remaining_additions.append(position)
+    remaining_removals = [position for same_rows in exact_removals.values() for position in same_rows]
+
+    # The rest is looked up in the band index, scoring only the candidates
+    if remaining_removals and remaining_additions:
+        width = max(len(fields[position]) for position in remaining_removals + remaining_additions)
+        band_count = min(_MAX_MODIFIED_FIELDS + 1, width)
+        index = {}
+        for position in remaining_removals:
+            for key in _band_keys(fields[position], band_count):
+                index.setdefault(key, []).append(position)
+
+        for addition_position in remaining_additions:
+            addition_row = fields[addition_position]
+            seen = set()
+            for key in _band_keys(addition_row, band_count):
+                bucket = index.get(key, ())
+                if len(bucket) > _MAX_INDEX_BUCKET_SIZE:
+                    continue
+                for removal_position in bucket:
+                    if removal_position in seen:
+                        continue
+                    seen.add(removal_position)
+                    removal_row = fields[removal_position]
+                    diff_indices = identify_row_field_differences(removal_row, addition_row)
+                    different_fields = len(diff_indices) + abs(len(removal_row) - len(addition_row))
+                    if different_fields <= _MAX_MODIFIED_FIELDS:
+                        candidates.append((different_fields, abs(addition_position - removal_position),
+                                           removal_position, addition_position, diff_indices))
+
+    candidates.sort(key=lambda candidate: candidate[:4])
+    linked = set()
+    for different_fields, _, removal_position, addition_position, diff_indices in candidates:
+        if removal_position in linked or addition_position in linked:
+            continue
+        diff_indices = _field_index_set(diff_indices)
+        linked.add(removal_position)
+        linked.add(addition_position)
+
+        removal = results[removal_position]
+        addition = results[addition_position]
+        if different_fields == 0:
+            # Same row in another place
+            results[removal_position] = replace(removal, _is_moved=True)
+            results[addition_position] = replace(addition, _is_moved=True,
+                                                 _original_index=line_numbers[removal_position][0],
+                                                 _new_index=line_numbers[addition_position][1])
+        else:
+            # Moved and modified
+            results[removal_position] = replace(removal, _is_moved=True, _diff_indices=diff_indices,
+                                                _matched_idx=addition_position)
+            results[addition_position] = replace(addition, _is_moved=True, _diff_indices=diff_indices,
+                                                 _matched_idx=removal_position,
+                                                 _original_index=line_numbers[removal_position][0],
+                                                 _new_index=line_numbers[addition_position][1])
+
+    return results
+
+def _resolve_key_columns(header, key_columns):
+    """Turns key column names or indices into field indices of the given header.
+
+    Names of the header row are matched first, so a column named "2" is found
+    by its name. Other numbers are zero-based indices. Raises ValueError for
+    anything else.
+    """
+    indices = []
+    for column in key_columns:
+        if isinstance(column, int):
+            indices.append(column)
+        elif column in header:
+            indices.append(header.index(column))
+        elif str(column).isdigit():
+            indices.append(int(column))
+        else:
+            raise ValueError(f"Key column not found in header: {column}")
+    return indices
+
+def _row_key(row, key_indices):
+    """Returns the primary key of a row, using '' for missing fields."""
+    return tuple(row[idx] if idx < len(row) else '' for idx in key_indices)
 
-    while idx < len(initial_results):
-        if idx in processed_indices:
-            idx += 1
+def join_rows_on_key(rows1, rows2, key_indices1, key_indices2):
+    """Matches the rows of both sides that share the same primary key.
+
+    Returns two lists with an entry for every row of rows2: the index of the
+    matching row in rows1 (or None), and the differing field indices of the
+    match (or None if the rows are equal or unmatched). Duplicate keys are
+    matched in order of appearance.
+    """
+    # Hash index on the first file
+    index1 = {}
+    for i, row in enumerate(rows1):
+        index1.setdefault(_row_key(row, key_indices1), deque()).append(i)
+
+    # Probe with the second file
+    matched = [None] * len(rows2)
+    field_differences = [None] * len(rows2)
+    for j, row in enumerate(rows2):
+        candidates = index1.get(_row_key(row, key_indices2))
+        if candidates:
+            i = candidates.popleft()
+            matched[j] = i
+            if rows1[i] != row:
+                field_differences[j] = identify_row_field_differences(rows1[i], row)
+
+    return matched, field_differences
+
+def _keyed_elements(text1, text2, rows1, rows2, matched, field_differences):
+    """Builds the diff elements from the result of join_rows_on_key.
+
+    Rows are listed in the order of the second file, with removed rows placed
+    after their predecessor in the first, so every element carries its line
+    numbers. rows1 and rows2 may be None if the rows weren't parsed, modified
+    rows are then parsed when they are stored.
+    """
+    used = [False] * len(text1)
+    for i in matched:
+        if i is not None:
+            used[i] = True
+    removed = [i for i in range(len(text1)) if not used[i]]
+
+    results = DiffResult(text1, text2, csv_fields=True, line_numbers=True)
+    next_removed = 0
+    # Position in the first file, for the runs of added rows
+    line1 = 0
+    for j, i in enumerate(matched):
+        if i is None:
+            results.append("insert", line1, j)
             continue
 
-        current_element = initial_results[idx]
+        # Flush the removed rows that came before this one in the first file
+        while next_removed < len(removed) and removed[next_removed] < i:
+            results.append("delete", removed[next_removed], j)
+            next_removed += 1
 
-        # Look for adjacent Removal -> Addition sequence
-        if (idx + 1 < len(initial_results) and
-                isinstance(current_element, Removal) and
-                isinstance(initial_results[idx + 1], Addition)):
-            
-            removal = current_element
-            addition = initial_results[idx + 1]
-            
-            # Parse rows to check for similarity
-            try:
-                # Use original text lines associated with removal/addition
-                removal_row = parse_csv_rows([removal.content])[0]
-                addition_row = parse_csv_rows([addition.content])[0]
-
-                # Check similarity (ID match or high similarity)
-                similarity_score = calculate_row_similarity(removal_row, addition_row)
-                is_id_match = (len(removal_row) > 0 and len(addition_row) > 0 and removal_row[0] == addition_row[0])
-                
-                # Consider it a modification if ID matches OR similarity is high (e.g., >= 0.8)
-                if is_id_match or similarity_score >= 0.8:
-                    diff_indices = identify_row_field_differences(removal_row, addition_row)
-                    
-                    # Link them as a modification pair
-                    # Indices point to the *other* element within the final_results list
-                    removal_final_idx = len(final_results)
-                    addition_final_idx = removal_final_idx + 1
-                    
-                    linked_removal = Removal(removal.content, diff_indices, _matched_idx=addition_final_idx)
-                    linked_addition = Addition(addition.content, diff_indices, _matched_idx=removal_final_idx)
-                    
-                    final_results.append(linked_removal)
-                    final_results.append(linked_addition)
-                    
-                    # Mark both original indices as processed
-                    processed_indices.add(idx)
-                    processed_indices.add(idx + 1)
-                    idx += 2 # Move past the processed pair
-                    continue # Continue to next iteration
-
-            except Exception as e:
-                # If parsing or comparison fails, treat as separate R/A
-                print(f"Warning: Error processing potential modification at index {idx}: {e}")
-                pass # Fall through to default handling
-
-        # Default: Add the element as is if not part of a modification
-        final_results.append(current_element)
-        processed_indices.add(idx)
-        idx += 1
-
-    return final_results
+        diff_indices = _field_index_set(field_differences[j])
+        if diff_indices is None:
+            results.append("equal", i, j)
+        else:
+            removal_idx = len(results)
+            results.append("delete", i, j,
+                           element=Removal(text1[i], diff_indices, _matched_idx=removal_idx + 1,
+                                           _original_index=i + 1,
+                                           _fields=rows1[i] if rows1 is not None else _parse_csv_line(text1[i])))
+            results.append("insert", i + 1, j,
+                           element=Addition(text2[j], diff_indices, _matched_idx=removal_idx, _new_index=j + 1,
+                                            _fields=rows2[j] if rows2 is not None else _parse_csv_line(text2[j])))
+        line1 = i + 1
+
+    for i in removed[next_removed:]:
+        results.append("delete", i, len(text2))
+
+    return results
+
+def diff_csv_keyed(text1, text2, key_columns):
+    """CSV-aware diff that joins rows on a primary key instead of their order.
+
+    Both sides are indexed by the given key columns in a hash table, so every
+    row is classified as added, removed, modified or unchanged in O(N+M).
+    Modified rows become adjacent Removal -> Addition pairs linked through
+    _matched_idx, just like in diff_csv.
+    """
+    rows1 = parse_csv_rows(text1)
+    rows2 = parse_csv_rows(text2)
+
+    # Resolve the key columns against each file's own header, so a reordered
+    # header still joins on the right fields
+    key_indices1 = _resolve_key_columns(rows1[0] if rows1 else [], key_columns)
+    key_indices2 = _resolve_key_columns(rows2[0] if rows2 else [], key_columns)
+
+    matched, field_differences = join_rows_on_key(rows1, rows2, key_indices1, key_indices2)
+    return _keyed_elements(text1, text2, rows1, rows2, matched, field_differences)
@@ -0,0 +1,179 @@
+"""Diffs CSV files that are larger than the available memory.
+
+Both files are split into runs that fit into memory, every run is sorted by
+the primary key and spilled to a temporary file. The sorted runs are then
+merged and the two sides are joined on their key, which only needs a handful
+of rows in memory at any point in time.
+"""
+
+import csv
+import heapq
+import os
+import pickle
+import sys
+import tempfile
+from differ import (Addition, Removal, Unchanged, _field_index_set, _resolve_key_columns, _row_key,
+                    identify_row_field_differences)
+
+# Default amount of memory (in bytes) taken by the records sorted per run.
+_DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+
+# Memory taken by a record of a run besides its strings: the record tuple,
+# its line number and its slot in the list of records.
+_RECORD_OVERHEAD = sys.getsizeof((None, None, None)) + sys.getsizeof(2 ** 40) + 8
+
+# Number of records that are pickled together when writing a run.
+_RECORDS_PER_CHUNK = 1024
+
+# Maximum number of runs that are merged at once, to limit open files.
+_MAX_MERGE_FAN_IN = 64
+
+def _iter_csv_lines(f):
+    """Yields (content, row) for every line of the given file.
+
+    A single csv reader is used for the whole file. The content is the line
+    without its trailing new line, as used for the diff elements.
+    """
+    current_line = [None]
+
+    def lines():
+        for line in f:
+            current_line[0] = line.rstrip('\r\n')
+            yield current_line[0]
+
+    for row in csv.reader(lines()):
+        yield current_line[0], row
+
+def _write_run(records, temp_dir):
+    """Writes the given sorted records to a new temporary file and returns its path."""
+    fd, path = tempfile.mkstemp(suffix=".run", dir=temp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        for start in range(0, len(records), _RECORDS_PER_CHUNK):
+            pickle.dump(records[start:start + _RECORDS_PER_CHUNK], f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+def _read_run(path):
+    """Yields the records of a run written by _write_run."""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+def _merge_runs(paths, temp_dir):
+    """Merges sorted runs until few enough are left to be merged at once."""
+    while len(paths) > _MAX_MERGE_FAN_IN:
+        merged_paths = []
+        for start in range(0, len(paths), _MAX_MERGE_FAN_IN):
+            group = paths[start:start + _MAX_MERGE_FAN_IN]
+            fd, path = tempfile.mkstemp(suffix=".run", dir=temp_dir)
+            with os.fdopen(fd, 'wb') as f:
+                chunk = []
+                for record in heapq.merge(*[_read_run(p) for p in group]):
+                    chunk.append(record)
+                    if len(chunk) == _RECORDS_PER_CHUNK:
+                        pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                        chunk = []
+                if chunk:
+                    pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+            for p in group:
+                os.remove(p)
+            merged_paths.append(path)
+        paths = merged_paths
+    return heapq.merge(*[_read_run(p) for p in paths])
+
+def _sorted_records(path, key_columns, temp_dir, memory_limit):
+    """Returns the header line and a stream of (key, line_number, content) sorted by key.
+
+    line_number is the one-based line number in the file. The file is read
+    in runs whose records take at most memory_limit bytes, counting the
+    Python objects and not only the text, each run is sorted and spilled to
+    temp_dir.
+    """
+    with open(path, 'r') as f:
+        lines = _iter_csv_lines(f)
+        header_content, header = next(lines, ("", []))
+        key_indices = _resolve_key_columns(header, key_columns)
+
+        run_paths = []
+        records = []
+        run_size = 0
+        getsizeof = sys.getsizeof
+        for line_number, (content, row) in enumerate(lines, start=2):
+            key = _row_key(row, key_indices)
+            records.append((key, line_number, content))
+            run_size += _RECORD_OVERHEAD + getsizeof(content) + getsizeof(key) + sum(map(getsizeof, key))
+            if run_size >= memory_limit:
+                records.sort()
+                run_paths.append(_write_run(records, temp_dir))
+                records = []
+                run_size = 0
+        if records:
+            records.sort()
+            run_paths.append(_write_run(records, temp_dir))
+
+    return header_content, _merge_runs(run_paths, temp_dir)
+
+def _parse_line(content):
+    """Parses a single CSV line into its fields."""
+    return next(csv.reader([content]), [])
+
+def _matched_elements(content1, content2, line1, line2, position):
+    """Returns the elements for two rows with the same key at the given output position.
+
+    line1 and line2 are the line numbers of the rows, which the elements
+    carry since the output is in key order.
+    """
+    if content1 == content2:
+        return [Unchanged(content1, _original_index=line1, _new_index=line2)]
+    row1 = _parse_line(content1)
+    row2 = _parse_line(content2)
+    if row1 == row2:
+        return [Unchanged(content1, _original_index=line1, _new_index=line2, _fields=row1)]
+    diff_indices = _field_index_set(identify_row_field_differences(row1, row2))
+    return [Removal(content1, diff_indices, _matched_idx=position + 1, _original_index=line1, _fields=row1),
+            Addition(content2, diff_indices, _matched_idx=position, _new_index=line2, _fields=row2)]
+
+def diff_csv_external(path1, path2, key_columns, memory_limit=_DEFAULT_MEMORY_LIMIT, temp_dir=None):
+    """Diffs two CSV files joined on a primary key, using bounded memory.
+
+    This is the external memory counterpart of differ.diff_csv_keyed. The
+    first line of both files is taken as the header and compared directly,
+    all other rows are sort-merge joined on the key columns. Diff elements are
+    yielded one by one in key order, so they can be written out while the
+    diff is still being computed, and carry their line numbers like those of
+    a keyed diff. Memory use is bounded by memory_limit (plus interpreter
+    overhead) regardless of the input size.
+    """
+    with tempfile.TemporaryDirectory(prefix="diff-", dir=temp_dir) as run_dir:
+        header1, records1 = _sorted_records(path1, key_columns, run_dir, memory_limit)
+        header2, records2 = _sorted_records(path2, key_columns, run_dir, memory_limit)
+
+        # Position of the next element in the output, for linking modifications
+        position = 0
+        for element in _matched_elements(header1, header2, 1, 1, position):
+            yield element
+            position += 1
+
+        record1 = next(records1, None)
+        record2 = next(records2, None)
+        while record1 is not None or record2 is not None:
+            if record2 is None or (record1 is not None and record1[0] < record2[0]):
+                # Key only in the first file
+                yield Removal(record1[2], _original_index=record1[1])
+                position += 1
+                record1 = next(records1, None)
+            elif record1 is None or record2[0] < record1[0]:
+                # Key only in the second file
+                yield Addition(record2[2], _new_index=record2[1])
+                position += 1
+                record2 = next(records2, None)
+            else:
+                # Same key on both sides, duplicates are paired in file order
+                for element in _matched_elements(record1[2], record2[2], record1[1], record2[1], position):
+                    yield element
+                    position += 1
+                record1 = next(records1, None)
+                record2 = next(records2, None)
@@ -0,0 +1,92 @@
+"""Fast whole-file comparison and content hashes of input files.
+
+Files are memory mapped, so comparing or hashing them doesn't copy them into
+Python objects first.
+"""
+
+import hashlib
+import mmap
+import os
+
+# Number of bytes compared or hashed at once.
+_CHUNK_SIZE = 1024 * 1024
+
+def _mapped(f):
+    """Returns a read-only memory map of the open file, or b"" if it is empty."""
+    if os.fstat(f.fileno()).st_size == 0:
+        # Empty files can't be mapped
+        return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def files_identical(path1, path2):
+    """Returns whether the two files have exactly the same bytes.
+
+    Files of different sizes are told apart from their metadata alone,
+    otherwise both are compared chunk by chunk (a memcmp of each chunk),
+    stopping at the first difference.
+    """
+    if os.path.samefile(path1, path2):
+        return True
+    if os.path.getsize(path1) != os.path.getsize(path2):
+        return False
+    with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+        data1 = _mapped(f1)
+        data2 = _mapped(f2)
+        try:
+            view1 = memoryview(data1)
+            view2 = memoryview(data2)
+            try:
+                for start in range(0, len(view1), _CHUNK_SIZE):
+                    if view1[start:start + _CHUNK_SIZE] != view2[start:start + _CHUNK_SIZE]:
+                        return False
+                return True
+            finally:
+                view1.release()
+                view2.release()
+        finally:
+            if isinstance(data1, mmap.mmap):
+                data1.close()
+            if isinstance(data2, mmap.mmap):
+                data2.close()
+
+def file_digest(path):
+    """Returns a hex digest of the content of the given file.
+
+    Equal digests mean equal content, so the digest can be used as a key for
+    results computed from the file.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        data = _mapped(f)
+        try:
+            view = memoryview(data)
+            try:
+                for start in range(0, len(view), _CHUNK_SIZE):
+                    digest.update(view[start:start + _CHUNK_SIZE])
+            finally:
+                view.release()
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    return digest.hexdigest()
+
+def count_lines(path):
+    """Returns the number of lines of the given file, as split by str.splitlines for plain new lines."""
+    lines = 0
+    last_byte = b"\n"
+    with open(path, 'rb') as f:
+        data = _mapped(f)
+        try:
+            for start in range(0, len(data), _CHUNK_SIZE):
+                chunk = data[start:start + _CHUNK_SIZE]
+                lines += chunk.count(b"\n")
+                last_byte = chunk[-1:]
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    # A last line without a trailing new line counts as well
+    return lines + (last_byte != b"\n")
+
+def line_fingerprints(lines):
+    """Returns an 8 byte digest of every line, to tell later whether a line changed."""
+    return [hashlib.blake2b(line.encode('utf-8'), digest_size=8).digest() for line in lines]
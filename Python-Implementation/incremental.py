@@ -0,0 +1,250 @@
+"""Incremental diffs that reuse the result of a previous run.
+
+A state file stores a fingerprint of every line of both inputs together with
+the previous diff: its runs of unchanged, removed and added lines and the
+links between modified rows. The contents themselves aren't stored, they are
+taken from the inputs.
+
+When the inputs are diffed again, the fingerprints of each input are aligned
+with those of its previous version to find the edited regions, e.g. the lines
+appended to a log or the lines around an edit. Every previous hunk touching
+an edited line, or the place where new lines were inserted, is diffed again
+together with the new lines. All other hunks are reused as they are.
+
+Regions are only cut next to unchanged rows, so the rows of a hunk are still
+paired up as modifications together. Like with parallel diffs, every region
+is aligned on its own, so the result might not be strictly minimal. Moved
+rows are detected again over the whole result, as moves can cross regions.
+"""
+
+import json
+import os
+import tempfile
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from alignment import anchored_matches, intern_sequences, myers_matches
+from differ import (Addition, DiffResult, Removal, _detect_moved_rows, _field_index_set, _paired_csv_elements,
+                    diff, diff_traditional, looks_like_csv)
+from fingerprint import line_fingerprints
+
+_STATE_MAGIC = b"DIFFSTATE"
+_STATE_VERSION = 1
+
+_FINGERPRINT_SIZE = 8
+
+# Kinds of the elements of the previous diff, one byte per element.
+_KIND_UNCHANGED = 0
+_KIND_REMOVAL = 1
+_KIND_ADDITION = 2
+
+_KINDS = {"equal": _KIND_UNCHANGED, "delete": _KIND_REMOVAL, "insert": _KIND_ADDITION}
+_KIND_TAGS = {kind: tag for tag, kind in _KINDS.items()}
+
+def _load_state(path):
+    """Returns (header, fingerprints1, fingerprints2, kinds) stored in the state file, or None.
+
+    kinds has one byte per element of the previous diff.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(_STATE_MAGIC) + 1) != _STATE_MAGIC + bytes([_STATE_VERSION]):
+                return None
+            header = json.loads(f.readline())
+            fingerprints = []
+            for line_count in (header["lines1"], header["lines2"]):
+                data = f.read(line_count * _FINGERPRINT_SIZE)
+                if len(data) != line_count * _FINGERPRINT_SIZE:
+                    return None
+                fingerprints.append([data[start:start + _FINGERPRINT_SIZE]
+                                     for start in range(0, len(data), _FINGERPRINT_SIZE)])
+            tags = f.read(header["runs"])
+            lengths = array('q')
+            lengths.frombytes(f.read(header["runs"] * lengths.itemsize))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError):
+        # Not a state file of this version, or a damaged one
+        return None
+    if len(tags) != len(lengths):
+        return None
+    kinds = b"".join(bytes([kind]) * length for kind, length in zip(tags, lengths))
+    return header, fingerprints[0], fingerprints[1], kinds
+
+def _save_state(path, options, fingerprints1, fingerprints2, diff_result):
+    """Writes the state file, replacing the previous one only once it is complete."""
+    runs = list(diff_result.runs())
+    tags = bytes([_KINDS[tag] for tag, _, _, _, _ in runs])
+    lengths = array('q', [length for _, _, _, _, length in runs])
+    # Links of modified rows, relative to the element. Moves aren't stored,
+    # they are detected again on every run.
+    links = [[index, element._matched_idx - index, sorted(element._diff_indices)]
+             for index, element in diff_result.stored()
+             if getattr(element, '_matched_idx', None) is not None and not element._is_moved]
+    header = dict(options, lines1=len(fingerprints1), lines2=len(fingerprints2),
+                  runs=len(runs), links=links)
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_STATE_MAGIC + bytes([_STATE_VERSION]))
+            f.write(json.dumps(header, sort_keys=True).encode('utf-8') + b"\n")
+            f.write(b"".join(fingerprints1))
+            f.write(b"".join(fingerprints2))
+            f.write(tags)
+            f.write(lengths.tobytes())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def _line_mapping(previous, current):
+    """Aligns the fingerprints of an input with those of its previous version.
+
+    Returns the index of every previous line among the current lines (None
+    if it was removed or changed), and the set of previous line indices that
+    new lines were inserted before. An index equal to the number of previous
+    lines stands for lines appended at the end.
+    """
+    if previous == current:
+        return range(len(current)), set()
+    ids1, ids2 = intern_sequences(previous, current)
+    mapping = [None] * len(previous)
+    inserted = set()
+    last_j = -1
+    for i, j in anchored_matches(ids1, ids2, myers_matches) + [(len(previous), len(current))]:
+        if j - last_j > 1:
+            inserted.add(i)
+        if i < len(previous):
+            mapping[i] = j
+        last_j = j
+    return mapping, inserted
+
+def _edited_regions(kinds, mapping1, inserted1, mapping2, inserted2):
+    """Returns the element ranges of the previous diff that have to be diffed again.
+
+    An element is edited if one of its lines was changed or removed, or if
+    new lines were inserted right before it. Every range starts after and
+    ends before an unchanged row that wasn't edited (or at the ends of the
+    diff), so hunks are never split. Returns (start, end, end1, end2) tuples,
+    where end1 and end2 are the previous line positions at the end.
+    """
+    regions = []
+    region_start = None
+    boundary = 0
+    i = j = 0
+    for index, kind in enumerate(kinds):
+        if kind == _KIND_UNCHANGED:
+            edited = (mapping1[i] is None or i in inserted1 or mapping2[j] is None or j in inserted2)
+            if not edited:
+                if region_start is not None:
+                    regions.append((region_start, index, i, j))
+                    region_start = None
+                boundary = index + 1
+            i += 1
+            j += 1
+        elif kind == _KIND_REMOVAL:
+            edited = mapping1[i] is None or i in inserted1
+            i += 1
+        else:
+            edited = mapping2[j] is None or j in inserted2
+            j += 1
+        if edited and region_start is None:
+            region_start = boundary
+
+    if region_start is None and (i in inserted1 or j in inserted2):
+        # Lines were appended
+        region_start = boundary
+    if region_start is not None:
+        regions.append((region_start, len(kinds), i, j))
+    return regions
+
+def _append_reused(results, kinds, links, start, end, text1, text2, line1, line2):
+    """Appends the unedited previous elements from start to end to the results.
+
+    line1 and line2 are the positions of their first lines in the inputs.
+    Modified rows are appended with their links shifted to the new
+    positions. Returns the line positions after the elements.
+    """
+    offset = len(results) - start
+    link_indices = sorted(links)
+    index = start
+    for kind, group in groupby(kinds[start:end]):
+        tag = _KIND_TAGS[kind]
+        run_end = index + sum(1 for _ in group)
+        while index < run_end:
+            # Runs are appended as a whole, up to the next modified row
+            position = bisect_left(link_indices, index)
+            next_link = link_indices[position] if position < len(link_indices) else run_end
+            length = min(run_end, next_link) - index
+            if length == 0:
+                relative_idx, diff_indices = links[index]
+                element_type = Removal if kind == _KIND_REMOVAL else Addition
+                content = text1[line1] if kind == _KIND_REMOVAL else text2[line2]
+                element = element_type(content, diff_indices, _matched_idx=index + relative_idx + offset)
+                length = 1
+            else:
+                element = None
+            results.append(tag, line1, line2, length, element)
+            index += length
+            if kind != _KIND_ADDITION:
+                line1 += length
+            if kind != _KIND_REMOVAL:
+                line2 += length
+    return line1, line2
+
+def diff_incremental(text1, text2, state_path, algorithm="myers", anchored=True):
+    """Computes the diff of the two given inputs, reusing the diff stored at state_path.
+
+    The result has the same form as differ.diff. If there is no usable state
+    (none yet, or stored with other options) the inputs are diffed from
+    scratch. Either way, the new result is stored at state_path for the next
+    run.
+    """
+    fingerprints1 = line_fingerprints(text1)
+    fingerprints2 = line_fingerprints(text2)
+    is_csv = looks_like_csv(text1, text2)
+    options = {"algorithm": algorithm, "anchored": anchored, "csv": is_csv}
+
+    state = _load_state(state_path)
+    if state is None or any(state[0].get(option) != value for option, value in options.items()):
+        results = diff(text1, text2, algorithm, anchored)
+        _save_state(state_path, options, fingerprints1, fingerprints2, results)
+        return results
+
+    header, previous1, previous2, kinds = state
+    links = {index: (relative_idx, _field_index_set(diff_indices))
+             for index, relative_idx, diff_indices in header["links"]}
+    mapping1, inserted1 = _line_mapping(previous1, fingerprints1)
+    mapping2, inserted2 = _line_mapping(previous2, fingerprints2)
+
+    # Reuse the previous elements between the edited regions and diff the
+    # regions again, shifting the links of modified rows to their new positions
+    results = DiffResult(text1, text2, csv_fields=is_csv)
+    reused_start = 0
+    line1 = line2 = 0
+    for start, end, end1, end2 in _edited_regions(kinds, mapping1, inserted1, mapping2, inserted2):
+        line1, line2 = _append_reused(results, kinds, links, reused_start, start,
+                                      text1, text2, line1, line2)
+        # The region ends before an unedited unchanged row, or at the end
+        region_end1 = mapping1[end1] if end < len(kinds) else len(text1)
+        region_end2 = mapping2[end2] if end < len(kinds) else len(text2)
+        if is_csv:
+            region = _paired_csv_elements(text1[line1:region_end1], text2[line2:region_end2],
+                                          algorithm, anchored)
+        else:
+            region = diff_traditional(text1[line1:region_end1], text2[line2:region_end2],
+                                      algorithm, anchored)
+        results.extend(region, line1, line2)
+        line1, line2 = region_end1, region_end2
+        reused_start = end
+    _append_reused(results, kinds, links, reused_start, len(kinds), text1, text2, line1, line2)
+
+    if is_csv:
+        results = _detect_moved_rows(results)
+
+    _save_state(state_path, options, fingerprints1, fingerprints2, results)
+    return results
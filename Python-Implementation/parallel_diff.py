@@ -0,0 +1,157 @@
+"""Computes diffs on several CPU cores.
+
+The inputs are split into independent partitions, which are diffed in a
+process pool. Positional diffs are cut at lines that occur exactly once in
+both inputs, keyed CSV diffs are partitioned by the hash of the key. The
+partial results are stitched back into one ordered diff.
+"""
+
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from alignment import intern_sequences, split_points
+from differ import (DiffResult, _detect_moved_rows, _keyed_elements, _paired_csv_elements, _parse_csv_line,
+                    _resolve_key_columns, _row_key, diff, diff_traditional, join_rows_on_key, looks_like_csv,
+                    parse_csv_rows)
+
+# Inputs with fewer lines than this aren't worth the overhead of a process pool.
+_MIN_PARALLEL_LINES = 10000
+
+# Number of partitions per worker, so that uneven partitions are balanced out.
+_PARTITIONS_PER_JOB = 4
+
+def _diff_chunk(args):
+    """Diffs one positional partition, without move detection. Runs in a worker process."""
+    text1, text2, is_csv, algorithm, anchored = args
+    if is_csv:
+        return _paired_csv_elements(text1, text2, algorithm, anchored)
+    return diff_traditional(text1, text2, algorithm, anchored)
+
+def _key_partition(key, partition_count):
+    """Returns the partition of a row key, the same in every process."""
+    return zlib.crc32("\x00".join(key).encode('utf-8')) % partition_count
+
+def _partition_lines(args):
+    """Parses a range of lines and returns the line indices of every key partition. Runs in a worker process."""
+    lines, start, key_indices, partition_count = args
+    partitions = [array('q') for _ in range(partition_count)]
+    for line, row in enumerate(parse_csv_rows(lines), start):
+        partitions[_key_partition(_row_key(row, key_indices), partition_count)].append(line)
+    return partitions
+
+def _join_partition(args):
+    """Parses and joins the lines of one key partition. Runs in a worker process.
+
+    Returns the matched pairs of line indices in the inputs, and the field
+    differences of the modified ones by their index in the second input.
+    """
+    lines1, lines2, indices1, indices2, key_indices1, key_indices2 = args
+    matched, field_differences = join_rows_on_key(parse_csv_rows(lines1), parse_csv_rows(lines2),
+                                                  key_indices1, key_indices2)
+    matched1 = array('q')
+    matched2 = array('q')
+    modified = {}
+    for local_j, local_i in enumerate(matched):
+        if local_i is not None:
+            matched1.append(indices1[local_i])
+            matched2.append(indices2[local_j])
+            if field_differences[local_j] is not None:
+                modified[indices2[local_j]] = field_differences[local_j]
+    return matched1, matched2, modified
+
+def _diff_positional_parallel(text1, text2, jobs, algorithm, anchored):
+    """Diffs the inputs in partitions cut at unique lines."""
+    ids1, ids2 = intern_sequences(text1, text2)
+    points = split_points(ids1, ids2, jobs * _PARTITIONS_PER_JOB - 1)
+    is_csv = looks_like_csv(text1, text2)
+
+    chunks = []
+    start1 = start2 = 0
+    for i, j in points + [(len(text1), len(text2))]:
+        chunks.append((text1[start1:i], text2[start2:j], is_csv, algorithm, anchored))
+        start1, start2 = i + 1, j + 1
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunk_results = list(executor.map(_diff_chunk, chunks))
+
+    # Stitch the partial diffs together, with the cut lines as unchanged rows
+    # in between. Links between modified rows are shifted to the new positions.
+    results = DiffResult(text1, text2, csv_fields=is_csv)
+    start1 = start2 = 0
+    for chunk_index, chunk_result in enumerate(chunk_results):
+        results.extend(chunk_result, start1, start2)
+        if chunk_index < len(points):
+            i, j = points[chunk_index]
+            results.append("equal", i, j)
+            start1, start2 = i + 1, j + 1
+
+    # Rows can move across partitions, so moves are detected over the whole result
+    if is_csv:
+        results = _detect_moved_rows(results)
+    return results
+
+def _line_ranges(lines, count):
+    """Splits the lines into count contiguous ranges, returns their (start, end) positions."""
+    size = -(-len(lines) // count)
+    return [(start, min(start + size, len(lines))) for start in range(0, len(lines), max(size, 1))]
+
+def _select_lines(lines, indices):
+    """Returns the lines at the given indices as a list."""
+    if len(indices) == 1:
+        return [lines[indices[0]]]
+    return list(itemgetter(*indices)(lines)) if indices else []
+
+def _diff_keyed_parallel(text1, text2, jobs, key_columns):
+    """Diffs the CSV inputs joined on their key, partitioned by key hash.
+
+    Only lines are sent to the workers, never parsed rows, as parsing them
+    again is cheaper than pickling them. The workers first parse ranges of
+    lines to find the partition of every row, then parse and join the lines
+    of every partition. Only the elements are built here, in the order of
+    the inputs.
+    """
+    key_indices1 = _resolve_key_columns(_parse_csv_line(text1[0]) if text1 else [], key_columns)
+    key_indices2 = _resolve_key_columns(_parse_csv_line(text2[0]) if text2 else [], key_columns)
+
+    # Rows with equal keys always end up in the same partition
+    partition_count = jobs * _PARTITIONS_PER_JOB
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        indices = []
+        for text, key_indices in ((text1, key_indices1), (text2, key_indices2)):
+            part_indices = [array('q') for _ in range(partition_count)]
+            for range_partitions in executor.map(_partition_lines, [
+                    (text[start:end], start, key_indices, partition_count)
+                    for start, end in _line_ranges(text, partition_count)]):
+                for part, range_part in zip(part_indices, range_partitions):
+                    part.extend(range_part)
+            indices.append(part_indices)
+
+        partition_results = executor.map(_join_partition, [
+            (_select_lines(text1, part1), _select_lines(text2, part2), part1, part2, key_indices1, key_indices2)
+            for part1, part2 in zip(*indices)])
+
+        # Merge the matches of the partitions, by the positions in the inputs
+        matched = [None] * len(text2)
+        field_differences = [None] * len(text2)
+        for matched1, matched2, modified in partition_results:
+            for i, j in zip(matched1, matched2):
+                matched[j] = i
+            for j, differences in modified.items():
+                field_differences[j] = differences
+
+    return _keyed_elements(text1, text2, None, None, matched, field_differences)
+
+def diff_parallel(text1, text2, jobs, algorithm="myers", anchored=True, key_columns=None):
+    """Computes the diff of the two given inputs using up to jobs processes.
+
+    The result has the same form as differ.diff. Keyed diffs are identical to
+    the sequential ones. Positional diffs are always cut at unique lines, like
+    with anchored set, so they might not be strictly minimal. Small inputs are
+    diffed sequentially.
+    """
+    if jobs <= 1 or max(len(text1), len(text2)) < _MIN_PARALLEL_LINES:
+        return diff(text1, text2, algorithm, anchored, key_columns)
+    if key_columns:
+        return _diff_keyed_parallel(text1, text2, jobs, key_columns)
+    return _diff_positional_parallel(text1, text2, jobs, algorithm, anchored)
@@ -0,0 +1,197 @@
+"""Machine-readable diff output formats.
+
+Both formats store one record per diff element, in order, so a diff can be
+written while it is computed and read back one element at a time:
+
+- JSON Lines: one JSON object per line, e.g.
+  {"type": "removal", "content": "1,a,b", "diff_indices": [2], "matched_idx": 4}
+  Keys whose value is the default (no diff indices, no link, not moved) are
+  left out. Line numbers are implicit in the order of the records, unless
+  they are given as "original_index" and "new_index" (e.g. for keyed diffs,
+  which aren't in the order of the first file).
+- Binary: the magic bytes b"DIFF" and a version byte, followed by one record
+  per element. A record starts with an opcode byte and a flags byte, then
+  the UTF-8 content and the flagged fields, all lengths and numbers encoded
+  as unsigned LEB128 varints.
+"""
+
+import json
+import struct
+from differ import Addition, Removal, Unchanged, _field_index_set
+
+_BINARY_MAGIC = b"DIFF"
+_BINARY_VERSION = 1
+
+_OPCODE_UNCHANGED = 0
+_OPCODE_ADDITION = 1
+_OPCODE_REMOVAL = 2
+
+_OPCODES = {"unchanged": _OPCODE_UNCHANGED, "addition": _OPCODE_ADDITION, "removal": _OPCODE_REMOVAL}
+_OPCODE_TYPES = {opcode: element_type for element_type, opcode in _OPCODES.items()}
+
+# Flags of a binary record, telling which optional fields follow the content.
+_FLAG_MOVED = 0x01
+_FLAG_MATCHED_IDX = 0x02
+_FLAG_DIFF_INDICES = 0x04
+_FLAG_ORIGINAL_INDEX = 0x08
+_FLAG_NEW_INDEX = 0x10
+
+_RECORD_HEADER = struct.Struct("BB")
+
+_ELEMENT_TYPES = {Unchanged: "unchanged", Addition: "addition", Removal: "removal"}
+
+def _element_record(element):
+    """Returns the fields of an element that are serialized, as a dict."""
+    record = {"type": _ELEMENT_TYPES[type(element)], "content": element.content}
+    diff_indices = getattr(element, '_diff_indices', None)
+    if diff_indices is not None:
+        record["diff_indices"] = sorted(diff_indices)
+    matched_idx = getattr(element, '_matched_idx', None)
+    if matched_idx is not None:
+        record["matched_idx"] = matched_idx
+    if element._is_moved:
+        record["moved"] = True
+    original_index = getattr(element, '_original_index', None)
+    if original_index is not None:
+        record["original_index"] = original_index
+    new_index = getattr(element, '_new_index', None)
+    if new_index is not None:
+        record["new_index"] = new_index
+    return record
+
+def _record_element(record):
+    """Creates the diff element for a record returned by _element_record."""
+    element_type = record["type"]
+    if element_type == "unchanged":
+        return Unchanged(record["content"],
+                         _is_moved=record.get("moved", False),
+                         _original_index=record.get("original_index"),
+                         _new_index=record.get("new_index"))
+    if element_type == "addition":
+        return Addition(record["content"], _field_index_set(record.get("diff_indices")),
+                        _matched_idx=record.get("matched_idx"),
+                        _is_moved=record.get("moved", False),
+                        _original_index=record.get("original_index"),
+                        _new_index=record.get("new_index"))
+    if element_type == "removal":
+        return Removal(record["content"], _field_index_set(record.get("diff_indices")),
+                       _matched_idx=record.get("matched_idx"),
+                       _is_moved=record.get("moved", False),
+                       _original_index=record.get("original_index"))
+    raise ValueError(f"Unknown element type: {element_type}")
+
+def write_jsonl(diff, f):
+    """Writes the diff elements to the text file f as JSON Lines."""
+    for element in diff:
+        f.write(json.dumps(_element_record(element), ensure_ascii=False))
+        f.write('\n')
+
+def read_jsonl(f):
+    """Yields the diff elements stored in the text file f by write_jsonl."""
+    for line in f:
+        if line.strip():
+            yield _record_element(json.loads(line))
+
+def _append_varint(buffer, value):
+    """Appends a non-negative integer as an unsigned LEB128 varint."""
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def _read_varint(data, position):
+    """Reads a varint at the given position, returns (value, next position)."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def write_binary(diff, f):
+    """Writes the diff elements to the binary file f in the compact binary format."""
+    f.write(_BINARY_MAGIC + bytes([_BINARY_VERSION]))
+    for element in diff:
+        record = _element_record(element)
+        flags = 0
+        buffer = bytearray()
+        content = record["content"].encode('utf-8')
+        _append_varint(buffer, len(content))
+        buffer += content
+        if record.get("moved"):
+            flags |= _FLAG_MOVED
+        if "matched_idx" in record:
+            flags |= _FLAG_MATCHED_IDX
+            _append_varint(buffer, record["matched_idx"])
+        if "diff_indices" in record:
+            flags |= _FLAG_DIFF_INDICES
+            _append_varint(buffer, len(record["diff_indices"]))
+            for index in record["diff_indices"]:
+                _append_varint(buffer, index)
+        if "original_index" in record:
+            flags |= _FLAG_ORIGINAL_INDEX
+            _append_varint(buffer, record["original_index"])
+        if "new_index" in record:
+            flags |= _FLAG_NEW_INDEX
+            _append_varint(buffer, record["new_index"])
+        f.write(_RECORD_HEADER.pack(_OPCODES[record["type"]], flags))
+        f.write(buffer)
+
+def read_binary(f):
+    """Yields the diff elements stored in the binary file f by write_binary.
+
+    The file is read in blocks, so arbitrarily large diffs can be processed
+    one element at a time.
+    """
+    header = f.read(len(_BINARY_MAGIC) + 1)
+    if header[:len(_BINARY_MAGIC)] != _BINARY_MAGIC:
+        raise ValueError("Not a binary diff file")
+    if header[len(_BINARY_MAGIC)] != _BINARY_VERSION:
+        raise ValueError(f"Unsupported binary diff version: {header[len(_BINARY_MAGIC)]}")
+
+    data = b""
+    position = 0
+    while True:
+        block = f.read(1 << 16)
+        if block:
+            data = data[position:] + block
+            position = 0
+        elif position == len(data):
+            return
+        # Parse all records that are complete, keep the rest for the next block
+        while position < len(data):
+            try:
+                start = position
+                opcode, flags = _RECORD_HEADER.unpack_from(data, position)
+                position += _RECORD_HEADER.size
+                length, position = _read_varint(data, position)
+                if position + length > len(data):
+                    raise IndexError
+                record = {"type": _OPCODE_TYPES[opcode],
+                          "content": data[position:position + length].decode('utf-8')}
+                position += length
+                if flags & _FLAG_MOVED:
+                    record["moved"] = True
+                if flags & _FLAG_MATCHED_IDX:
+                    record["matched_idx"], position = _read_varint(data, position)
+                if flags & _FLAG_DIFF_INDICES:
+                    index_count, position = _read_varint(data, position)
+                    diff_indices = []
+                    for _ in range(index_count):
+                        index, position = _read_varint(data, position)
+                        diff_indices.append(index)
+                    record["diff_indices"] = diff_indices
+                if flags & _FLAG_ORIGINAL_INDEX:
+                    record["original_index"], position = _read_varint(data, position)
+                if flags & _FLAG_NEW_INDEX:
+                    record["new_index"], position = _read_varint(data, position)
+            except (IndexError, struct.error):
+                # The record continues in the next block
+                position = start
+                if not block:
+                    raise ValueError("Truncated binary diff file")
+                break
+            yield _record_element(record)
@@ -0,0 +1,111 @@
+"""Summary statistics of diffing results, without rendering them."""
+
+import csv
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional
+from differ import Addition, Removal, Unchanged
+
+@dataclass
+class DiffStats:
+    """Counts of the changes in a diff."""
+    added_rows: int = 0
+    removed_rows: int = 0
+    modified_rows: int = 0
+    modified_cells: int = 0
+    moved_rows: int = 0
+    unchanged_rows: int = 0
+    column_changes: Counter = field(default_factory=Counter)  # Changed cells per column index
+    header: Optional[List[str]] = None  # Column names, if the first row is unchanged
+    complete: bool = True  # False if counting stopped early at the threshold
+
+    @property
+    def changed_rows(self):
+        """Number of rows that were added, removed or modified."""
+        return self.added_rows + self.removed_rows + self.modified_rows
+
+    def column_name(self, column):
+        """Returns the header name of a column, or its index if there is no header."""
+        if self.header is not None and column < len(self.header):
+            return self.header[column]
+        return str(column)
+
+    def to_dict(self):
+        """Returns the stats as a JSON serializable dict, most changed columns first."""
+        return {
+            "added_rows": self.added_rows,
+            "removed_rows": self.removed_rows,
+            "modified_rows": self.modified_rows,
+            "modified_cells": self.modified_cells,
+            "moved_rows": self.moved_rows,
+            "unchanged_rows": self.unchanged_rows,
+            "changed_rows": self.changed_rows,
+            "complete": self.complete,
+            "column_changes": [{"column": column, "name": self.column_name(column), "changes": changes}
+                               for column, changes in self.column_changes.most_common()],
+        }
+
+    def format(self, max_columns=10):
+        """Returns the stats as human readable text."""
+        lines = [
+            f"Added rows:     {self.added_rows}",
+            f"Removed rows:   {self.removed_rows}",
+            f"Modified rows:  {self.modified_rows}",
+            f"Modified cells: {self.modified_cells}",
+            f"Moved rows:     {self.moved_rows}",
+            f"Unchanged rows: {self.unchanged_rows}",
+        ]
+        if not self.complete:
+            lines.append("(stopped early, the changed rows exceed the threshold)")
+        if self.column_changes:
+            lines.append("")
+            lines.append("Most changed columns:")
+            for column, changes in self.column_changes.most_common(max_columns):
+                lines.append(f"  {self.column_name(column)}: {changes}")
+        return "\n".join(lines)
+
+def compute_stats(diff, max_changed_rows=None):
+    """Counts the changes in the given diff elements.
+
+    The diff can be any iterable, e.g. the stream of
+    external_diff.diff_csv_external. If max_changed_rows is given, counting
+    stops (and the stream is no longer consumed) as soon as more rows than
+    that were added, removed or modified; the result is then marked as not
+    complete.
+
+    A modified row counts once, at its Removal, and its changed fields are
+    added to the per-column histogram. Moved rows count once, at their new
+    place, also if they were modified, like in the totals of the
+    spreadsheet view.
+    """
+    stats = DiffStats()
+    for index, element in enumerate(diff):
+        if isinstance(element, Unchanged):
+            stats.unchanged_rows += 1
+            if index == 0:
+                stats.header = element._fields
+                if stats.header is None:
+                    stats.header = next(csv.reader([element.content]), [])
+            continue
+
+        if isinstance(element, Removal):
+            if element._matched_idx is not None:
+                stats.modified_rows += 1
+                if element._diff_indices:
+                    stats.modified_cells += len(element._diff_indices)
+                    stats.column_changes.update(element._diff_indices)
+            elif not element._is_moved:
+                stats.removed_rows += 1
+        elif isinstance(element, Addition):
+            if element._is_moved:
+                stats.moved_rows += 1
+            elif element._matched_idx is not None:
+                # Counted with its Removal
+                continue
+            else:
+                stats.added_rows += 1
+
+        if max_changed_rows is not None and stats.changed_rows > max_changed_rows:
+            stats.complete = False
+            break
+    return stats
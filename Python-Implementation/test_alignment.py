@@ -0,0 +1,81 @@
+"""Tests of the sequence alignment engines."""
+
+import random
+import pytest
+from alignment import (_MAX_HISTOGRAM_CHAIN, _lowest_occurrence_region, anchored_matches, bit_parallel_matches,
+                       histogram_matches, intern_sequences, myers_matches, split_points)
+from differ import _lcs_table_matches
+
+def _random_pair(seed, length=400, alphabet=30):
+    """Returns two related random sequences, with repeated and unique items."""
+    rng = random.Random(seed)
+    seq1 = [rng.randrange(alphabet) if rng.random() < 0.7 else f"unique{i}" for i in range(length)]
+    seq2 = []
+    for item in seq1:
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        if roll < 0.2:
+            seq2.append(rng.randrange(alphabet))
+        seq2.append(item)
+    return seq1, seq2
+
+def _anchored_myers(seq1, seq2):
+    return anchored_matches(seq1, seq2, myers_matches)
+
+# Engines that always return a longest common subsequence
+_MINIMAL_ENGINES = [myers_matches, bit_parallel_matches]
+_ENGINES = _MINIMAL_ENGINES + [histogram_matches, _anchored_myers]
+
+def _assert_common_subsequence(seq1, seq2, matches):
+    """Checks that the matches pair equal items in increasing order on both sides."""
+    for (i1, j1), (i2, j2) in zip(matches, matches[1:]):
+        assert i1 < i2 and j1 < j2
+    for i, j in matches:
+        assert seq1[i] == seq2[j]
+
+@pytest.mark.parametrize("engine", _ENGINES)
+@pytest.mark.parametrize("seed", range(5))
+def test_engines_return_common_subsequences(engine, seed):
+    seq1, seq2 = _random_pair(seed)
+    _assert_common_subsequence(seq1, seq2, engine(seq1, seq2))
+
+@pytest.mark.parametrize("engine", _MINIMAL_ENGINES)
+@pytest.mark.parametrize("seed", range(5))
+def test_minimal_engines_match_the_lcs_table(engine, seed):
+    seq1, seq2 = _random_pair(seed, length=150)
+    assert len(engine(seq1, seq2)) == len(_lcs_table_matches(seq1, seq2))
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_engines_handle_empty_and_disjoint_inputs(engine):
+    assert engine([], []) == []
+    assert engine([1, 2], []) == []
+    assert engine([], [1, 2]) == []
+    assert engine([1, 2], [3, 4]) == []
+    assert engine([1, 2, 3], [1, 2, 3]) == [(0, 0), (1, 1), (2, 2)]
+
+def test_bounded_myers_gives_up_beyond_max_edits():
+    seq1, seq2 = _random_pair(0)
+    edits = len(seq1) + len(seq2) - 2 * len(myers_matches(seq1, seq2))
+    assert myers_matches(seq1, seq2, edits) == myers_matches(seq1, seq2)
+    assert myers_matches(seq1, seq2, edits - 1) is None
+
+@pytest.mark.parametrize("occurrences, found", [(_MAX_HISTOGRAM_CHAIN, True), (_MAX_HISTOGRAM_CHAIN + 1, False)])
+def test_histogram_skips_items_above_the_occurrence_cap(occurrences, found):
+    seq1 = [0] * occurrences + [1]
+    seq2 = [2] + [0] * occurrences
+    positions = {0: list(range(occurrences)), 1: [occurrences]}
+    region = _lowest_occurrence_region(seq1, 0, len(seq1), seq2, 0, len(seq2), positions)
+    assert (region is not None) == found
+
+def test_intern_sequences_maps_equal_items_to_equal_ids():
+    ids1, ids2 = intern_sequences(["a", "b", "a"], ["b", "c"])
+    assert ids1[0] == ids1[2] != ids1[1] == ids2[0] != ids2[1]
+
+def test_split_points_are_unique_in_both_sequences():
+    seq1, seq2 = _random_pair(1, length=2000)
+    points = split_points(seq1, seq2, 3)
+    assert points
+    for i, j in points:
+        assert seq1[i] == seq2[j]
+        assert seq1.count(seq1[i]) == 1 and seq2.count(seq2[j]) == 1
@@ -0,0 +1,40 @@
+"""Tests of the command line tool."""
+
+import os
+import subprocess
+import sys
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def _run(*args):
+    """Runs diff.py with the given arguments, returns the completed process."""
+    return subprocess.run([sys.executable, "diff.py", *map(str, args)], cwd=_DIRECTORY, capture_output=True,
+                          text=True)
+
+def _write_csv(path, lines):
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+def test_identical_files_replace_the_report_with_a_small_one(tmp_path):
+    rows = ["id,name"] + [f"{i},name {i}" for i in range(1000)]
+    file1 = _write_csv(tmp_path / "old.csv", rows)
+    file2 = _write_csv(tmp_path / "new.csv", rows[:-1] + ["999,edited"])
+    report = tmp_path / "report.html"
+    assert _run(file1, file2, "--no_cache", "--output_file", report).returncode == 0
+    assert "edited" in report.read_text()
+
+    _write_csv(file2, rows)
+    result = _run(file1, file2, "--no_cache", "--output_file", report)
+    assert result.returncode == 0 and "identical" in result.stdout
+    html = report.read_text()
+    assert "The files are identical (1001 lines)" in html and "name 500" not in html
+
+def test_external_diffs_stream_the_simple_view_but_not_the_virtual_one(tmp_path):
+    file1 = _write_csv(tmp_path / "old.csv", ["id,name", "1,a", "2,b"])
+    file2 = _write_csv(tmp_path / "new.csv", ["id,name", "2,x", "3,c"])
+    report = tmp_path / "report.html"
+    assert _run(file1, file2, "--key", "id", "--external", "--simple_html", "--output_file", report).returncode == 0
+    assert "<td>c</td>" in report.read_text()
+
+    result = _run(file1, file2, "--key", "id", "--external", "--virtual_html", "--output_file", report)
+    assert result.returncode == 2 and "--virtual_html" in result.stderr
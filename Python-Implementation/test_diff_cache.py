@@ -0,0 +1,74 @@
+"""Tests of the on-disk diff result cache."""
+
+import os
+import time
+from diff_cache import DiffCache
+from differ import diff
+from test_differ import _random_csv
+
+def _write_inputs(tmp_path, seed):
+    text1, text2 = _random_csv(seed, length=200)
+    path1 = tmp_path / f"old{seed}.csv"
+    path2 = tmp_path / f"new{seed}.csv"
+    path1.write_text("\n".join(text1) + "\n")
+    path2.write_text("\n".join(text2) + "\n")
+    return path1, path2, diff(text1, text2)
+
+def _entries(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith(".diff"))
+
+def test_results_are_found_by_content_and_options(tmp_path):
+    cache = DiffCache(str(tmp_path / "cache"), 1 << 20)
+    path1, path2, diff_result = _write_inputs(tmp_path, 1)
+    key = cache.key(path1, path2, {"algorithm": "myers"})
+    assert cache.get(key) is None
+    cache.put(key, diff_result)
+    cached = cache.get(key)
+    assert cached == list(diff_result) and not cached.approximate
+    assert cache.get(cache.key(path1, path2, {"algorithm": "lcs"})) is None
+
+    # Another file with the same content has the same key
+    copy = tmp_path / "copy.csv"
+    copy.write_bytes(path1.read_bytes())
+    assert cache.key(copy, path2, {"algorithm": "myers"}) == key
+
+def test_the_approximate_flag_is_kept(tmp_path):
+    cache = DiffCache(str(tmp_path / "cache"), 1 << 20)
+    path1, path2, _ = _write_inputs(tmp_path, 2)
+    text1, text2 = _random_csv(2, length=200)
+    approximate = diff(text1, text2, max_edits=1)
+    assert approximate.approximate
+    key = cache.key(path1, path2, {"max_edits": 1})
+    cache.put(key, approximate)
+    assert cache.get(key).approximate
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache_dir = tmp_path / "cache"
+    inputs = [_write_inputs(tmp_path, seed) for seed in range(3)]
+    keys = [DiffCache(str(cache_dir), 1 << 20).key(path1, path2, {}) for path1, path2, _ in inputs]
+    cache = DiffCache(str(cache_dir), 1 << 20)
+    for key, (_, _, diff_result) in zip(keys, inputs):
+        cache.put(key, diff_result)
+        time.sleep(0.01)
+    entry_size = max(os.path.getsize(cache_dir / name) for name in _entries(cache_dir))
+
+    # Reading the first entry makes the second the least recently used one
+    assert cache.get(keys[0]) is not None
+    cache = DiffCache(str(cache_dir), 2 * entry_size + entry_size // 2)
+    cache._evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+
+def test_entries_larger_than_the_limit_are_not_stored(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = DiffCache(str(cache_dir), 1 << 20)
+    path1, path2, diff_result = _write_inputs(tmp_path, 4)
+    small_key = cache.key(path1, path2, {})
+    cache.put(small_key, diff_result[:10])
+
+    cache = DiffCache(str(cache_dir), os.path.getsize(cache_dir / _entries(cache_dir)[0]) * 2)
+    large_key = cache.key(path1, path2, {"large": True})
+    cache.put(large_key, diff_result)
+    assert cache.get(large_key) is None
+    assert cache.get(small_key) == diff_result[:10]
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(".tmp")]
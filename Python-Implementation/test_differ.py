@@ -0,0 +1,178 @@
+"""Tests of the line and CSV differ."""
+
+import os
+import random
+import subprocess
+import sys
+import tracemalloc
+from functools import lru_cache
+import pytest
+import differ
+from differ import Addition, Removal, Unchanged, _pair_modified_rows, diff
+
+def _random_lines(seed, length=600):
+    """Returns two versions of a random text with repeated and unique lines."""
+    rng = random.Random(seed)
+    text1 = [f"line {rng.randrange(40)}" if rng.random() < 0.5 else f"unique {i}" for i in range(length)]
+    text2 = []
+    for line in text1:
+        roll = rng.random()
+        if roll < 0.05:
+            continue
+        if roll < 0.1:
+            text2.append(f"new {rng.randrange(1000)}")
+        text2.append(line)
+    return text1, text2
+
+def _random_csv(seed, length=600):
+    """Returns two versions of a random CSV file with modified, moved, added and removed rows."""
+    rng = random.Random(seed)
+    rows = [f"{i},{rng.choice('abcde')}{rng.randrange(100)},{rng.randrange(1000)},x{rng.randrange(5)}"
+            for i in range(length)]
+    new_rows = list(rows)
+    for _ in range(length // 20):
+        new_rows.insert(rng.randrange(len(new_rows)), new_rows.pop(rng.randrange(len(new_rows))))
+    for _ in range(length // 20):
+        position = rng.randrange(len(new_rows))
+        fields = new_rows[position].split(',')
+        fields[2] = str(rng.randrange(1000, 2000))
+        new_rows[position] = ','.join(fields)
+    for _ in range(length // 40):
+        del new_rows[rng.randrange(len(new_rows))]
+        new_rows.insert(rng.randrange(len(new_rows)), f"{length + rng.randrange(1000)},new,0,x0")
+    return ["id,name,amount,x"] + rows, ["id,name,amount,x"] + new_rows
+
+def _old_lines(diff_result):
+    return [element.content for element in diff_result if not isinstance(element, Addition)]
+
+def _new_lines(diff_result):
+    return [element.content for element in diff_result if not isinstance(element, Removal)]
+
+def _assert_valid_links(diff_result):
+    """Checks that every modification link points to its counterpart."""
+    elements = list(diff_result)
+    for index, element in enumerate(elements):
+        matched_idx = getattr(element, '_matched_idx', None)
+        if matched_idx is not None:
+            other = elements[matched_idx]
+            assert isinstance(other, (Addition, Removal)) and type(other) is not type(element)
+            assert other._matched_idx == index
+
+@pytest.mark.parametrize("algorithm", ["myers", "lcs", "histogram", "lcs_table"])
+@pytest.mark.parametrize("anchored", [True, False])
+@pytest.mark.parametrize("make_inputs", [_random_lines, _random_csv])
+def test_every_algorithm_rebuilds_both_inputs(algorithm, anchored, make_inputs):
+    text1, text2 = make_inputs(3)
+    diff_result = diff(text1, text2, algorithm, anchored)
+    assert _old_lines(diff_result) == text1
+    assert _new_lines(diff_result) == text2
+    _assert_valid_links(diff_result)
+
+@pytest.mark.parametrize("algorithm", ["myers", "lcs", "lcs_table"])
+def test_minimal_algorithms_agree_on_the_edit_count(algorithm):
+    text1, text2 = _random_lines(4, length=200)
+    edits = sum(not isinstance(element, Unchanged) for element in diff(text1, text2, algorithm, anchored=False))
+    reference = sum(not isinstance(element, Unchanged)
+                    for element in diff(text1, text2, "lcs_table", anchored=False))
+    assert edits == reference
+
+@pytest.mark.parametrize("make_inputs", [_random_lines, _random_csv])
+def test_bounded_diffs_rebuild_both_inputs(make_inputs):
+    text1, text2 = make_inputs(5)
+    exact = diff(text1, text2, anchored=False)
+    edits = sum(not isinstance(element, Unchanged) for element in exact)
+
+    within = diff(text1, text2, max_edits=edits)
+    assert not within.approximate
+    assert sum(not isinstance(element, Unchanged) for element in within) == edits
+
+    beyond = diff(text1, text2, max_edits=edits // 4)
+    assert beyond.approximate
+    assert _old_lines(beyond) == text1
+    assert _new_lines(beyond) == text2
+
+def test_max_edits_rejects_other_backends():
+    with pytest.raises(ValueError):
+        diff(["a"], ["b"], "lcs", max_edits=1)
+
+def test_identical_inputs_are_unchanged():
+    text1, _ = _random_csv(6)
+    assert diff(text1, list(text1)) == [Unchanged(line) for line in text1]
+
+def test_csv_diffs_link_modified_and_moved_rows():
+    text1 = ["id,name,amount", "1,a,10", "2,b,20", "3,c,30", "4,d,40"]
+    text2 = ["id,name,amount", "4,d,40", "1,a,10", "2,b,25", "3,c,30"]
+    diff_result = diff(text1, text2)
+    assert [type(element) for element in diff_result] == [Unchanged, Addition, Unchanged, Removal, Addition,
+                                                           Unchanged, Removal]
+    moved = diff_result[1]
+    assert moved._is_moved and (moved._original_index, moved._new_index) == (5, 2)
+    assert diff_result[-1]._is_moved
+    assert diff_result[3]._diff_indices == {2} and diff_result[3]._matched_idx == 4
+    assert diff_result[2]._fields == ["1", "a", "10"]
+
+def test_csv_diffs_dont_keep_the_parsed_rows(monkeypatch):
+    monkeypatch.setattr(differ, "_cached_csv_line", lru_cache(maxsize=16)(differ._parse_csv_line))
+    text1 = ["id,name,amount"] + [f"{i},name {i},{i * 10}" for i in range(20000)]
+    text2 = list(text1)
+    text2[100] = "99,name 99,1"
+    tracemalloc.start()
+    try:
+        diff_result = diff(text1, text2)
+        assert all(element._fields is not None for element in diff_result)
+        # Only the modified rows are stored with their fields, so the result
+        # stays small next to its inputs even after every element was accessed
+        kept, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert kept < sum(map(sys.getsizeof, text1)) / 2
+
+def test_moved_rows_dont_depend_on_the_hash_seed():
+    script = ("import test_differ; from differ import diff; "
+              "print([index for index, element in enumerate(diff(*test_differ._random_csv(7))) "
+              "if element._is_moved])")
+    outputs = set()
+    for seed in ("1", "2"):
+        outputs.add(subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   env=dict(os.environ, PYTHONHASHSEED=seed), capture_output=True, text=True,
+                                   check=True).stdout)
+    assert len(outputs) == 1 and outputs != {"[]\n"}
+
+@pytest.mark.parametrize("changed_fields", [0, 1, 2, 3])
+def test_every_moved_row_with_few_changes_is_found(changed_fields):
+    rng = random.Random(changed_fields)
+    rows = [[str(rng.randrange(10 ** 9)) for _ in range(10)] for _ in range(2000)]
+    new_rows = [list(row) for row in rows]
+    moved = rng.sample(range(len(new_rows)), 200)
+    for position in moved:
+        for column in rng.sample(range(10), changed_fields):
+            new_rows[position][column] = "changed"
+    moved_rows = [new_rows[position] for position in moved]
+    new_rows = [row for position, row in enumerate(new_rows) if position not in set(moved)]
+    for row in moved_rows:
+        new_rows.insert(rng.randrange(len(new_rows) + 1), row)
+
+    diff_result = diff([",".join(row) for row in rows], [",".join(row) for row in new_rows])
+    assert sum(isinstance(element, Addition) and element._is_moved for element in diff_result) == 200
+    _assert_valid_links(diff_result)
+
+def test_small_hunks_keep_every_non_crossing_pair():
+    # Pairing removal 0 with addition 1 (same ID) would cross the two pairs
+    # differing in two fields each
+    removals = [['1', 'a', 'b', 'c', 'd', 'e'], ['2', 'f', 'g', 'h', 'i', 'j']]
+    additions = [['9', 'a', 'b', 'c', 'd', 'x'], ['1', 'f', 'g', 'h', 'i', 'y']]
+    assert [(r, a) for r, a, _, _ in _pair_modified_rows(removals, additions)] == [(0, 0), (1, 1)]
+
+def test_keyed_diffs_join_rows_on_the_key():
+    text1 = ["2,name", "1,a", "2,b", "3,c"]
+    text2 = ["2,name", "3,c", "2,x", "4,d"]
+    diff_result = diff(text1, text2, key_columns=["2"])
+    assert [(type(element), element.content) for element in diff_result] == [
+        (Unchanged, "2,name"), (Removal, "1,a"), (Unchanged, "3,c"), (Removal, "2,b"), (Addition, "2,x"),
+        (Addition, "4,d")]
+    assert diff_result[3]._diff_indices == {1}
+    _assert_valid_links(diff_result)
+
+def test_keyed_diffs_report_unknown_columns():
+    with pytest.raises(ValueError):
+        diff(["id,name"], ["id,name"], key_columns=["nope"])
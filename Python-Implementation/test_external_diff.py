@@ -0,0 +1,26 @@
+"""Tests that external memory diffs give the same results as keyed diffs in memory."""
+
+from differ import diff
+from external_diff import diff_csv_external
+from test_differ import _random_csv
+
+def _summary(elements):
+    """Returns the type, content, changed fields and line numbers of every element, in a canonical order."""
+    return sorted((type(element).__name__, element.content, sorted(getattr(element, '_diff_indices', None) or []),
+                   getattr(element, '_original_index', None) or 0, getattr(element, '_new_index', None) or 0)
+                  for element in elements)
+
+def test_external_diffs_match_the_keyed_diff(tmp_path):
+    text1, text2 = _random_csv(11, length=2000)
+    path1 = tmp_path / "old.csv"
+    path2 = tmp_path / "new.csv"
+    path1.write_text("\n".join(text1) + "\n")
+    path2.write_text("\n".join(text2) + "\n")
+
+    # A tiny memory limit, so that the rows are sorted in many runs
+    external = list(diff_csv_external(str(path1), str(path2), ["id"], memory_limit=4096,
+                                      temp_dir=str(tmp_path)))
+    assert _summary(external) == _summary(diff(text1, text2, key_columns=["id"]))
+    for index, element in enumerate(external):
+        if getattr(element, '_matched_idx', None) is not None:
+            assert external[element._matched_idx]._matched_idx == index
@@ -0,0 +1,40 @@
+"""Tests of incremental diffs."""
+
+import os
+import subprocess
+import sys
+from differ import Addition, Removal, diff
+from incremental import diff_incremental
+from test_differ import _random_csv
+
+def test_incremental_diffs_follow_edits(tmp_path):
+    state_path = str(tmp_path / "state")
+    text1, text2 = _random_csv(12)
+    assert diff_incremental(text1, text2, state_path) == diff(text1, text2)
+
+    # Append rows and edit one, only these regions are diffed again
+    text2 = text2[:100] + ["100,edited,1,x1"] + text2[101:] + ["5000,appended,2,x2"]
+    diff_result = diff_incremental(text1, text2, state_path)
+    assert [element.content for element in diff_result if not isinstance(element, Addition)] == text1
+    assert [element.content for element in diff_result if not isinstance(element, Removal)] == text2
+    assert diff_result == diff(text1, text2)
+
+def test_the_cli_updates_the_state_of_every_run(tmp_path):
+    text1, text2 = _random_csv(13)
+    edited = text2[:50] + ["50,edited,1,x1"] + text2[51:]
+    paths = {}
+    for name, lines in (("old", text1), ("new", text2), ("edited", edited)):
+        paths[name] = tmp_path / f"{name}.csv"
+        paths[name].write_text("\n".join(lines) + "\n")
+    state_path = tmp_path / "state"
+
+    def run(new_name):
+        subprocess.run([sys.executable, "diff.py", str(paths["old"]), str(paths[new_name]), "--format", "jsonl",
+                        "--incremental", str(state_path), "--cache_dir", str(tmp_path / "cache")],
+                       cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, check=True)
+        return state_path.read_bytes()
+
+    first_state = run("new")
+    assert run("edited") != first_state
+    # The same inputs as in the first run, the state must follow them again
+    assert run("new") == first_state
@@ -0,0 +1,37 @@
+"""Tests that parallel diffs give the same results as sequential ones."""
+
+import pytest
+import parallel_diff
+from differ import Addition, diff
+from parallel_diff import diff_parallel
+from test_differ import _random_csv, _random_lines
+
+@pytest.fixture(autouse=True)
+def _parallel_small_inputs(monkeypatch):
+    # Small inputs are diffed sequentially otherwise
+    monkeypatch.setattr(parallel_diff, "_MIN_PARALLEL_LINES", 0)
+
+@pytest.mark.parametrize("make_inputs", [_random_lines, _random_csv])
+def test_positional_diffs_match_the_sequential_diff(make_inputs):
+    text1, text2 = make_inputs(9, length=3000)
+    assert diff_parallel(text1, text2, 2) == diff(text1, text2)
+
+def test_rows_moved_across_partitions_are_found():
+    text1, text2 = _random_csv(9, length=3000)
+    # Moves the first row to the end, into the last partition
+    row = text2.pop(1)
+    text2.append(row)
+    moved = [(index, element._original_index, element._new_index)
+             for index, element in enumerate(diff_parallel(text1, text2, 2))
+             if isinstance(element, Addition) and element._is_moved]
+    assert (text1.index(row) + 1, len(text2)) in [(original, new) for _, original, new in moved]
+    assert moved == [(index, element._original_index, element._new_index)
+                     for index, element in enumerate(diff(text1, text2))
+                     if isinstance(element, Addition) and element._is_moved]
+
+def test_keyed_diffs_match_the_sequential_diff():
+    text1, text2 = _random_csv(10, length=3000)
+    parallel = diff_parallel(text1, text2, 2, key_columns=["id"])
+    sequential = diff(text1, text2, key_columns=["id"])
+    assert parallel == sequential
+    assert [element._fields for element in parallel] == [element._fields for element in sequential]
@@ -0,0 +1,37 @@
+"""Tests of the machine-readable output formats."""
+
+import io
+from differ import Addition, diff
+from serialization import read_binary, read_jsonl, write_binary, write_jsonl
+from test_differ import _random_csv
+
+def _sample_diff():
+    """Returns a CSV diff with unchanged, added, removed, modified and moved rows."""
+    text1, text2 = _random_csv(8)
+    text2.append('9999,"quoted, with comma",ünïcode,x1')
+    return diff(text1, text2)
+
+def test_jsonl_round_trip():
+    diff_result = _sample_diff()
+    f = io.StringIO()
+    write_jsonl(diff_result, f)
+    f.seek(0)
+    assert list(read_jsonl(f)) == list(diff_result)
+
+def test_binary_round_trip():
+    diff_result = _sample_diff()
+    assert any(element._is_moved for element in diff_result)
+    f = io.BytesIO()
+    write_binary(diff_result, f)
+    f.seek(0)
+    assert list(read_binary(f)) == list(diff_result)
+
+def test_keyed_diffs_keep_their_line_numbers():
+    text1, text2 = _random_csv(9)
+    diff_result = diff(text1, text2, key_columns=["id"])
+    f = io.BytesIO()
+    write_binary(diff_result, f)
+    f.seek(0)
+    elements = list(read_binary(f))
+    assert elements == list(diff_result)
+    assert all(element._original_index is not None for element in elements if not isinstance(element, Addition))
@@ -0,0 +1,62 @@
+"""Tests of the --stats summary and its changed-rows threshold."""
+
+import os
+import subprocess
+import sys
+from differ import diff
+from stats import compute_stats
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def _write_csv(path, lines):
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+def test_rows_are_counted_by_kind():
+    text1 = ["id,name,amount", "1,a,10", "2,b,20", "3,c,30", "4,d,40"]
+    text2 = ["id,name,amount", "4,d,40", "1,a,15", "2,b,20", "5,e,50"]
+    stats = compute_stats(diff(text1, text2))
+    assert (stats.added_rows, stats.removed_rows, stats.modified_rows, stats.moved_rows,
+            stats.unchanged_rows) == (1, 1, 1, 2, 2)
+    assert stats.modified_cells == 1 and stats.column_name(2) == "amount"
+    assert stats.complete
+
+def test_moved_and_modified_rows_count_as_modified_and_moved():
+    rows = [f"{i},name {i},{i * 10},x,y,z" for i in range(40)]
+    text1 = ["id,name,amount,a,b,c"] + rows
+    text2 = ["id,name,amount,a,b,c"] + rows[1:] + ["0,name 0,1,x,y,z"]
+    stats = compute_stats(diff(text1, text2))
+    assert (stats.modified_rows, stats.moved_rows, stats.added_rows, stats.removed_rows) == (1, 1, 0, 0)
+
+def test_counting_stops_beyond_the_threshold():
+    elements = iter(diff(["a", "b", "c", "d"], ["w", "x", "y", "z"]))
+    stats = compute_stats(elements, max_changed_rows=2)
+    assert not stats.complete and stats.changed_rows == 3
+    # The rest of the stream wasn't consumed
+    assert len(list(elements)) == 5
+
+def _run_stats(tmp_path, threshold, close_stdout=False):
+    file1 = _write_csv(tmp_path / "old.csv", ["id,name", "1,a", "2,b"])
+    file2 = _write_csv(tmp_path / "new.csv", ["id,name", "1,x", "3,c"])
+    process = subprocess.Popen([sys.executable, "diff.py", file1, file2, "--no_cache",
+                                "--fail_if_changed_rows", str(threshold)],
+                               cwd=_DIRECTORY, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if close_stdout:
+        # Like piping into head -0, the reader goes away before the output
+        process.stdout.close()
+        _, stderr = process.communicate()
+        output = None
+    else:
+        output, stderr = process.communicate()
+        output = output.decode()
+    assert b"Traceback" not in stderr
+    return process.returncode, output
+
+def test_the_exit_status_depends_on_the_threshold(tmp_path):
+    assert _run_stats(tmp_path, 10)[0] == 0
+    status, output = _run_stats(tmp_path, 1)
+    assert status == 1 and "Modified rows:  2" in output
+
+def test_a_closed_stdout_keeps_the_threshold_exit_status(tmp_path):
+    assert _run_stats(tmp_path, 10, close_stdout=True)[0] == 0
+    assert _run_stats(tmp_path, 1, close_stdout=True)[0] == 1
@@ -0,0 +1,117 @@
+"""Tests of the console and HTML views."""
+
+import io
+import json
+import os
+from differ import diff
+import pytest
+from visualization import (_CONSOLE_WRITE_BATCH, _iter_diff_lines, _iter_spreadsheet_rows, _mark_context,
+                           _write_virtual_payload, visualize_paginated_html, visualize_unified,
+                           visualize_unified_spreadsheet_html)
+
+def _csv_pair(length=100, changed=(50,)):
+    """Returns two versions of a CSV file with the given rows modified."""
+    text1 = ["id,name,amount"] + [f"{i},name {i},{i * 10}" for i in range(length)]
+    text2 = list(text1)
+    for i in changed:
+        text2[i + 1] = f"{i},name {i},{i * 10 + 1}"
+    return text1, text2
+
+def _keyed_diff():
+    text1 = ["id,name,amount", "1,a,10", "3,c,30", "2,b,20"]
+    text2 = ["id,name,amount", "2,b,25", "4,d,40", "3,c,30"]
+    return diff(text1, text2, key_columns=["id"])
+
+def test_keyed_diffs_show_the_line_numbers_of_both_files():
+    lines = list(_iter_diff_lines(_keyed_diff(), 1, show_line_numbers=True, combine_modifications=True))
+    assert [line for line in lines if "3,c,30" in line] == ["[3]    3,c,30"]
+    assert any(line.startswith("[4] →[2]  ±") for line in lines)
+
+def test_keyed_spreadsheet_rows_show_the_line_numbers_of_both_files():
+    diff_result = _keyed_diff()
+    rows = {fields[0]: (row_type, line_num_orig, line_num_mod)
+            for _, row_type, line_num_orig, line_num_mod, fields, _ in _iter_spreadsheet_rows(diff_result, diff_result)}
+    assert rows == {"id": ("unchanged", 1, 1), "1": ("removal", 2, None), "2": ("modified", 4, 2),
+                    "4": ("addition", None, 3), "3": ("unchanged", 3, 4)}
+
+def test_context_only_shows_unchanged_rows_near_changes():
+    rows = [(index, 'unchanged' if index not in (5, 6) else 'addition') for index in range(12)]
+    visible = [row[0] for shown, row in _mark_context(rows, 2) if shown]
+    assert visible == [3, 4, 5, 6, 7, 8]
+    # Every row is yielded once, in order
+    assert [row[0] for _, row in _mark_context(rows, 2)] == list(range(12))
+    assert [row[0] for shown, row in _mark_context(rows, 0) if shown] == [5, 6]
+
+def test_context_collapses_the_html_view_into_expandable_regions(tmp_path):
+    text1, text2 = _csv_pair(changed=(20, 80))
+    output_file = str(tmp_path / "report.html")
+    visualize_unified_spreadsheet_html(diff(text1, text2), True, output_file, context=3, expandable=True)
+    html = open(output_file).read()
+    # Before, between and after the two changes
+    assert html.count('class="collapsed"') == 3
+    assert [f"… {count} unchanged rows …" in html for count in (17, 53, 16)] == [True] * 3
+    assert "<td>name 50</td>" not in html and "<td>name 17</td>" in html
+    sidecar_dir = tmp_path / "report_rows"
+    assert sorted(os.listdir(sidecar_dir)) == ["rows_000001.js", "rows_000002.js", "rows_000003.js"]
+    assert "name 50" in (sidecar_dir / "rows_000002.js").read_text()
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_paginated_views_split_the_rows_into_pages(tmp_path, jobs):
+    text1, text2 = _csv_pair(length=95, changed=(10, 60))
+    output_file = str(tmp_path / "report.html")
+    visualize_paginated_html(diff(text1, text2), True, output_file, page_size=40, jobs=jobs)
+    pages = sorted(name for name in os.listdir(tmp_path) if name != "report.html")
+    assert pages == ["report_0001.html", "report_0002.html", "report_0003.html"]
+    # Every data row is on exactly one page
+    for i in range(95):
+        assert sum(f"<td>name {i}</td>" in (tmp_path / page).read_text() for page in pages) == 1
+    assert 'href="report_0002.html">Next' in (tmp_path / pages[0]).read_text()
+    assert "Next" not in (tmp_path / pages[2]).read_text()
+
+    index = (tmp_path / "report.html").read_text()
+    assert all(page in index for page in pages)
+    assert '<td>2-41</td><td>2-41</td><td class="info-added">0</td><td class="info-removed">0</td>' \
+           '<td class="info-modified">1</td>' in index
+    assert '<th>Total</th><th></th><th></th><th class="info-added">0</th><th class="info-removed">0</th>' \
+           '<th class="info-modified">2</th>' in index
+
+def test_the_spreadsheet_view_streams_any_iterable(tmp_path):
+    text1, text2 = _csv_pair(changed=(10, 60))
+    text2.insert(30, "1000,added,0")
+    del text2[80]
+    diff_result = diff(text1, text2)
+    visualize_unified_spreadsheet_html(diff_result, True, str(tmp_path / "list.html"))
+    visualize_unified_spreadsheet_html(iter(diff_result), True, str(tmp_path / "stream.html"))
+    html = (tmp_path / "stream.html").read_text()
+    assert html == (tmp_path / "list.html").read_text()
+    # The totals are filled in by the script at the end of the page
+    assert "getElementById('info-added').textContent = '1'" in html
+    assert "getElementById('info-removed').textContent = '1'" in html
+    assert "getElementById('info-modified').textContent = '2'" in html
+
+def test_the_virtual_payload_holds_every_row_and_old_value():
+    text1, text2 = _csv_pair(length=20, changed=(5,))
+    text2.append("1000,added")
+    diff_result = diff(text1, text2)
+    f = io.StringIO()
+    _write_virtual_payload(f, diff_result, True)
+    payload = json.loads(f.getvalue())
+
+    strings = payload["strings"]
+    rows = [[strings[column[row]] for column in payload["columns"] if column[row] >= 0]
+            for row in range(len(payload["types"]))]
+    assert [",".join(row) for row in rows] == text2[1:]
+    assert payload["header"] == ["id", "name", "amount"]
+    assert payload["lineOrig"][:3] == [2, 3, 4] and payload["lineMod"][-1] == 22
+    assert (payload["oldRows"], payload["oldColumns"]) == ([5], [2])
+    assert strings[payload["oldValues"][0]] == "50"
+    assert payload["types"] == "U" * 5 + "M" + "U" * 14 + "A" and payload["counts"] == [1, 0, 1, 0]
+
+def test_the_console_view_writes_every_line_in_batches(capsys):
+    text1, text2 = _csv_pair(length=_CONSOLE_WRITE_BATCH * 2, changed=(5,))
+    visualize_unified(diff(text1, text2), False)
+    lines = capsys.readouterr().out.splitlines()
+    body = lines[lines.index("Showing field-by-field diff with highlighted changes:") + 2:]
+    assert len([line for line in body if line]) == len(text1)
+    assert body[6].startswith("±  5,name 5,") and "→ 5,name 5," in body[6]
+    assert body[-1] == f"   {text1[-1]}"
@@ -3,8 +3,13 @@
 import math
 from differ import Addition, Removal, Unchanged
 import csv
-from io import StringIO
+import json
 import os
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 
 _TERM_CODE_RED = 31
 _TERM_CODE_GREEN = 32
@@ -15,6 +20,47 @@ _TERM_CODE_PURPLE = 35  # For indicating rows that are moved but unchanged
 # Represents a filler block for diff views.
 _EMPTY_FILLER_CHANGE = Unchanged("")
 
+# Kinds of diff elements, so that rendering dispatches with a single lookup.
+_KIND_UNCHANGED = 0
+_KIND_ADDITION = 1
+_KIND_REMOVAL = 2
+_ELEMENT_KINDS = {Unchanged: _KIND_UNCHANGED, Addition: _KIND_ADDITION, Removal: _KIND_REMOVAL}
+
+# Number of console lines that are joined into a single write.
+_CONSOLE_WRITE_BATCH = 4096
+
+# Size of the write buffer for HTML files, rows are written out in blocks of this size.
+_HTML_WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Style and script for the markers of collapsed unchanged rows. Expanding a
+# marker loads the sidecar script of its region, which passes the rows to
+# loadCollapsedRows. Scripts (unlike fetch) also load from file:// URLs.
+_COLLAPSED_ROWS_HTML = """
+    <style>
+        tr.collapsed td {
+            color: #8b949e;
+            background-color: #161b22;
+            text-align: center;
+            font-style: italic;
+        }
+        tr.collapsed a {
+            color: #58a6ff;
+        }
+    </style>
+    <script>
+        function expandCollapsedRows(region, src) {
+            const script = document.createElement('script');
+            script.src = src;
+            document.body.appendChild(script);
+        }
+        function loadCollapsedRows(region, rows) {
+            const marker = document.getElementById('collapsed-' + region);
+            marker.insertAdjacentHTML('afterend', rows.join(''));
+            marker.remove();
+        }
+    </script>
+"""
+
 def _color(content, term_code):
     """Colors the content using the given Terminal code."""
     return f"\x1b[{term_code}m{content}\x1b[0m"
@@ -45,211 +91,150 @@ def _highlight_segments(content, diff_indices):
         return content
     
     segments = content.split(',')
-    highlighted_segments = []
+    # Only the changed segments are touched, instead of testing every segment
+    for i in diff_indices:
+        if i < len(segments):
+            segments[i] = _yellow(segments[i])
     
-    for i, segment in enumerate(segments):
-        if i in diff_indices:
-            # Convert to string in case it's a numeric type
-            highlighted_segments.append(_yellow(str(segment)))
-        else:
-            highlighted_segments.append(segment)
-    
-    return ','.join(highlighted_segments)
+    return ','.join(segments)
 
-def _format_diff_lines(diff, pad=0, show_line_numbers=False, original_diff=None):
-    """Formats the lines of a diffing result with lines padded."""
-    result = []
+def _line_number(index, counted):
+    """Returns the line number an element carries, or the one counted along the elements.
 
-    num_digits = math.ceil(math.log(max(1, len(diff)), 10))
+    Elements of a positional diff are in the order of both inputs, so their
+    line numbers are counted. Keyed diffs list rows in another order, their
+    elements carry their line numbers in _original_index and _new_index.
+    """
+    return index if index is not None else counted
+
+def _iter_diff_lines(diff, num_digits, pad=0, show_line_numbers=False, combine_modifications=False):
+    """Yields the formatted lines of a diffing result one by one.
+
+    The diff can be any iterable of elements, line numbers are padded to
+    num_digits digits. They are counted along the elements, unless the
+    elements carry their own (see _line_number). With combine_modifications,
+    a modified row (a Removal directly followed by the Addition it is linked
+    to) is shown on a single line. Elements are dispatched on their kind with
+    one lookup each.
+    """
     prefix_format = f"[%.{num_digits}d] "
+    filler_prefix = " " * len(prefix_format % 0)
 
     line_num1 = 1  # For original file
     line_num2 = 1  # For new file
     spacing = " " * 2
-    # +1 to account for "+" and "-".
-    hidden_spacing = pad + len(spacing) + 1
-
-    for element in diff:
-        prefix = ""
-        if show_line_numbers:
-            if element is _EMPTY_FILLER_CHANGE:
-                prefix = " " * len(prefix_format % 0)
-            else:
-                # Determine which line number to show based on element type
-                if isinstance(element, Addition):
-                    # For additions, show line number from new file
-                    prefix = prefix_format % line_num2
-                    line_num2 += 1
-                elif isinstance(element, Removal):
-                    # For removals, show line number from original file
-                    prefix = prefix_format % line_num1
-                    line_num1 += 1
-                elif isinstance(element, Unchanged):
-                    # For unchanged lines, the decision is more complex
-                    if hasattr(element, '_is_moved') and element._is_moved:
-                        if hasattr(element, '_original_index') and element._original_index is not None:
-                            # If we have the original index, use it
-                            prefix = prefix_format % element._original_index
-                        else:
-                            # No original index info, use current counter
-                            prefix = prefix_format % line_num1
-                    else:
-                        # Regular unchanged element - use current counters
-                        prefix = prefix_format % line_num1
-                    
-                    # Increment both counters for unchanged lines
-                    line_num1 += 1
-                    line_num2 += 1
 
-        if isinstance(element, Addition):
-            # Check if this is a matched row (partial change)
-            is_matched = hasattr(element, '_matched_idx') and element._matched_idx is not None
-            
-            # Highlight specific segments if diff_indices are present
-            if hasattr(element, '_diff_indices') and element._diff_indices:
-                content_to_show = _highlight_segments(element.content, element._diff_indices)
-                
-                if is_matched:
-                    # Just show the content with highlighted changes (no green background)
-                    result.append(f"{prefix}+{spacing}{content_to_show.ljust(pad)}")
-                else:
-                    # Full green for unmatched additions
-                    result.append(_green(f"{prefix}+{spacing}{content_to_show.ljust(pad)}"))
-            else:
-                # No specific field highlighting
-                result.append(_green(f"{prefix}+{spacing}{element.content.ljust(pad)}"))
-        elif isinstance(element, Removal):
-            # Check if this is a matched row (partial change)
-            is_matched = hasattr(element, '_matched_idx') and element._matched_idx is not None
-            
-            # Check if this is a combined modification to be displayed on one line
-            if hasattr(element, '_is_combined_mod') and element._is_combined_mod:
-                # Get both indices
-                old_index = line_num1
-                if hasattr(element, '_combined_new_index') and original_diff is not None:
-                    # Get the addition from the original diff
-                    from_index = element._combined_new_index
-                    # Create a combined format with both indices
-                    old_prefix = prefix_format % old_index
-                    # Calculate approximate new index - it may not be exact
-                    new_prefix = prefix_format % line_num2
-                    combined_prefix = f"{old_prefix}→{new_prefix}"
-                    
-                    # Get the addition element and its content
-                    addition_content = None
-                    if from_index < len(original_diff) and isinstance(original_diff[from_index], Addition):
-                        addition_content = original_diff[from_index].content
-                    
-                    # Create a combined display with both the removal and addition content
-                    if addition_content:
-                        # Build a side-by-side comparison within the same line
-                        combined_content = f"{element.content} → {addition_content}"
-                        
-                        # If there are specific field differences, highlight them
-                        if hasattr(element, '_diff_indices') and element._diff_indices:
-                            # First highlight the removal part
-                            removal_content = _highlight_segments(element.content, element._diff_indices)
-                            # Then highlight the addition part
-                            addition_content = _highlight_segments(addition_content, element._diff_indices)
-                            combined_content = f"{removal_content} → {addition_content}"
-                        
-                        # Display the combined line with both indices
-                        result.append(f"{combined_prefix} ±{spacing}{combined_content.ljust(pad)}")
-                    else:
-                        # Fall back to normal display if something went wrong
-                        result.append(_red(f"{prefix}-{spacing}{element.content.ljust(pad)}"))
-                else:
-                    # Fall back to normal display
-                    result.append(_red(f"{prefix}-{spacing}{element.content.ljust(pad)}"))
-                
-                # Increment line counter for the addition we're combining
+    def pad_content(content):
+        return content.ljust(pad) if pad else content
+
+    def removal_line(element, prefix):
+        # Rows that moved away unchanged are shown in purple
+        if element._is_moved and element._matched_idx is None:
+            return _purple(f"{prefix}-{spacing}{pad_content(element.content)}")
+        content_to_show = _highlight_segments(element.content, element._diff_indices)
+        if element._diff_indices and element._matched_idx is not None:
+            # Just show the content with highlighted changes (no red background)
+            return f"{prefix}-{spacing}{pad_content(content_to_show)}"
+        # Full red for unmatched removals
+        return _red(f"{prefix}-{spacing}{pad_content(content_to_show)}")
+
+    # (index, element, line number) of a Removal that may be combined with the next element
+    pending = None
+
+    for index, element in enumerate(diff):
+        kind = _ELEMENT_KINDS[type(element)]
+
+        if pending is not None:
+            pending_index, removal, removal_line_num = pending
+            pending = None
+            if kind == _KIND_ADDITION:
+                # Combined modification, with both line numbers
+                combined_prefix = ""
+                if show_line_numbers:
+                    addition_line_num = _line_number(element._new_index, line_num2)
+                    combined_prefix = f"{prefix_format % removal_line_num}→{prefix_format % addition_line_num} "
                 line_num2 += 1
-                
-                # Skip this element's normal processing
+                removal_content = _highlight_segments(removal.content, removal._diff_indices)
+                addition_content = _highlight_segments(element.content, removal._diff_indices)
+                yield f"{combined_prefix}±{spacing}{pad_content(f'{removal_content} → {addition_content}')}"
                 continue
-            
-            # Highlight specific segments if diff_indices are present
-            if hasattr(element, '_diff_indices') and element._diff_indices:
-                content_to_show = _highlight_segments(element.content, element._diff_indices)
-                
-                if is_matched:
-                    # Just show the content with highlighted changes (no red background)
-                    result.append(f"{prefix}-{spacing}{content_to_show.ljust(pad)}")
-                else:
-                    # Full red for unmatched removals
-                    result.append(_red(f"{prefix}-{spacing}{content_to_show.ljust(pad)}"))
-            else:
-                # No specific field highlighting
-                result.append(_red(f"{prefix}-{spacing}{element.content.ljust(pad)}"))
-        elif isinstance(element, Unchanged):
-            # Check if this row is marked as moved
-            if hasattr(element, '_is_moved') and element._is_moved:
-                # Show moved rows in purple to make them stand out
-                # For unified view, show both original and new indices
-                if hasattr(element, '_original_index') and hasattr(element, '_new_index'):
-                    # Show both indices
-                    original_prefix = prefix_format % element._original_index
-                    new_prefix = prefix_format % element._new_index
-                    # Combined format: [old→new]
-                    display_prefix = f"{original_prefix}" + "→ " + f"{new_prefix}"
-                    # Replace the calculated prefix with our custom one
-                    result.append(_purple(f"{display_prefix} ~{spacing}{element.content.ljust(pad)}"))
-                else:
-                    # No indices information available
-                    result.append(_purple(f"{prefix}~{spacing}{element.content.ljust(pad)}"))
+            yield removal_line(removal, prefix_format % removal_line_num if show_line_numbers else "")
+
+        if element is _EMPTY_FILLER_CHANGE:
+            prefix = filler_prefix if show_line_numbers else ""
+            yield f"{prefix} {spacing}{pad_content(element.content)}"
+        elif kind == _KIND_UNCHANGED:
+            prefix = prefix_format % _line_number(element._original_index, line_num1) if show_line_numbers else ""
+            line_num1 += 1
+            line_num2 += 1
+            if element._is_moved:
+                # Show moved rows in purple with both indices, if known
+                if element._original_index is not None and element._new_index is not None:
+                    prefix = f"{prefix_format % element._original_index}→ {prefix_format % element._new_index} "
+                yield _purple(f"{prefix}~{spacing}{pad_content(element.content)}")
             else:
                 # Regular unchanged row
-                result.append(f"{prefix} {spacing}{element.content.ljust(pad)}")
-
-    return result
+                yield f"{prefix} {spacing}{pad_content(element.content)}"
+        elif kind == _KIND_ADDITION:
+            # For additions, show line number from new file
+            prefix = prefix_format % _line_number(element._new_index, line_num2) if show_line_numbers else ""
+            line_num2 += 1
+            is_matched = element._matched_idx is not None
+
+            # Rows that moved here unchanged are shown in purple, with both indices
+            if element._is_moved and not is_matched:
+                if show_line_numbers and element._original_index is not None and element._new_index is not None:
+                    prefix = f"{prefix_format % element._original_index}→ {prefix_format % element._new_index}"
+                yield _purple(f"{prefix}+{spacing}{pad_content(element.content)}")
+            elif element._diff_indices and is_matched:
+                # Just show the content with highlighted changes (no green background)
+                yield f"{prefix}+{spacing}{pad_content(_highlight_segments(element.content, element._diff_indices))}"
+            else:
+                # Full green for unmatched additions
+                yield _green(f"{prefix}+{spacing}{pad_content(_highlight_segments(element.content, element._diff_indices))}")
+        else:
+            # For removals, show line number from original file
+            removal_line_num = _line_number(element._original_index, line_num1)
+            line_num1 += 1
+            if combine_modifications and element._matched_idx == index + 1:
+                pending = (index, element, removal_line_num)
+                continue
+            yield removal_line(element, prefix_format % removal_line_num if show_line_numbers else "")
+
+    if pending is not None:
+        _, removal, removal_line_num = pending
+        yield removal_line(removal, prefix_format % removal_line_num if show_line_numbers else "")
+
+def _write_console_lines(lines):
+    """Writes the lines to stdout, joined into large blocks instead of one write per line."""
+    write = sys.stdout.write
+    write("\nShowing field-by-field diff with highlighted changes:\n\n")
+    while True:
+        batch = list(islice(lines, _CONSOLE_WRITE_BATCH))
+        if not batch:
+            break
+        batch.append('')
+        write('\n'.join(batch))
+    sys.stdout.flush()
 
 def visualize_unified(diff, show_line_numbers):
-    """Visualizes a diffing result in a unified view."""
-    from differ import Removal  # Import the class to create new instances
-    
-    # Process the diff to combine modification pairs (removal followed by addition)
-    processed_diff = []
-    i = 0
-    
-    while i < len(diff):
-        element = diff[i]
-        
-        # Check for paired modifications (removal followed by addition)
-        if (i < len(diff) - 1 and 
-            isinstance(element, Removal) and 
-            isinstance(diff[i+1], Addition)):
-            
-            # If they have matched indices pointing to each other
-            if (hasattr(element, '_matched_idx') and 
-                element._matched_idx is not None and
-                element._matched_idx == i+1):
-                
-                # Create a new Removal with the combined flag set
-                new_removal = Removal(
-                    content=element.content,
-                    _diff_indices=element._diff_indices if hasattr(element, '_diff_indices') else None,
-                    _matched_idx=element._matched_idx,
-                    _is_moved=element._is_moved if hasattr(element, '_is_moved') else False,
-                    _is_combined_mod=True,
-                    _combined_new_index=i+1
-                )
-                
-                processed_diff.append(new_removal)
-                i += 2  # Skip both elements
-                continue
-            
-        # Regular element - add as is
-        processed_diff.append(element)
-        i += 1
-    
-    # Now format the lines
-    diff_lines = _format_diff_lines(processed_diff,
-                                   show_line_numbers=show_line_numbers,
-                                   original_diff=diff)  # Pass the original diff for reference
-    
-    print("\nShowing field-by-field diff with highlighted changes:\n")
-    for line in diff_lines:
-        print(line)
+    """Visualizes a diffing result in a unified view.
+
+    Modified rows are shown on a single line with the changed fields
+    highlighted.
+    """
+    num_digits = math.ceil(math.log(max(1, len(diff)), 10))
+    _write_console_lines(_iter_diff_lines(diff, num_digits, show_line_numbers=show_line_numbers,
+                                          combine_modifications=True))
+
+def visualize_unified_stream(diff, show_line_numbers, num_digits=8):
+    """Visualizes a stream of diffing results in a unified view.
+
+    Unlike visualize_unified, the diff can be any iterable (e.g. a generator)
+    and lines are written out as their elements arrive. Modified rows are
+    shown as highlighted removal and addition lines instead of being combined.
+    """
+    _write_console_lines(_iter_diff_lines(diff, num_digits, show_line_numbers=show_line_numbers))
 
 def _html_color(content, css_class):
     """Wraps content in a span with the specified CSS class."""
@@ -271,160 +256,33 @@ def _html_purple(content):
     """Wraps content in a span with the moved CSS class."""
     return _html_color(content, "moved")
 
-def _html_highlight_segments(content, diff_indices):
-    """Highlights specific comma-separated segments in the content string with HTML."""
-    if not diff_indices:
-        return content
-    
-    segments = content.split(',')
-    highlighted_segments = []
-    
-    for i, segment in enumerate(segments):
-        if i in diff_indices:
-            # Convert to string in case it's a numeric type
-            highlighted_segments.append(_html_yellow(str(segment)))
-        else:
-            highlighted_segments.append(segment)
-    
-    return ','.join(highlighted_segments)
+def _element_fields(element):
+    """Returns the CSV fields of a diff element.
 
-def visualize_unified_html(diff, show_line_numbers, output_file="diff_output.html"):
-    """Generates an HTML visualization of the diffing result."""
-    from differ import Removal, Addition, Unchanged
-    import csv
-    from io import StringIO
-    
-    # Create a dictionary to store rows by their ID
-    rows_by_id = {}
-    
-    # Extract CSV fields from each element for easier processing
-    element_fields = {}
-    for i, element in enumerate(diff):
-        if isinstance(element, (Removal, Addition, Unchanged)):
-            with StringIO(element.content) as f:
-                reader = csv.reader(f)
-                try:
-                    fields = next(reader)
-                    element_fields[i] = fields
-                except StopIteration:
-                    element_fields[i] = []  # Empty line
-    
-    # First pass - collect all rows by ID and track their positions
-    for i, element in enumerate(diff):
-        if isinstance(element, (Removal, Addition, Unchanged)):
-            # Extract ID from the first column (assuming CSV format)
-            parts = element.content.split(',')
-            if len(parts) > 0:
-                row_id = parts[0]
-                if row_id not in rows_by_id:
-                    rows_by_id[row_id] = []
-                # Store the element, its index, and type
-                elem_type = 'removal' if isinstance(element, Removal) else 'addition' if isinstance(element, Addition) else 'unchanged'
-                rows_by_id[row_id].append({
-                    'element': element,
-                    'index': i,
-                    'type': elem_type
-                })
-    
-    # Build a list of elements to display (with special handling for modified rows)
-    display_elements = []
-    processed_indices = set()
-    
-    # First, process elements in their original order
-    for i, element in enumerate(diff):
-        if i in processed_indices:
-            continue
-            
-        if isinstance(element, Removal):
-            # Check if this is part of a modification (has a matching addition with same ID)
-            parts = element.content.split(',')
-            if len(parts) > 0:
-                row_id = parts[0]
-                # Find if there's a corresponding addition
-                has_matching_addition = False
-                addition_index = None
-                
-                for entry in rows_by_id.get(row_id, []):
-                    if entry['type'] == 'addition' and entry['index'] > i:
-                        has_matching_addition = True
-                        addition_index = entry['index']
-                        break
-                
-                if has_matching_addition and addition_index is not None:
-                    # This is a modified row - handle specially
-                    addition = diff[addition_index]
-                    
-                    # Compute the differences
-                    removal_fields = element_fields.get(i, [])
-                    addition_fields = element_fields.get(addition_index, [])
-                    
-                    diff_indices = []
-                    for idx, (r_field, a_field) in enumerate(zip(removal_fields, addition_fields)):
-                        if r_field != a_field:
-                            diff_indices.append(idx)
-                        
-                    # Create a special display element
-                    display_elements.append({
-                        'type': 'modified',
-                        'removal': element,
-                        'addition': addition,
-                        'diff_indices': diff_indices,
-                        'row_id': row_id,
-                        'removal_fields': removal_fields,
-                        'addition_fields': addition_fields
-                    })
-                    
-                    # Mark both indices as processed
-                    processed_indices.add(i)
-                    processed_indices.add(addition_index)
-                    continue
-        
-        # If not handled as a special case, add the element as is
-        if i not in processed_indices:
-            display_elements.append({
-                'type': element.__class__.__name__.lower(),
-                'element': element,
-                'fields': element_fields.get(i, [])
-            })
-            processed_indices.add(i)
-    
-    # Get header row (field names)
-    header_row_fields = []
-    max_field_count = max(len(fields) for fields in element_fields.values()) if element_fields else 0
-
-    # Check if the header itself was modified (Removal at index 0, Addition at index 1)
-    header_modified = False
-    if (len(diff) >= 2 and 
-        isinstance(diff[0], Removal) and 
-        isinstance(diff[1], Addition)):
-        # Basic check assumes first R/A pair is header change. Could be more robust.
-        header_modified = True
-
-    if header_modified:
-        # Use the fields from the new header (Addition at index 1)
-        header_row_fields = element_fields.get(1, [])
-    elif element_fields: # Header not modified, use original logic
-        first_row_fields = element_fields.get(0)
-        # Try to use first row if it looks like a header, otherwise generate
-        if first_row_fields and any(h.lower() in ['id', 'name', 'date', 'col'] for h in first_row_fields if isinstance(h, str)):
-             header_row_fields = first_row_fields
-    
-    # If no specific header fields determined, generate generic ones
-    if not header_row_fields:
-        header_row_fields = [f'Col_{i+1}' for i in range(max_field_count)]
-    
-    # Ensure max_field_count reflects the chosen header, or the max seen
-    max_field_count = max(max_field_count, len(header_row_fields))
+    The rows parsed while diffing are reused. Only elements without them, e.g.
+    from a line-based diff, are parsed here.
+    """
+    if element._fields is not None:
+        return element._fields
+    try:
+        return next(csv.reader([element.content]), [])
+    except csv.Error:
+        return element.content.split(',')
 
-    # Generate HTML for header cells
-    header_cells_html = "\n".join([f'<th>{str(header)}</th>' for header in header_row_fields]) # Ensure header is string
-    # -------------------------------------
+def visualize_unified_html(diff, show_line_numbers, output_file="diff_output.html", context=None, expandable=False):
+    """Generates an HTML visualization of the diffing result.
 
-    # --- HTML Generation --- 
-    html_content = []
-    
-    # Start with the HTML structure and CSS
-    html_content.append("""<!DOCTYPE html>
+    Like visualize_unified_spreadsheet_html, the rows are written out while
+    the diff is consumed. See there for context and expandable.
+    """
+    elements = iter(diff)
+    first_elements = list(islice(elements, 2))
+    _, max_field_count = _header_row_fields(first_elements)
+    rows = _iter_spreadsheet_rows(chain(first_elements, elements), diff)
+
+    with open(output_file, 'w', buffering=_HTML_WRITE_BUFFER_SIZE) as f:
+        # Start with the HTML structure and CSS
+        f.write("""<!DOCTYPE html>
 <html>
 <head>
     <title>CSV Diff Results</title>
@@ -709,82 +567,27 @@ def visualize_unified_html(diff, show_line_numbers, output_file="diff_output.htm
                 </thead>
                 <tbody>
 """)
-    
-    # Initialize line numbers
-    line_num1 = 1  # For original file
-    line_num2 = 1  # For new file
-    
-    # Process each element for display
-    for element in display_elements:
-        # --- Skip rendering the original header row in the data body ---
-        if element.get('original_index') == 0: 
-            # Check if the first element is the header, assuming header is always at original index 0
-            # This prevents duplicating the header row shown in the sticky thead
-            continue 
-        # --------------------------------------------------------------
-
-        element_type = element['type']
-        row_class = element_type # Use type directly as class (e.g., 'modified', 'addition')
-        html_content.append(f'<tr class="{row_class}">\n')
-        
-        # Status column
-        status_text = element_type.capitalize()
-        status_class = f"{element_type}-text" # e.g., modified-text
-        html_content.append(f'<td class="status-col {status_class}">{status_text}</td>\n')
-        
-        # Line numbers if enabled
-        if show_line_numbers:
-            orig_num_display = element.get('line_num_orig', '')
-            mod_num_display = element.get('line_num_mod', '')
-            
-            orig_class = "removal-text" if element_type in ['removal', 'modified'] else ""
-            mod_class = "addition-text" if element_type in ['addition', 'modified'] else ""
-            
-            html_content.append(f'<td class="line-num line-num-left center-align {orig_class}">{orig_num_display}</td>\n')
-            html_content.append(f'<td class="line-num line-num-right center-align {mod_class}">{mod_num_display}</td>\n')
-        
-        # Field content
-        if element_type == 'modified':
-            for field in element['merged_fields']:
-                if field['changed']:
-                    old_display = f'<span class="empty-cell">(empty)</span>' if field["old"] == '' else field["old"]
-                    new_display = f'<span class="empty-cell">(empty)</span>' if field["new"] == '' else field["new"]
-                    html_content.append(f'<td><span class="removal-text">{old_display}</span> <span class="arrow">-></span> <span class="addition-text">{new_display}</span></td>\n')
-                else:
-                    value = field.get("value", "")
-                    display = f'<span class="empty-cell">(empty)</span>' if value == '' else value
-                    html_content.append(f'<td>{display}</td>\n')
-            # Add empty cells if needed
-            for _ in range(max_field_count - len(element['merged_fields'])):
-                html_content.append('<td></td>\n')
-        else:
-            fields_to_display = element.get('fields', [])
-            for field in fields_to_display:
-                display = f'<span class="empty-cell">(empty)</span>' if field == '' else field
-                html_content.append(f'<td>{display}</td>\n')
-            # Add empty cells if needed
-            for _ in range(max_field_count - len(fields_to_display)):
-                html_content.append('<td></td>\n')
-        
-        html_content.append('</tr>\n')
-    
-    # Close the HTML
-    html_content.append("""
+
+        _write_table_rows(f, rows, show_line_numbers, max_field_count, context,
+                          _sidecar_dir(output_file) if expandable else None)
+
+        # Close the HTML
+        f.write("""
                 </tbody>
             </table>
         </div> 
     </div> 
+""" + (_COLLAPSED_ROWS_HTML if context is not None else "") + """
 </body>
 </html>""")
     
-    # Write to file
-    with open(output_file, 'w') as f:
-        f.write('\n'.join(html_content))
-    
     print(f"\nHTML diff output saved to {output_file}\n")
     
     return output_file
 
+# Changes of the rows that aren't modified, never written to.
+_NO_CHANGES = {}
+
 # --- Helper function for generating table cells --- 
 def _generate_td(field_value):
     """Generates a <td> element, handling empty values."""
@@ -800,559 +603,1135 @@ def _generate_modified_td(old_val, new_val):
     return f'<td><span class="removal-text">{old_display}</span> <span class="arrow">-></span> <span class="addition-text">{new_display}</span></td>'
 # -----------------------------------------------
 
-def visualize_unified_spreadsheet_html(diff, show_line_numbers, output_file="diff_output_unified_spreadsheet.html"):
-    """Generates an HTML visualization of the diffing result in a unified spreadsheet-like format."""
-    # Removed: from differ import Removal, Addition, Unchanged (already imported at top)
-    # Removed: import csv, io, os (already imported at top)
-
-    processed_indices = set()
-    display_elements = []
-    element_fields = {}
-    temp_pos_data = {} # Dictionary to store temporary position data
-
-    # --- Pass 1: Calculate Correct Line Numbers & Parse Fields ---
+def _iter_spreadsheet_rows(elements, diff):
+    """Yields the rows of the spreadsheet view for the given diff elements.
+
+    Every row is a tuple (index, row_type, line_num_orig, line_num_mod, fields,
+    changes), where index is the position of the (first) element of the row in
+    the diff. A Removal and the Addition it is linked to through _matched_idx
+    are merged into a single 'modified' row, its fields are the new values and
+    changes maps the index of every changed field to its old value. Line
+    numbers are counted like in _iter_diff_lines. The elements are consumed
+    one by one, only a Removal is held back until the next element shows
+    whether it was modified.
+    """
     original_pos_counter = 1
     modified_pos_counter = 1
-    for i, element in enumerate(diff):
-        current_original_pos = None
-        current_modified_pos = None
+    # (index, removal, line number) of a Removal waiting for its Addition
+    pending = None
+
+    def removal_row(index, removal, line_num_orig):
+        fields = _element_fields(removal)
+        row_type = 'moved' if removal._is_moved else 'removal'
+        return index, row_type, line_num_orig, None, fields, _NO_CHANGES
+
+    def modified_row(index, removal, addition, line_num_orig, line_num_mod):
+        removal_fields = _element_fields(removal)
+        addition_fields = _element_fields(addition)
+        field_count = max(len(removal_fields), len(addition_fields))
+        fields = addition_fields + [''] * (field_count - len(addition_fields))
+        changes = {}
+        for field_idx in sorted(removal._diff_indices):
+            if field_idx < field_count:
+                changes[field_idx] = removal_fields[field_idx] if field_idx < len(removal_fields) else ''
+        return index, 'modified', line_num_orig, line_num_mod, fields, changes
+
+    for i, element in enumerate(elements):
+        if pending is not None:
+            pending_index, removal, line_num_orig = pending
+            pending = None
+            if isinstance(element, Addition) and element._matched_idx == pending_index:
+                yield modified_row(pending_index, removal, element, line_num_orig,
+                                   _line_number(element._new_index, modified_pos_counter))
+                modified_pos_counter += 1
+                continue
+            print(f"Warning: Invalid link found for Removal at index {pending_index}. Linked index: {i}")
+            yield removal_row(pending_index, removal, line_num_orig)
 
-        # Determine line numbers based on element type
         if isinstance(element, Removal):
-            current_original_pos = original_pos_counter
+            line_num_orig = _line_number(element._original_index, original_pos_counter)
             original_pos_counter += 1
+            linked_index = element._matched_idx
+            if linked_index == i + 1:
+                # The linked Addition normally follows right away
+                pending = (i, element, line_num_orig)
+                continue
+            if linked_index is not None and hasattr(diff, '__getitem__'):
+                # Modified rows that also moved are linked to an Addition
+                # further away, which is shown at its own place as well.
+                if (linked_index < len(diff) and isinstance(diff[linked_index], Addition)
+                        and diff[linked_index]._matched_idx == i):
+                    addition = diff[linked_index]
+                    yield modified_row(i, element, addition, line_num_orig, addition._new_index)
+                    continue
+                print(f"Warning: Invalid link found for Removal at index {i}. Linked index: {linked_index}")
+            yield removal_row(i, element, line_num_orig)
         elif isinstance(element, Addition):
-            current_modified_pos = modified_pos_counter
+            fields = _element_fields(element)
+            # Unchanged rows that moved are shown at both places
+            row_type = 'moved' if element._is_moved else 'addition'
+            yield i, row_type, None, _line_number(element._new_index, modified_pos_counter), fields, _NO_CHANGES
             modified_pos_counter += 1
         elif isinstance(element, Unchanged):
-            current_original_pos = original_pos_counter
-            current_modified_pos = modified_pos_counter
+            fields = _element_fields(element)
+            yield (i, 'unchanged', _line_number(element._original_index, original_pos_counter),
+                   _line_number(element._new_index, modified_pos_counter), fields, _NO_CHANGES)
             original_pos_counter += 1
             modified_pos_counter += 1
 
-        # Store position info in the dictionary
-        temp_pos_data[i] = {
-            'orig': current_original_pos,
-            'mod': current_modified_pos
-        }
-        
-        # Parse fields (remains the same)
-        try:
-            with StringIO(element.content) as f:
-                reader = csv.reader(f)
-                fields = next(reader)
-                element_fields[i] = fields
-        except (StopIteration, csv.Error):
-            element_fields[i] = element.content.split(',')
-
-    # Determine max field count
-    max_field_count = 0
-    for fields in element_fields.values():
-        max_field_count = max(max_field_count, len(fields))
-
-    # --- Pass 2: Build Display Elements, Pairing Modifications ---
-    for i, element in enumerate(diff):
-        if i in processed_indices:
-            continue
-
-        # Retrieve correctly calculated position data
-        line_num_orig = temp_pos_data[i].get('orig') # Use .get for safety
-        line_num_mod = temp_pos_data[i].get('mod')  # Use .get for safety
-
-        # --- Modification Handling (using _matched_idx) ---
-        # Check if it's a Removal AND has a valid _matched_idx
-        if isinstance(element, Removal) and hasattr(element, '_matched_idx') and element._matched_idx is not None:
-            # _matched_idx stores the index of the corresponding Addition in the *current* diff list
-            linked_addition_index = element._matched_idx 
-            
-            # --- Corrected Logic --- 
-            # Check if the linked index is valid and points to a corresponding Addition
-            if (linked_addition_index < len(diff) and 
-                isinstance(diff[linked_addition_index], Addition) and
-                hasattr(diff[linked_addition_index], '_matched_idx') and
-                diff[linked_addition_index]._matched_idx == i):
-                
-                # Valid modification pair found!
-                addition = diff[linked_addition_index]
-                processed_indices.add(linked_addition_index) # Mark addition index as processed
-                
-                # Retrieve addition's modified position from temp data using its original index
-                # NOTE: temp_pos_data uses the original index 'i' for the removal,
-                # and 'linked_addition_index' for the addition.
-                line_num_mod = temp_pos_data.get(linked_addition_index, {}).get('mod')
-                
-                # --- Create 'modified' display element --- 
-                removal_fields = element_fields.get(i, [])
-                addition_fields = element_fields.get(linked_addition_index, [])
-                merged_fields = []
-                max_local_len = max(len(removal_fields), len(addition_fields))
-                # Get diff indices from Removal (they should be the same for the linked Addition)
-                diff_indices = getattr(element, '_diff_indices', []) 
-
-                for field_idx in range(max_local_len):
-                    old_val = removal_fields[field_idx] if field_idx < len(removal_fields) else ''
-                    new_val = addition_fields[field_idx] if field_idx < len(addition_fields) else ''
-                    # Use diff_indices to mark change accurately
-                    changed = field_idx in diff_indices 
-                    merged_fields.append({
-                        'old': old_val, 'new': new_val, 'changed': changed,
-                        'value': new_val 
-                    })
-                
-                display_elements.append({
-                    'type': 'modified',
-                    'line_num_orig': line_num_orig, 
-                    'line_num_mod': line_num_mod,  
-                    'merged_fields': merged_fields,
-                    'original_index': i # Keep original index for sorting
-                })
-                processed_indices.add(i) # Mark removal index as processed
-                continue # Skip to next element in outer loop
-            # --- End Corrected Logic ---
-            else:
-                 # If the link is invalid for some reason, fall through to treat as standalone Removal
-                 print(f"Warning: Invalid link found for Removal at index {i}. Linked index: {linked_addition_index}")
-                 pass
-
-        # --- Handling Standalone or Unmatched Elements ---
-        # Additions are only added if they haven't been processed as part of a modification
-        if isinstance(element, Addition):
-            if i not in processed_indices:
-                display_elements.append({
-                    'type': 'addition',
-                    'line_num_orig': None, 
-                    'line_num_mod': line_num_mod,
-                    'fields': element_fields.get(i, []),
-                    'original_index': i 
-                })
-                processed_indices.add(i)
-        # Removals are only added if they haven't been processed as part of a modification
-        elif isinstance(element, Removal):
-            if i not in processed_indices:
-                display_elements.append({
-                    'type': 'removal',
-                    'line_num_orig': line_num_orig,
-                    'line_num_mod': None, 
-                    'fields': element_fields.get(i, []),
-                    'original_index': i
-                })
-                processed_indices.add(i)
-        elif isinstance(element, Unchanged):
-            # Unchanged are always added
-            display_elements.append({
-                'type': 'unchanged',
-                'line_num_orig': line_num_orig,
-                'line_num_mod': line_num_mod,
-                'fields': element_fields.get(i, []),
-                'original_index': i
-            })
-            processed_indices.add(i)
-
-    # --- Sort Display Elements by Original Position --- 
-    # Use original_index as the primary key for stable sorting based on input order
-    # Fallback to line_num_orig only if needed (though original_index should be sufficient)
-    display_elements.sort(key=lambda x: x.get('original_index')) 
-
-    # --- Calculate Counts for Info Section ---
-    added_rows = 0
-    removed_rows = 0
-    modified_cells = 0
-    for element in display_elements:
-        if element['type'] == 'addition':
-            added_rows += 1
-        elif element['type'] == 'removal':
-            removed_rows += 1
-        elif element['type'] == 'modified':
-            # Count changed fields within this modified row
-            for field in element.get('merged_fields', []):
-                if field.get('changed', False):
-                    modified_cells += 1
-    # --------------------------------------
-
-    # Extract source file name from arguments if available
-    source_file = "Original File"
-    try:
-        import sys
-        if len(sys.argv) > 1:
-            source_file = os.path.basename(sys.argv[1])
-    except:
-        pass
+    if pending is not None:
+        pending_index, removal, line_num_orig = pending
+        print(f"Warning: Invalid link found for Removal at index {pending_index}. Linked index: {pending_index + 1}")
+        yield removal_row(pending_index, removal, line_num_orig)
 
-    # --- Determine Header Row for HTML (Improved for header changes) --- 
+def _header_row_fields(first_elements):
+    """Returns the header fields and the number of columns for the first elements of a diff."""
+    first_fields = [_element_fields(element) for element in first_elements]
     header_row_fields = []
-    max_field_count = max(len(fields) for fields in element_fields.values()) if element_fields else 0
 
     # Check if the header itself was modified (Removal at index 0, Addition at index 1)
-    header_modified = False
-    if (len(diff) >= 2 and 
-        isinstance(diff[0], Removal) and 
-        isinstance(diff[1], Addition)):
-        # Basic check assumes first R/A pair is header change. Could be more robust.
-        header_modified = True
-
-    if header_modified:
+    if (len(first_elements) == 2 and
+        isinstance(first_elements[0], Removal) and
+        isinstance(first_elements[1], Addition)):
         # Use the fields from the new header (Addition at index 1)
-        header_row_fields = element_fields.get(1, [])
-    elif element_fields: # Header not modified, use original logic
-        first_row_fields = element_fields.get(0)
+        header_row_fields = first_fields[1]
+    elif first_fields:
+        first_row_fields = first_fields[0]
         # Try to use first row if it looks like a header, otherwise generate
         if first_row_fields and any(h.lower() in ['id', 'name', 'date', 'col'] for h in first_row_fields if isinstance(h, str)):
              header_row_fields = first_row_fields
-    
+
+    # Rows are padded to the width of the header. Later rows with more fields
+    # than that are written out in full.
+    max_field_count = max((len(fields) for fields in first_fields), default=0)
+
     # If no specific header fields determined, generate generic ones
     if not header_row_fields:
         header_row_fields = [f'Col_{i+1}' for i in range(max_field_count)]
-    
-    # Ensure max_field_count reflects the chosen header, or the max seen
     max_field_count = max(max_field_count, len(header_row_fields))
+    return header_row_fields, max_field_count
+
+def _table_row_html(row, show_line_numbers, max_field_count):
+    """Returns the <tr> element for a row produced by _iter_spreadsheet_rows."""
+    _, row_type, line_num_orig, line_num_mod, fields, changes = row
+    row_html = [f'<tr class="{row_type}">\n',
+                f'<td class="status-col {row_type}-text">{row_type.capitalize()}</td>\n']
+
+    # Line numbers if enabled
+    if show_line_numbers:
+        orig_class = "removal-text" if row_type in ['removal', 'modified'] else ""
+        mod_class = "addition-text" if row_type in ['addition', 'modified'] else ""
+        orig_num_display = '' if line_num_orig is None else line_num_orig
+        mod_num_display = '' if line_num_mod is None else line_num_mod
+        row_html.append(f'<td class="line-num line-num-left center-align {orig_class}">{orig_num_display}</td>\n')
+        row_html.append(f'<td class="line-num line-num-right center-align {mod_class}">{mod_num_display}</td>\n')
+
+    for field_idx, field in enumerate(fields):
+        if field_idx in changes:
+            row_html.append(_generate_modified_td(changes[field_idx], field) + '\n')
+        else:
+            row_html.append(_generate_td(field) + '\n')
+    # Add empty cells if needed
+    row_html.append('<td></td>\n' * (max_field_count - len(fields)))
+    row_html.append('</tr>\n')
+    return ''.join(row_html)
+
+def _body_rows(rows, totals):
+    """Yields the rows shown in the table body and counts them into totals.
+
+    totals is a list of the added rows, removed rows, modified cells and moved
+    rows, which is updated while the rows are consumed. The original header
+    row is skipped since it is shown in the sticky header instead.
+    """
+    for row in rows:
+        index, row_type, _, line_num_mod, _, changes = row
+        # --- Calculate Counts for Info Section ---
+        if row_type == 'addition':
+            totals[0] += 1
+        elif row_type == 'removal':
+            totals[1] += 1
+        elif row_type == 'modified':
+            totals[2] += len(changes)
+        elif row_type == 'moved':
+            # Every moved row is shown at its old and its new place
+            if line_num_mod is not None:
+                totals[3] += 1
+
+        if index != 0:
+            yield row
+
+def _mark_context(rows, context):
+    """Yields (visible, row) for the given rows, hiding unchanged rows far from changes.
+
+    Unchanged rows are only visible if they are at most context rows away
+    from a changed row. At most context rows are held back at any time.
+    """
+    # Unchanged rows that are visible if a change follows soon
+    leading = deque()
+    # Number of unchanged rows still visible after the last change
+    trailing = 0
+    for row in rows:
+        if row[1] != 'unchanged':
+            for leading_row in leading:
+                yield True, leading_row
+            leading.clear()
+            trailing = context
+            yield True, row
+        elif trailing > 0:
+            trailing -= 1
+            yield True, row
+        else:
+            leading.append(row)
+            if len(leading) > context:
+                yield False, leading.popleft()
+    for leading_row in leading:
+        yield False, leading_row
+
+def _collapsed_marker_html(region, hidden_rows, show_line_numbers, max_field_count, sidecar_src):
+    """Returns the row that stands in for a region of hidden unchanged rows."""
+    line_num_cells = '<td class="line-num"></td>\n<td class="line-num"></td>\n' if show_line_numbers else ''
+    expand_link = ''
+    if sidecar_src is not None:
+        expand_link = f' <a href="#" onclick="expandCollapsedRows({region}, \'{sidecar_src}\'); return false;">expand</a>'
+    return (f'<tr id="collapsed-{region}" class="collapsed">\n<td class="status-col">…</td>\n{line_num_cells}'
+            f'<td colspan="{max(max_field_count, 1)}">… {hidden_rows:,} unchanged rows …{expand_link}</td>\n</tr>\n')
+
+def _sidecar_dir(output_file):
+    """Returns the directory for the collapsed rows of the given HTML file."""
+    return os.path.splitext(output_file)[0] + "_rows"
+
+def _write_table_rows(f, rows, show_line_numbers, max_field_count, context=None, sidecar_dir=None):
+    """Writes the table rows to f and returns the totals for the info section.
+
+    With a context, unchanged rows further away from a change than that are
+    collapsed into a marker row. If a sidecar_dir is given, the collapsed rows
+    are written there, one script per region, so they can be expanded in the
+    browser. The totals are returned as (added rows, removed rows, modified
+    cells, moved rows).
+    """
+    totals = [0, 0, 0, 0]
+
+    if context is None:
+        for row in _body_rows(rows, totals):
+            f.write(_table_row_html(row, show_line_numbers, max_field_count))
+        return tuple(totals)
+
+    if sidecar_dir is not None:
+        os.makedirs(sidecar_dir, exist_ok=True)
+    region = 0
+    hidden_rows = 0
+    sidecar = None
+    sidecar_src = None
+
+    def close_region():
+        nonlocal hidden_rows, sidecar
+        if sidecar is not None:
+            sidecar.write('\n]);\n')
+            sidecar.close()
+            sidecar = None
+        f.write(_collapsed_marker_html(region, hidden_rows, show_line_numbers, max_field_count, sidecar_src))
+        hidden_rows = 0
+
+    for visible, row in _mark_context(_body_rows(rows, totals), context):
+        if visible:
+            if hidden_rows:
+                close_region()
+            f.write(_table_row_html(row, show_line_numbers, max_field_count))
+            continue
+        if not hidden_rows:
+            region += 1
+            if sidecar_dir is not None:
+                file_name = f"rows_{region:06d}.js"
+                sidecar_src = f"{os.path.basename(sidecar_dir)}/{file_name}"
+                sidecar = open(os.path.join(sidecar_dir, file_name), 'w', buffering=_HTML_WRITE_BUFFER_SIZE)
+                sidecar.write(f'loadCollapsedRows({region}, [\n')
+            else:
+                sidecar_src = None
+        elif sidecar is not None:
+            sidecar.write(',\n')
+        if sidecar is not None:
+            sidecar.write(json.dumps(_table_row_html(row, show_line_numbers, max_field_count)))
+        hidden_rows += 1
+    if hidden_rows:
+        close_region()
+    return tuple(totals)
+
+def _write_spreadsheet_head(f, header_cells_html, navigation_html=""):
+    """Writes the spreadsheet page up to and including the header row of its table."""
+    f.write(f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>CSV Diff Results</title>
+            <style>
+                body {{ 
+                    font-family: monospace; 
+                    background-color: #0d1117; 
+                    color: #c9d1d9; 
+                    margin: 0;
+                    padding: 0;
+                }}
+                .main-container {{
+                    padding: 20px; 
+                    /* REMOVED scrolling from main container */
+                    /* overflow-y: auto; */
+                    /* max-height: calc(100vh - 75px); */
+                }}
+                /* NEW: Wrapper for the table to handle scrolling */
+                .table-scroll-wrapper {{
+                    overflow-y: auto;
+                    max-height: calc(100vh - 75px); /* Adjust as needed */
+                    /* Apply scrollbar styles here */
+                    /* REMOVED Custom scrollbar styling */
+                    /* scrollbar-width: thin; */ 
+                    /* scrollbar-color: #484f58 #161b22; */ 
+                }}
+                /* REMOVED Webkit scrollbar styles */
+                /* .table-scroll-wrapper::-webkit-scrollbar ... */
+
+                table {{ 
+                    /* border-collapse: collapse; */ /* REMOVED */
+                    width: 100%; 
+                    background-color: #0d1117;
+                    margin-top: 0; 
+                    border-radius: 8px; /* Rounded corners for the table */
+                    overflow: hidden; /* Ensures content respects the radius */
+                    border-spacing: 0; /* Remove space between cells if collapse is off */
+                    /* Optional: Add a subtle outer border if needed */
+                    /* border: 1px solid #30363d; */ 
+                }}
+                th, td {{ 
+                    /* Remove individual cell borders */
+                    /* border: 1px solid #30363d; */ 
+                    /* Add only bottom border for row separation */
+                    border-bottom: 1px solid #30363d; 
+                    padding: 8px; 
+                    text-align: left; 
+                }}
+                /* Remove bottom border from last row */
+                tbody tr:last-child td {{
+                     border-bottom: none;
+                }}
+                th {{ /* General styles for ALL header cells (sticky or not) */
+                    background-color: #161b22; 
+                    color: #c9d1d9;
+                    /* REMOVED sticky positioning from general th */
+                    /* position: sticky; */
+                    /* top: 55px; */ 
+                    /* z-index: 10; */
+                    border-color: #30363d;
+                    /* Ensure bottom border for all header cells */
+                    border-bottom: 1px solid #30363d; 
+                }}
 
-    # Generate HTML for header cells
-    header_cells_html = "\n".join([f'<th>{str(header)}</th>' for header in header_row_fields]) # Ensure header is string
-    # -------------------------------------
+                /* == Row Background Highlighting == */
+                tr.addition td:not(:nth-child(-n+3)) {{ background-color: rgba(46, 160, 67, 0.15); }}
+                tr.removal td:not(:nth-child(-n+3)) {{ background-color: rgba(248, 81, 73, 0.15); }}
+                tr.moved td:not(:nth-child(-n+3)) {{ background-color: rgba(163, 113, 247, 0.15); }}
+                
+                /* Keep status/index columns default background */
+                tr td.status-col, tr td.line-num {{
+                    background-color: #161b22 !important;
+                }}
+                /* No special background for modified/unchanged rows */
+                tr.modified td {{
+                    background-color: transparent;
+                }}
+                /* == End Row Background Highlighting == */
+
+                /* == Text Colors == */
+                .addition-text {{ color: #3fb950; }}
+                .removal-text {{ color: #f85149; }}
+                .modified-text {{ color: #d29922; }}
+                .moved-text {{ color: #a371f7; }}
+                .unchanged {{ color: #c9d1d9; }}
+                /* == End Text Colors == */
+
+                .center-align {{
+                    text-align: center;
+                }}
+                
+                /* Status column styling */
+                .status-col {{
+                    background-color: #161b22;
+                    min-width: 80px;
+                    text-align: center;
+                    font-weight: bold;
+                    user-select: none;
+                    /* border-right: none; */ /* Removed */
+                    border-color: #30363d; /* Keep for bottom border */
+                }}
+                
+                /* Index column styling */
+                .line-num {{ 
+                    color: #8b949e; 
+                    min-width: 30px; 
+                    max-width: 40px;
+                    user-select: none;
+                    background-color: #161b22;
+                    padding-left: 4px;
+                    padding-right: 4px;
+                    border-color: #30363d; /* Keep for bottom border */
+                }}
+                /* Remove right border from first index column */
+                .line-num-left {{
+                    /* border-right: none; */ /* Removed */
+                    text-align: right;
+                    padding-right: 6px;
+                    /* border-left: none; */ /* Removed */
+                    border-color: #30363d; /* Keep for bottom border */
+                }}
+                /* Remove left border from second index column */
+                .line-num-right {{
+                    /* border-left: none; */ /* Removed */
+                    text-align: left;
+                    padding-left: 6px;
+                    border-color: #30363d; /* Keep for bottom border */
+                }}
+                
+                /* Index header with centered text in table header */
+                .index-header {{
+                    text-align: center !important;
+                    padding: 8px 0;
+                    /* border-left: none; */ /* Removed */
+                    border-color: #30363d; /* Keep for bottom border */
+                }}
+                
+                .arrow {{ color: #8b949e; padding: 0 5px; }}
+                
+                .row-id {{ font-weight: bold; }}
+                
+                .file-header {{ 
+                    font-weight: bold; 
+                    background-color: #161b22;
+                    color: #c9d1d9;
+                    border-color: #30363d;
+                }}
 
-    # --- HTML Generation --- 
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>CSV Diff Results</title>
-        <style>
-            body {{ 
-                font-family: monospace; 
-                background-color: #0d1117; 
-                color: #c9d1d9; 
-                margin: 0;
-                padding: 0;
-            }}
-            .main-container {{
-                padding: 20px; 
-                /* REMOVED scrolling from main container */
-                /* overflow-y: auto; */
-                /* max-height: calc(100vh - 75px); */
-            }}
-            /* NEW: Wrapper for the table to handle scrolling */
-            .table-scroll-wrapper {{
-                overflow-y: auto;
-                max-height: calc(100vh - 75px); /* Adjust as needed */
-                /* Apply scrollbar styles here */
-                /* REMOVED Custom scrollbar styling */
-                /* scrollbar-width: thin; */ 
-                /* scrollbar-color: #484f58 #161b22; */ 
-            }}
-            /* REMOVED Webkit scrollbar styles */
-            /* .table-scroll-wrapper::-webkit-scrollbar ... */
-
-            table {{ 
-                /* border-collapse: collapse; */ /* REMOVED */
-                width: 100%; 
-                background-color: #0d1117;
-                margin-top: 0; 
-                border-radius: 8px; /* Rounded corners for the table */
-                overflow: hidden; /* Ensures content respects the radius */
-                border-spacing: 0; /* Remove space between cells if collapse is off */
-                /* Optional: Add a subtle outer border if needed */
-                /* border: 1px solid #30363d; */ 
-            }}
-            th, td {{ 
-                /* Remove individual cell borders */
-                /* border: 1px solid #30363d; */ 
-                /* Add only bottom border for row separation */
-                border-bottom: 1px solid #30363d; 
-                padding: 8px; 
-                text-align: left; 
-            }}
-            /* Remove bottom border from last row */
-            tbody tr:last-child td {{
-                 border-bottom: none;
-            }}
-            th {{ /* General styles for ALL header cells (sticky or not) */
-                background-color: #161b22; 
-                color: #c9d1d9;
-                /* REMOVED sticky positioning from general th */
-                /* position: sticky; */
-                /* top: 55px; */ 
-                /* z-index: 10; */
-                border-color: #30363d;
-                /* Ensure bottom border for all header cells */
-                border-bottom: 1px solid #30363d; 
-            }}
-
-            /* == Row Background Highlighting == */
-            tr.addition td:not(:nth-child(-n+3)) {{ background-color: rgba(46, 160, 67, 0.15); }}
-            tr.removal td:not(:nth-child(-n+3)) {{ background-color: rgba(248, 81, 73, 0.15); }}
-            
-            /* Keep status/index columns default background */
-            tr td.status-col, tr td.line-num {{
-                background-color: #161b22 !important;
-            }}
-            /* No special background for modified/unchanged rows */
-            tr.modified td {{
-                background-color: transparent;
-            }}
-            /* == End Row Background Highlighting == */
-
-            /* == Text Colors == */
-            .addition-text {{ color: #3fb950; }}
-            .removal-text {{ color: #f85149; }}
-            .modified-text {{ color: #d29922; }}
-            .unchanged {{ color: #c9d1d9; }}
-            /* == End Text Colors == */
-
-            .center-align {{
-                text-align: center;
-            }}
-            
-            /* Status column styling */
-            .status-col {{
-                background-color: #161b22;
-                min-width: 80px;
-                text-align: center;
-                font-weight: bold;
-                user-select: none;
-                /* border-right: none; */ /* Removed */
-                border-color: #30363d; /* Keep for bottom border */
-            }}
-            
-            /* Index column styling */
-            .line-num {{ 
-                color: #8b949e; 
-                min-width: 30px; 
-                max-width: 40px;
-                user-select: none;
-                background-color: #161b22;
-                padding-left: 4px;
-                padding-right: 4px;
-                border-color: #30363d; /* Keep for bottom border */
-            }}
-            /* Remove right border from first index column */
-            .line-num-left {{
-                /* border-right: none; */ /* Removed */
-                text-align: right;
-                padding-right: 6px;
-                /* border-left: none; */ /* Removed */
-                border-color: #30363d; /* Keep for bottom border */
-            }}
-            /* Remove left border from second index column */
-            .line-num-right {{
-                /* border-left: none; */ /* Removed */
-                text-align: left;
-                padding-left: 6px;
-                border-color: #30363d; /* Keep for bottom border */
-            }}
-            
-            /* Index header with centered text in table header */
-            .index-header {{
-                text-align: center !important;
-                padding: 8px 0;
-                /* border-left: none; */ /* Removed */
-                border-color: #30363d; /* Keep for bottom border */
-            }}
-            
-            .arrow {{ color: #8b949e; padding: 0 5px; }}
-            
-            .row-id {{ font-weight: bold; }}
-            
-            .file-header {{ 
-                font-weight: bold; 
-                background-color: #161b22;
-                color: #c9d1d9;
-                border-color: #30363d;
-            }}
-
-            /* Empty cell styling */
-            .empty-cell {{
-                color: #6e7681;
-                font-style: italic;
-            }}
-            
-            /* Style for truly empty cells - visible when (empty) text is hidden */
-            /* .truly-empty { ... } removed as it was empty */
-            
-            /* Force all borders to be #30363d */
-            * {{ border-color: #30363d !important; }}
-
-            /* Toggle container - now using flex */
-            .toggle-container {{
-                position: sticky;
-                top: 0;
-                padding: 10px 20px; 
-                background-color: #0d1117; 
-                z-index: 100;
-                /* margin-bottom: 15px; Removed, table margin handles spacing */
-                border-bottom: 1px solid #30363d;
-                width: 100%; 
-                box-sizing: border-box; 
-                display: flex; /* Use flexbox */
-                align-items: center; /* Vertically align items */
-                justify-content: space-between; /* Space out button and info */
-                min-height: 55px; /* Ensure minimum height for sticky header positioning */
-            }}
-
-            /* Info Section Styling */
-            .info-section {{
-                color: #8b949e; /* Grey text */
-                font-size: 14px;
-            }}
-            .info-section span {{
-                margin-left: 15px; /* Space between info items */
-            }}
-            .info-added {{ color: #3fb950; font-weight: bold; }}
-            .info-removed {{ color: #f85149; font-weight: bold; }}
-            .info-modified {{ color: #d29922; font-weight: bold; }}
-
-            /* Updated Toggle button styling */
-            .toggle-button {{
-                background-color: #30363d; /* Grey background */
-                color: #c9d1d9; /* Light grey text */
-                border: 1px solid #8b949e; /* Slightly lighter border */
-                padding: 8px 16px;
-                border-radius: 6px;
-                cursor: pointer;
-                font-size: 14px;
-                font-family: monospace;
-            }}
-            .toggle-button:hover {{
-                background-color: #484f58; /* Slightly lighter grey on hover */
-                border-color: #c9d1d9;
-            }}
-
-            /* == Sticky Table Header Row Styles == */
-            /* Target the first row within the tbody */
-            tbody tr:first-child th {{
-                /* RESTORED sticky positioning for table header */
-                position: -webkit-sticky; /* For Safari */
-                position: sticky;
-                top: 0; /* Stick to the top of the scrolling container (.table-scroll-wrapper) */
-                background-color: #000000 !important; /* Keep Black background */
-                color: #e0e0e0 !important; /* Lighter text for contrast */
-                /* z-index: 10; */ /* REMOVED */
-                /* Ensure the th still gets its bottom border */
-                 border-bottom: 1px solid #30363d; 
-            }}
-            /* Keep status column consistent in sticky header */
-            tbody tr:first-child th.status-col {{
-                 background-color: #000000 !important;
-                 /* Inherit color or set explicitly if needed */
-            }}
-            /* Keep index columns consistent in sticky header */
-             tbody tr:first-child th.line-num {{
-                 background-color: #000000 !important;
-                 color: #8b949e !important; /* Override status colors for indices */
-             }}
-             /* Ensure index text color override in sticky header */
-             tbody tr:first-child th.line-num.addition-text,
-             tbody tr:first-child th.line-num.removal-text,
-             tbody tr:first-child th.line-num.modified-text {{
-                 color: #8b949e !important; /* Override status colors for indices */
-             }}
-            /* == End Sticky Table Header Row Styles == */
-
-        </style>
-        <script>
-            function toggleEmptyCells() {{
-                const emptyCells = document.querySelectorAll('.empty-cell');
-                const button = document.getElementById('toggle-button');
-                for (const cell of emptyCells) {{
-                    if (cell.style.display === 'none') {{
-                        cell.style.display = 'inline';
-                        button.textContent = 'Hide (empty) Labels';
-                    }} else {{
-                        cell.style.display = 'none';
-                        button.textContent = 'Show (empty) Labels';
+                /* Empty cell styling */
+                .empty-cell {{
+                    color: #6e7681;
+                    font-style: italic;
+                }}
+                
+                /* Style for truly empty cells - visible when (empty) text is hidden */
+                /* .truly-empty { ... } removed as it was empty */
+                
+                /* Force all borders to be #30363d */
+                * {{ border-color: #30363d !important; }}
+
+                /* Toggle container - now using flex */
+                .toggle-container {{
+                    position: sticky;
+                    top: 0;
+                    padding: 10px 20px; 
+                    background-color: #0d1117; 
+                    z-index: 100;
+                    /* margin-bottom: 15px; Removed, table margin handles spacing */
+                    border-bottom: 1px solid #30363d;
+                    width: 100%; 
+                    box-sizing: border-box; 
+                    display: flex; /* Use flexbox */
+                    align-items: center; /* Vertically align items */
+                    justify-content: space-between; /* Space out button and info */
+                    min-height: 55px; /* Ensure minimum height for sticky header positioning */
+                }}
+
+                /* Info Section Styling */
+                .info-section {{
+                    color: #8b949e; /* Grey text */
+                    font-size: 14px;
+                }}
+                .info-section span {{
+                    margin-left: 15px; /* Space between info items */
+                }}
+                .info-added {{ color: #3fb950; font-weight: bold; }}
+                .info-removed {{ color: #f85149; font-weight: bold; }}
+                .info-modified {{ color: #d29922; font-weight: bold; }}
+                .info-moved {{ color: #a371f7; font-weight: bold; }}
+
+                /* Updated Toggle button styling */
+                .toggle-button {{
+                    background-color: #30363d; /* Grey background */
+                    color: #c9d1d9; /* Light grey text */
+                    border: 1px solid #8b949e; /* Slightly lighter border */
+                    padding: 8px 16px;
+                    border-radius: 6px;
+                    cursor: pointer;
+                    font-size: 14px;
+                    font-family: monospace;
+                }}
+                .toggle-button:hover {{
+                    background-color: #484f58; /* Slightly lighter grey on hover */
+                    border-color: #c9d1d9;
+                }}
+
+                /* == Sticky Table Header Row Styles == */
+                /* Target the first row within the tbody */
+                tbody tr:first-child th {{
+                    /* RESTORED sticky positioning for table header */
+                    position: -webkit-sticky; /* For Safari */
+                    position: sticky;
+                    top: 0; /* Stick to the top of the scrolling container (.table-scroll-wrapper) */
+                    background-color: #000000 !important; /* Keep Black background */
+                    color: #e0e0e0 !important; /* Lighter text for contrast */
+                    /* z-index: 10; */ /* REMOVED */
+                    /* Ensure the th still gets its bottom border */
+                     border-bottom: 1px solid #30363d; 
+                }}
+                /* Keep status column consistent in sticky header */
+                tbody tr:first-child th.status-col {{
+                     background-color: #000000 !important;
+                     /* Inherit color or set explicitly if needed */
+                }}
+                /* Keep index columns consistent in sticky header */
+                 tbody tr:first-child th.line-num {{
+                     background-color: #000000 !important;
+                     color: #8b949e !important; /* Override status colors for indices */
+                 }}
+                 /* Ensure index text color override in sticky header */
+                 tbody tr:first-child th.line-num.addition-text,
+                 tbody tr:first-child th.line-num.removal-text,
+                 tbody tr:first-child th.line-num.modified-text {{
+                     color: #8b949e !important; /* Override status colors for indices */
+                 }}
+                /* == End Sticky Table Header Row Styles == */
+
+            </style>
+            <script>
+                function toggleEmptyCells() {{
+                    const emptyCells = document.querySelectorAll('.empty-cell');
+                    const button = document.getElementById('toggle-button');
+                    for (const cell of emptyCells) {{
+                        if (cell.style.display === 'none') {{
+                            cell.style.display = 'inline';
+                            button.textContent = 'Hide (empty) Labels';
+                        }} else {{
+                            cell.style.display = 'none';
+                            button.textContent = 'Show (empty) Labels';
+                        }}
                     }}
                 }}
-            }}
-            window.addEventListener('DOMContentLoaded', (event) => {{
-                document.getElementById('toggle-button').textContent = 'Hide (empty) Labels';
-            }});
-        </script>
-    </head>
-    <body>
-        <div class="toggle-container">
-            <button id="toggle-button" class="toggle-button" onclick="toggleEmptyCells()">Hide (empty) Labels</button>
-            <div class="info-section">
-                 <span>Added: <span class="info-added">{added_rows}</span></span>
-                 <span>Removed: <span class="info-removed">{removed_rows}</span></span>
-                 <span>Modified Cells: <span class="info-modified">{modified_cells}</span></span>
+                window.addEventListener('DOMContentLoaded', (event) => {{
+                    document.getElementById('toggle-button').textContent = 'Hide (empty) Labels';
+                }});
+            </script>
+        </head>
+        <body>
+            <div class="toggle-container">
+                <button id="toggle-button" class="toggle-button" onclick="toggleEmptyCells()">Hide (empty) Labels</button>
+                <div class="info-section">
+                     <span>Added: <span id="info-added" class="info-added">-</span></span>
+                     <span>Removed: <span id="info-removed" class="info-removed">-</span></span>
+                     <span>Modified Cells: <span id="info-modified" class="info-modified">-</span></span>
+                     <span>Moved: <span id="info-moved" class="info-moved">-</span></span>
+                </div>
+                {navigation_html}
             </div>
-        </div>
-        <div class="main-container"> 
-            <div class="table-scroll-wrapper">
-                <table>
-                    <!-- Ensure the header row is generated within tbody -->
-                    <tbody>
-                        <tr>
-                            <!-- Header Cells (using th for semantics) -->
-                            <th class="status-col">Status</th>
-                            <th class="line-num line-num-left index-header" colspan="2">Line</th> 
-                            <!-- Generate header cells for data columns --> 
-                            {header_cells_html}
-                        </tr>
-    """
-
-    # --- HTML Table Body Generation ---
-    for element in display_elements:
-        # --- Skip rendering the original header row in the data body ---
-        if element.get('original_index') == 0: 
-            # Check if the first element is the header, assuming header is always at original index 0
-            # This prevents duplicating the header row shown in the sticky thead
-            continue 
-        # --------------------------------------------------------------
-
-        element_type = element['type']
-        row_class = element_type # Use type directly as class (e.g., 'modified', 'addition')
-        html_content += f'<tr class="{row_class}">\n'
-        
-        # Status column
-        status_text = element_type.capitalize()
-        status_class = f"{element_type}-text" # e.g., modified-text
-        html_content += f'<td class="status-col {status_class}">{status_text}</td>\n'
-        
-        # Line numbers if enabled
-        if show_line_numbers:
-            orig_num_display = element.get('line_num_orig', '')
-            mod_num_display = element.get('line_num_mod', '')
-            
-            orig_class = "removal-text" if element_type in ['removal', 'modified'] else ""
-            mod_class = "addition-text" if element_type in ['addition', 'modified'] else ""
-            
-            html_content += f'<td class="line-num line-num-left center-align {orig_class}">{orig_num_display}</td>\n'
-            html_content += f'<td class="line-num line-num-right center-align {mod_class}">{mod_num_display}</td>\n'
-        
-        # Field content - Using helper functions
-        if element_type == 'modified':
-            for field in element['merged_fields']:
-                if field['changed']:
-                    html_content += _generate_modified_td(field["old"], field["new"]) + '\n'
-                else:
-                    html_content += _generate_td(field.get("value", "")) + '\n'
-            # Add empty cells if needed
-            for _ in range(max_field_count - len(element['merged_fields'])):
-                html_content += '<td></td>\n'
-        else:
-            fields_to_display = element.get('fields', [])
-            for field in fields_to_display:
-                html_content += _generate_td(field) + '\n'
-            # Add empty cells if needed
-            for _ in range(max_field_count - len(fields_to_display)):
-                html_content += '<td></td>\n'
-        
-        html_content += '</tr>\n'
-    
-    # --- HTML Closing --- 
-    html_content += """
+            <div class="main-container"> 
+                <div class="table-scroll-wrapper">
+                    <table>
+                        <!-- Ensure the header row is generated within tbody -->
+                        <tbody>
+                            <tr>
+                                <!-- Header Cells (using th for semantics) -->
+                                <th class="status-col">Status</th>
+                                <th class="line-num line-num-left index-header" colspan="2">Line</th> 
+                                <!-- Generate header cells for data columns --> 
+                                {header_cells_html}
+                            </tr>
+        """)
+
+def _write_spreadsheet_tail(f, totals, context=None):
+    """Writes the end of the spreadsheet page, filling in the given totals."""
+    added_rows, removed_rows, modified_cells, moved_rows = totals
+    f.write(f"""
                     </tbody>
                 </table>
             </div> 
         </div> 
+        <script>
+            document.getElementById('info-added').textContent = '{added_rows}';
+            document.getElementById('info-removed').textContent = '{removed_rows}';
+            document.getElementById('info-modified').textContent = '{modified_cells}';
+            document.getElementById('info-moved').textContent = '{moved_rows}';
+        </script>
+        {_COLLAPSED_ROWS_HTML if context is not None else ""}
     </body>
     </html>
+    """)
+
+def visualize_unified_spreadsheet_html(diff, show_line_numbers, output_file="diff_output_unified_spreadsheet.html",
+                                       context=None, expandable=False):
+    """Generates an HTML visualization of the diffing result in a unified spreadsheet-like format.
+
+    The diff can be a list or any iterable of elements, e.g. the stream of
+    external_diff.diff_csv_external. Rows are written to the file while the
+    elements are consumed, so memory use doesn't grow with the size of the
+    diff. Since the totals are only known at the end, the info section is
+    filled in by a script at the bottom of the page.
+
+    If context is set, only changed rows and up to that many unchanged rows
+    around them are shown, longer runs of unchanged rows are collapsed into a
+    marker. With expandable, the collapsed rows are written to a sidecar
+    directory next to the output file and can be expanded in the browser.
     """
+    elements = iter(diff)
+
+    # --- Determine Header Row for HTML from the first elements ---
+    first_elements = list(islice(elements, 2))
+    header_row_fields, max_field_count = _header_row_fields(first_elements)
+
+    # Generate HTML for header cells
+    header_cells_html = "\n".join([f'<th>{str(header)}</th>' for header in header_row_fields]) # Ensure header is string
+    # -------------------------------------
+
+    with open(output_file, 'w', buffering=_HTML_WRITE_BUFFER_SIZE) as f:
+        # --- HTML Head, written before the first row is known ---
+        _write_spreadsheet_head(f, header_cells_html)
+
+        # --- HTML Table Body Generation ---
+        rows = _iter_spreadsheet_rows(chain(first_elements, elements), diff)
+        totals = _write_table_rows(f, rows, show_line_numbers, max_field_count, context,
+                                   _sidecar_dir(output_file) if expandable else None)
+
+        # --- HTML Closing, with the totals for the info section ---
+        _write_spreadsheet_tail(f, totals, context)
+
+    print(f"\nHTML diff output saved to {output_file}\n")
     
-    # Write to file
+    return output_file
+
+# Pages queued for rendering per worker. Bounds the rows held in memory.
+_PAGES_IN_FLIGHT_PER_JOB = 2
+
+def _page_file(output_file, page_number):
+    """Returns the file name of a page of the paginated view, e.g. diff_output_0001.html."""
+    base, extension = os.path.splitext(output_file)
+    return f"{base}_{page_number:04d}{extension or '.html'}"
+
+def _page_navigation_html(output_file, page_number, has_next):
+    """Returns the links to the previous and next page and to the index."""
+    links = []
+    if page_number > 1:
+        links.append(f'<a href="{os.path.basename(_page_file(output_file, page_number - 1))}">&lt; Previous</a>')
+    links.append(f'<a href="{os.path.basename(output_file)}">Index</a>')
+    if has_next:
+        links.append(f'<a href="{os.path.basename(_page_file(output_file, page_number + 1))}">Next &gt;</a>')
+    return ('<div class="info-section" style="margin-left: 20px;">'
+            f'Page {page_number} ' + ' '.join(f'<span>{link}</span>' for link in links) + '</div>')
+
+def _render_page(args):
+    """Writes one page of the paginated spreadsheet view and returns its totals.
+
+    Runs in a worker process, so it only gets picklable arguments.
+    """
+    (page_file, rows, header_cells_html, show_line_numbers, max_field_count,
+     context, expandable, navigation_html) = args
+    with open(page_file, 'w', buffering=_HTML_WRITE_BUFFER_SIZE) as f:
+        _write_spreadsheet_head(f, header_cells_html, navigation_html)
+        totals = _write_table_rows(f, rows, show_line_numbers, max_field_count, context,
+                                   _sidecar_dir(page_file) if expandable else None)
+        _write_spreadsheet_tail(f, totals, context)
+    return totals
+
+def _line_range(line_numbers):
+    """Formats the first and last of the given line numbers, ignoring missing ones."""
+    line_numbers = [line_num for line_num in line_numbers if line_num is not None]
+    if not line_numbers:
+        return ''
+    return f"{line_numbers[0]}-{line_numbers[-1]}"
+
+def _write_page_index(output_file, pages, totals):
+    """Writes the index of a paginated view with the totals of every page."""
+    page_rows = []
+    for page_number, (lines_orig, lines_mod, page_totals) in enumerate(pages, start=1):
+        page_name = os.path.basename(_page_file(output_file, page_number))
+        added_rows, removed_rows, modified_cells, moved_rows = page_totals
+        page_rows.append(f'<tr><td><a href="{page_name}">{page_name}</a></td><td>{lines_orig}</td><td>{lines_mod}</td>'
+                         f'<td class="info-added">{added_rows}</td><td class="info-removed">{removed_rows}</td>'
+                         f'<td class="info-modified">{modified_cells}</td><td class="info-moved">{moved_rows}</td></tr>\n')
+    added_rows, removed_rows, modified_cells, moved_rows = totals
+    page_rows_html = ''.join(page_rows)
+
     with open(output_file, 'w') as f:
-        f.write(html_content)
-    
+        f.write(f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>CSV Diff Results</title>
+    <style>
+        body {{
+            font-family: monospace;
+            background-color: #0d1117;
+            color: #c9d1d9;
+            padding: 20px;
+        }}
+        table {{
+            border-collapse: collapse;
+        }}
+        th, td {{
+            border: 1px solid #30363d;
+            padding: 4px 12px;
+            text-align: left;
+        }}
+        th {{
+            background-color: #000000;
+            color: #e0e0e0;
+        }}
+        a {{
+            color: #58a6ff;
+        }}
+        .info-added {{ color: #3fb950; }}
+        .info-removed {{ color: #f85149; }}
+        .info-modified {{ color: #d29922; }}
+        .info-moved {{ color: #a371f7; }}
+    </style>
+</head>
+<body>
+    <table>
+        <tr><th>Page</th><th>Original Lines</th><th>New Lines</th><th>Added</th><th>Removed</th><th>Modified Cells</th><th>Moved</th></tr>
+{page_rows_html}        <tr><th>Total</th><th></th><th></th><th class="info-added">{added_rows}</th><th class="info-removed">{removed_rows}</th><th class="info-modified">{modified_cells}</th><th class="info-moved">{moved_rows}</th></tr>
+    </table>
+</body>
+</html>
+""")
+
+def visualize_paginated_html(diff, show_line_numbers, output_file="diff_output.html", page_size=10000,
+                             jobs=1, context=None, expandable=False):
+    """Generates the spreadsheet view split into pages of at most page_size rows.
+
+    The pages are written to diff_output_0001.html, diff_output_0002.html, ...
+    next to output_file, which becomes an index with the totals of every page.
+    Rows are computed in this process, in order, while the pages are rendered
+    by jobs worker processes. Only a few pages per worker are held in memory
+    at any time. context and expandable work like for
+    visualize_unified_spreadsheet_html, on every page on its own.
+    """
+    elements = iter(diff)
+    first_elements = list(islice(elements, 2))
+    header_row_fields, max_field_count = _header_row_fields(first_elements)
+    header_cells_html = "\n".join([f'<th>{str(header)}</th>' for header in header_row_fields])
+
+    totals = [0, 0, 0, 0]
+    body = _body_rows(_iter_spreadsheet_rows(chain(first_elements, elements), diff), totals)
+
+    def page_tasks():
+        page_rows = list(islice(body, page_size))
+        page_number = 1
+        while page_rows:
+            # Look at the next page first, to know whether to link to it
+            next_rows = list(islice(body, page_size))
+            navigation_html = _page_navigation_html(output_file, page_number, bool(next_rows))
+            yield (_page_file(output_file, page_number), page_rows, header_cells_html, show_line_numbers,
+                   max_field_count, context, expandable, navigation_html)
+            page_rows = next_rows
+            page_number += 1
+
+    pages = []
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            in_flight = deque()
+            for task in page_tasks():
+                rows = task[1]
+                in_flight.append((_line_range(row[2] for row in rows), _line_range(row[3] for row in rows),
+                                  executor.submit(_render_page, task)))
+                if len(in_flight) >= jobs * _PAGES_IN_FLIGHT_PER_JOB:
+                    lines_orig, lines_mod, future = in_flight.popleft()
+                    pages.append((lines_orig, lines_mod, future.result()))
+            for lines_orig, lines_mod, future in in_flight:
+                pages.append((lines_orig, lines_mod, future.result()))
+    else:
+        for task in page_tasks():
+            rows = task[1]
+            pages.append((_line_range(row[2] for row in rows), _line_range(row[3] for row in rows),
+                          _render_page(task)))
+
+    _write_page_index(output_file, pages, totals)
+
+    print(f"\nHTML diff output saved to {output_file} ({len(pages)} pages)\n")
+
+    return output_file
+
+# Number of values per chunk when writing long number lists of the payload.
+_PAYLOAD_WRITE_CHUNK = 65536
+
+# Row types of the virtual view payload, one character per row.
+_VIRTUAL_ROW_TYPES = {'unchanged': 'U', 'addition': 'A', 'removal': 'R', 'modified': 'M', 'moved': 'V'}
+
+_VIRTUAL_VIEW_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <title>CSV Diff Results</title>
+    <style>
+        body {
+            font-family: monospace;
+            background-color: #0d1117;
+            color: #c9d1d9;
+            margin: 0;
+            padding: 0;
+            overflow: hidden;
+        }
+        .toggle-container {
+            height: 56px;
+            padding: 10px 20px;
+            box-sizing: border-box;
+            background-color: #0d1117;
+            border-bottom: 1px solid #30363d;
+            display: flex;
+            align-items: center;
+        }
+        .toggle-button {
+            background-color: #238636;
+            color: white;
+            border: none;
+            padding: 8px 16px;
+            border-radius: 6px;
+            cursor: pointer;
+            font-size: 14px;
+            font-family: monospace;
+        }
+        .toggle-button:hover {
+            background-color: #2ea043;
+        }
+        .info-section {
+            margin-left: 20px;
+        }
+        .info-section > span {
+            margin-right: 15px;
+        }
+        .info-added, .addition-text { color: #3fb950; }
+        .info-removed, .removal-text { color: #f85149; }
+        .info-modified, .modified-text { color: #d29922; }
+        .info-moved, .moved-text { color: #a371f7; }
+        .arrow { color: #8b949e; }
+        .empty-cell { color: #484f58; font-style: italic; }
+        #header-wrapper {
+            overflow: hidden;
+            background-color: #000000;
+            border-bottom: 1px solid #30363d;
+        }
+        #viewport {
+            position: absolute;
+            top: 80px;
+            bottom: 0;
+            left: 0;
+            right: 0;
+            overflow: auto;
+        }
+        #spacer {
+            position: relative;
+        }
+        table {
+            border-collapse: collapse;
+            table-layout: fixed;
+        }
+        #body-table {
+            position: absolute;
+            top: 0;
+            left: 0;
+        }
+        th, td {
+            height: 22px;
+            padding: 0 6px;
+            border: 1px solid #30363d;
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
+            box-sizing: border-box;
+            text-align: left;
+        }
+        th { color: #e0e0e0; height: 24px; }
+        .line-num { color: #8b949e; text-align: center; }
+        tr.addition { background-color: rgba(46, 160, 67, 0.15); }
+        tr.removal { background-color: rgba(248, 81, 73, 0.15); }
+        tr.modified { background-color: rgba(210, 153, 34, 0.15); }
+        tr.moved { background-color: rgba(163, 113, 247, 0.15); }
+    </style>
+</head>
+<body>
+    <div class="toggle-container">
+        <button id="toggle-button" class="toggle-button" onclick="toggleEmptyCells()">Hide (empty) Labels</button>
+        <div class="info-section">
+            <span>Added: <span id="info-added" class="info-added">-</span></span>
+            <span>Removed: <span id="info-removed" class="info-removed">-</span></span>
+            <span>Modified Cells: <span id="info-modified" class="info-modified">-</span></span>
+            <span>Moved: <span id="info-moved" class="info-moved">-</span></span>
+        </div>
+    </div>
+    <div id="header-wrapper"><table id="header-table"></table></div>
+    <div id="viewport">
+        <div id="spacer"><table id="body-table"><tbody id="body-rows"></tbody></table></div>
+    </div>
+    <script>
+        // Only the rows in view (plus a few around them) exist as DOM nodes.
+        const ROW_HEIGHT = 22;
+        const OVERSCAN = 20;
+        // Browsers cap the height of elements, longer diffs scroll proportionally.
+        const MAX_SCROLL_HEIGHT = 10000000;
+        const ROW_TYPES = {U: 'unchanged', A: 'addition', R: 'removal', M: 'modified', V: 'moved'};
+        const STATUS_WIDTH = 100;
+        const LINE_NUM_WIDTH = 70;
+        const FIELD_WIDTH = 160;
+
+        let data = null;
+        let changesByRow = null;
+        let columnCount = 0;
+        let showEmpty = true;
+        let renderPending = false;
+
+        function escapeHtml(text) {
+            return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+        }
+
+        function valueHtml(value) {
+            if (value === '') {
+                return showEmpty ? '<span class="empty-cell">(empty)</span>' : '';
+            }
+            return escapeHtml(value);
+        }
+
+        function colgroupHtml() {
+            const widths = [STATUS_WIDTH];
+            if (data.lineNumbers) {
+                widths.push(LINE_NUM_WIDTH, LINE_NUM_WIDTH);
+            }
+            for (let column = 0; column < columnCount; column++) {
+                widths.push(FIELD_WIDTH);
+            }
+            const tableWidth = widths.reduce((a, b) => a + b, 0);
+            document.getElementById('header-table').style.width = tableWidth + 'px';
+            document.getElementById('body-table').style.width = tableWidth + 'px';
+            document.getElementById('spacer').style.width = tableWidth + 'px';
+            return '<colgroup>' + widths.map(width => '<col style="width: ' + width + 'px">').join('') + '</colgroup>';
+        }
+
+        function rowHtml(row) {
+            const rowType = ROW_TYPES[data.types[row]];
+            const parts = ['<tr class="', rowType, '"><td class="', rowType, '-text">',
+                           rowType.charAt(0).toUpperCase() + rowType.slice(1), '</td>'];
+            if (data.lineNumbers) {
+                parts.push('<td class="line-num">', data.lineOrig[row] || '', '</td>',
+                           '<td class="line-num">', data.lineMod[row] || '', '</td>');
+            }
+            const changes = changesByRow.get(row);
+            for (let column = 0; column < columnCount; column++) {
+                const id = column < data.columns.length ? data.columns[column][row] : -1;
+                if (id < 0) {
+                    parts.push('<td></td>');
+                } else if (changes !== undefined && changes.has(column)) {
+                    parts.push('<td><span class="removal-text">', valueHtml(data.strings[changes.get(column)]),
+                               '</span> <span class="arrow">-&gt;</span> <span class="addition-text">',
+                               valueHtml(data.strings[id]), '</span></td>');
+                } else {
+                    parts.push('<td>', valueHtml(data.strings[id]), '</td>');
+                }
+            }
+            parts.push('</tr>');
+            return parts.join('');
+        }
+
+        function render() {
+            renderPending = false;
+            const viewport = document.getElementById('viewport');
+            const rowCount = data.types.length;
+            const visibleRows = Math.ceil(viewport.clientHeight / ROW_HEIGHT);
+            const maxScroll = Math.max(1, document.getElementById('spacer').offsetHeight - viewport.clientHeight);
+            // Fractional index of the row at the top of the viewport
+            let position = viewport.scrollTop / ROW_HEIGHT;
+            if (rowCount * ROW_HEIGHT > MAX_SCROLL_HEIGHT) {
+                position = viewport.scrollTop / maxScroll * Math.max(0, rowCount - visibleRows);
+            }
+            const first = Math.max(0, Math.floor(position) - OVERSCAN);
+            const last = Math.min(rowCount, Math.ceil(position) + visibleRows + OVERSCAN);
+            const parts = [];
+            for (let row = first; row < last; row++) {
+                parts.push(rowHtml(row));
+            }
+            document.getElementById('body-rows').innerHTML = parts.join('');
+            const top = viewport.scrollTop - (position - first) * ROW_HEIGHT;
+            document.getElementById('body-table').style.transform = 'translateY(' + top + 'px)';
+        }
+
+        function scheduleRender() {
+            if (!renderPending) {
+                renderPending = true;
+                requestAnimationFrame(render);
+            }
+        }
+
+        function toggleEmptyCells() {
+            showEmpty = !showEmpty;
+            document.getElementById('toggle-button').textContent = showEmpty ? 'Hide (empty) Labels' : 'Show (empty) Labels';
+            render();
+        }
+
+        function loadDiffData(payload) {
+            data = payload;
+            columnCount = Math.max(data.header.length, data.columns.length);
+            changesByRow = new Map();
+            for (let k = 0; k < data.oldRows.length; k++) {
+                const row = data.oldRows[k];
+                if (!changesByRow.has(row)) {
+                    changesByRow.set(row, new Map());
+                }
+                changesByRow.get(row).set(data.oldColumns[k], data.oldValues[k]);
+            }
+
+            document.getElementById('info-added').textContent = data.counts[0];
+            document.getElementById('info-removed').textContent = data.counts[1];
+            document.getElementById('info-modified').textContent = data.counts[2];
+            document.getElementById('info-moved').textContent = data.counts[3];
+
+            const header = ['<th>Status</th>'];
+            if (data.lineNumbers) {
+                header.push('<th colspan="2">Line</th>');
+            }
+            for (let column = 0; column < columnCount; column++) {
+                header.push('<th>', escapeHtml(column < data.header.length ? data.header[column] : ''), '</th>');
+            }
+            const colgroup = colgroupHtml();
+            document.getElementById('header-table').innerHTML = colgroup + '<tr>' + header.join('') + '</tr>';
+            document.getElementById('body-table').insertAdjacentHTML('afterbegin', colgroup);
+            document.getElementById('spacer').style.height =
+                Math.min(data.types.length * ROW_HEIGHT, MAX_SCROLL_HEIGHT) + 'px';
+
+            const viewport = document.getElementById('viewport');
+            viewport.addEventListener('scroll', () => {
+                document.getElementById('header-wrapper').scrollLeft = viewport.scrollLeft;
+                scheduleRender();
+            });
+            window.addEventListener('resize', scheduleRender);
+            render();
+        }
+    </script>
+"""
+
+_VIRTUAL_VIEW_TAIL = """
+</body>
+</html>
+"""
+
+def _json_for_script(value):
+    """Returns value as JSON that can be placed inside a <script> element."""
+    return json.dumps(value).replace('</', '<\\/')
+
+def _write_int_list(f, values):
+    """Writes the given integers as a JSON list, in chunks."""
+    f.write('[')
+    for start in range(0, len(values), _PAYLOAD_WRITE_CHUNK):
+        if start:
+            f.write(',')
+        f.write(','.join(map(str, values[start:start + _PAYLOAD_WRITE_CHUNK])))
+    f.write(']')
+
+def _write_virtual_payload(f, diff, show_line_numbers):
+    """Writes the columnar payload of the virtual view as a JSON object.
+
+    Every distinct value is stored once in a string table, every column is a
+    list of indices into that table (-1 past the end of a row), so repeated
+    values cost a few bytes each. The old values of modified cells are kept
+    apart as (row, column, value) lists.
+    """
+    elements = iter(diff)
+    first_elements = list(islice(elements, 2))
+    header_row_fields, _ = _header_row_fields(first_elements)
+    rows = _iter_spreadsheet_rows(chain(first_elements, elements), diff)
+
+    strings = {}
+    types = []
+    line_orig = array('i')
+    line_mod = array('i')
+    columns = []
+    old_rows = array('i')
+    old_columns = array('i')
+    old_values = array('i')
+    totals = [0, 0, 0, 0]
+
+    for row, (_, row_type, line_num_orig, line_num_mod, fields, changes) in enumerate(_body_rows(rows, totals)):
+        types.append(_VIRTUAL_ROW_TYPES[row_type])
+        line_orig.append(line_num_orig or 0)
+        line_mod.append(line_num_mod or 0)
+        while len(columns) < len(fields):
+            columns.append(array('i', [-1]) * row)
+        for column, values in enumerate(columns):
+            values.append(strings.setdefault(fields[column], len(strings)) if column < len(fields) else -1)
+        for column, old_value in changes.items():
+            old_rows.append(row)
+            old_columns.append(column)
+            old_values.append(strings.setdefault(old_value, len(strings)))
+
+    f.write('{"header": ' + _json_for_script(header_row_fields))
+    f.write(', "lineNumbers": ' + json.dumps(bool(show_line_numbers)))
+    f.write(', "counts": ' + json.dumps(totals))
+    f.write(', "types": "' + ''.join(types) + '"')
+    f.write(', "strings": ' + _json_for_script(list(strings)))
+    for name, values in (('lineOrig', line_orig), ('lineMod', line_mod), ('oldRows', old_rows),
+                         ('oldColumns', old_columns), ('oldValues', old_values)):
+        f.write(f', "{name}": ')
+        _write_int_list(f, values)
+    f.write(', "columns": [')
+    for column, values in enumerate(columns):
+        if column:
+            f.write(',')
+        _write_int_list(f, values)
+    f.write(']}')
+
+def visualize_virtual_html(diff, show_line_numbers, output_file="diff_output.html", sidecar=False):
+    """Generates a spreadsheet-like HTML view that stays responsive for huge diffs.
+
+    Instead of a DOM node for every cell, the diff is stored as a compact
+    columnar payload and a small script renders only the rows in view while
+    scrolling. Opening the page and toggling the (empty) labels take the same
+    time for any diff size. The payload is embedded into the page, or with
+    sidecar written to <output>_data.js next to it.
+    """
+    with open(output_file, 'w', buffering=_HTML_WRITE_BUFFER_SIZE) as f:
+        f.write(_VIRTUAL_VIEW_HEAD)
+        if sidecar:
+            data_file = os.path.splitext(output_file)[0] + "_data.js"
+            with open(data_file, 'w', buffering=_HTML_WRITE_BUFFER_SIZE) as data:
+                data.write('loadDiffData(')
+                _write_virtual_payload(data, diff, show_line_numbers)
+                data.write(');\n')
+            f.write(f'    <script src="{os.path.basename(data_file)}"></script>\n')
+        else:
+            f.write('    <script id="diff-data" type="application/json">')
+            _write_virtual_payload(f, diff, show_line_numbers)
+            f.write('</script>\n')
+            f.write("    <script>loadDiffData(JSON.parse(document.getElementById('diff-data').textContent));</script>\n")
+        f.write(_VIRTUAL_VIEW_TAIL)
+
     print(f"\nHTML diff output saved to {output_file}\n")
-    
+
+    return output_file
+
+def visualize_identical_html(line_count, output_file="diff_output.html"):
+    """Generates a small HTML report stating that the files are identical.
+
+    Used instead of rendering an all-unchanged diff, so that identical files
+    take no time to report, and a report of an earlier run isn't left in
+    place.
+    """
+    with open(output_file, 'w') as f:
+        f.write(f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>CSV Diff Results</title>
+    <style>
+        body {{
+            font-family: monospace;
+            background-color: #0d1117;
+            color: #c9d1d9;
+            padding: 20px;
+        }}
+    </style>
+</head>
+<body>
+    <p>The files are identical ({line_count} lines).</p>
+</body>
+</html>
+""")
+
+    print(f"\nHTML diff output saved to {output_file}\n")
+
     return output_file